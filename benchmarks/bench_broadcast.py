@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+ブロードキャスト経路のマイクロベンチマーク
+
+受信者ごとに json.dumps していた従来の経路と、
+一度だけエンコードしたフレームを共有する経路を比較する。
+
+    uv run python benchmarks/bench_broadcast.py
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.room import GameRoom  # noqa: E402
+from server.server import WerewolfServer  # noqa: E402
+
+CONTENT = "占い結果を発表します。昨夜はプレイヤー3を占いました。結果は人狼です！"
+
+
+class FakeWebSocket:
+    """送信内容を捨てるだけのダミー接続"""
+
+    def __init__(self):
+        self.frames = 0
+
+    async def send(self, data, text=None):
+        self.frames += 1
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def chat_message(i: int) -> dict:
+    return {
+        "type": "chat",
+        "channel": "public",
+        "player": "Player1",
+        "role": "villager",
+        "content": f"{CONTENT} ({i})",
+    }
+
+
+async def legacy_path(players, godviews, messages: int) -> float:
+    """受信者ごとにエンコードして順番に await する従来の経路"""
+    start = time.perf_counter()
+    for i in range(messages):
+        message = chat_message(i)
+        for ws in players:
+            await ws.send(json.dumps(message))
+        for ws in godviews:
+            await ws.send(
+                json.dumps(
+                    {"type": "channel_message", "channel": "public", "message": message}
+                )
+            )
+    return time.perf_counter() - start
+
+
+async def encode_once_path(
+    recipients: int, godview_count: int, messages: int, verbose: bool = False
+) -> float:
+    """WerewolfServer のエンコード一回の経路"""
+    server = WerewolfServer(queue_size=messages + 1)
+    room = server.get_room()
+    # 登録のたびのログを出さない
+    room.verbose = verbose
+    sockets = []
+    for i in range(recipients):
+        ws = FakeWebSocket()
+        sockets.append(ws)
+        connection = server.create_connection(ws, label=f"p{i}")
+        await room.register_player(f"p{i}", f"Player{i}", connection=connection)
+    for _ in range(godview_count):
+        ws = FakeWebSocket()
+        sockets.append(ws)
+        room.add_godview(server.create_connection(ws, label="godview"))
+
+    # 登録時のメッセージを送り切ってから計測
+    await drain(room)
+    baseline = sum(ws.frames for ws in sockets)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        await room.broadcast_to_channel("public", chat_message(i))
+    await drain(room)
+    elapsed = time.perf_counter() - start
+
+    expected = messages * (recipients + godview_count)
+    delivered = sum(ws.frames for ws in sockets) - baseline
+    assert delivered == expected, f"delivered {delivered} != {expected}"
+
+    await close_all(room)
+    return elapsed
+
+
+def room_connections(room: GameRoom):
+    connections = [p.connection for p in room.players.values() if p.connection]
+    return connections + list(room.spectators.connections)
+
+
+async def drain(room: GameRoom):
+    """部屋の全ての送信キューが空になるまで待つ"""
+    connections = room_connections(room)
+    while any(c.queue or c._busy for c in connections):
+        await asyncio.sleep(0)
+
+
+async def close_all(room: GameRoom):
+    for connection in room_connections(room):
+        await connection.close()
+
+
+async def run(sizes, messages: int, verbose: bool = False):
+    print(f"{'recipients':>10} {'legacy ms':>10} {'once ms':>10} {'speedup':>8}")
+    for size in sizes:
+        godview_count = max(1, size // 10)
+        players = [FakeWebSocket() for _ in range(size)]
+        godviews = [FakeWebSocket() for _ in range(godview_count)]
+        legacy = await legacy_path(players, godviews, messages)
+        once = await encode_once_path(size, godview_count, messages, verbose)
+        print(
+            f"{size:>10} {legacy * 1000:>10.1f} {once * 1000:>10.1f} "
+            f"{legacy / once:>7.2f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--verbose", action="store_true", help="登録のログを表示")
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.messages, args.verbose))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+コーデックごとのエンコード・デコード時間とフレームサイズのベンチマーク
+
+観戦プロトコル 2 の差分（delta）として流れるイベントを、
+サーバー側のエンコード（Frame.encode）とクライアント側のデコードで計測する。
+
+    uv run python benchmarks/bench_codec.py
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.codec import CODECS  # noqa: E402
+from server.frames import Frame  # noqa: E402
+from server.records import CHANNELS, ROLES, ChatMessage, now_ns  # noqa: E402
+
+CONTENT = "占い結果を発表します。昨夜はプレイヤー3を占いました。結果は人狼です！"
+
+
+def chat_event(i: int) -> Frame:
+    record = ChatMessage(
+        CHANNELS.id("public"), f"Player{i % 9}", ROLES.id("seer"), CONTENT, i, now_ns()
+    )
+    return Frame.wrap(
+        {"type": "channel_message", "channel": "public"},
+        "message",
+        Frame.from_record(record),
+    )
+
+
+def player_event(i: int) -> Frame:
+    return Frame(
+        {
+            "type": "player_joined",
+            "player": {
+                "id": f"p{i}",
+                "name": f"Player{i}",
+                "role": "villager",
+                "is_alive": True,
+                "connected": True,
+            },
+        }
+    )
+
+
+def phase_event(i: int) -> Frame:
+    return Frame({"type": "phase", "phase": "day", "day": i, "deadline": None})
+
+
+EVENTS = {"chat": chat_event, "player_joined": player_event, "phase": phase_event}
+
+
+def measure(codec_name: str, make_event, count: int) -> dict:
+    """1イベントあたりのエンコード・デコード時間（μs）とフレームサイズ"""
+    codec = CODECS[codec_name]
+    deltas = [
+        Frame.wrap({"type": "delta", "seq": i}, "event", make_event(i))
+        for i in range(count)
+    ]
+
+    start = time.perf_counter()
+    encoded = [delta.encode(codec) for delta in deltas]
+    encode = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for data in encoded:
+        codec.decode(data if not codec.text else data.decode("utf-8"))
+    decode = time.perf_counter() - start
+
+    return {
+        "encode_us": encode / count * 1e6,
+        "decode_us": decode / count * 1e6,
+        "bytes": sum(len(data) for data in encoded) / count,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="codec benchmark")
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(
+        f"{'event':<14} {'codec':<7} {'encode us':>10} {'decode us':>10} {'bytes':>8}"
+    )
+    for event, make_event in EVENTS.items():
+        for codec_name in CODECS:
+            result = measure(codec_name, make_event, args.count)
+            print(
+                f"{event:<14} {codec_name:<7} {result['encode_us']:>10.2f} "
+                f"{result['decode_us']:>10.2f} {result['bytes']:>8.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
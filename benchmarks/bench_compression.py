@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+WebSocket 圧縮（permessage-deflate）の設定ごとのベンチマーク
+
+メモリ上の部屋で日本語のチャットと投票を流し、神視点に配信される差分フレームを
+受信者 --recipients 人に送るときの、1フレームあたりの送信バイト数（WebSocket の
+ヘッダーを含む）と、サーバーが圧縮に使う CPU 時間を設定ごとに計測する。
+圧縮は websockets の拡張（server/compression.py の ThresholdDeflate）をそのまま使う。
+
+    uv run python benchmarks/bench_compression.py --recipients 20
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websockets.extensions.permessage_deflate import PerMessageDeflate  # noqa: E402
+from websockets.frames import Frame, Opcode  # noqa: E402
+
+from server.compression import CompressionPolicy, ThresholdDeflate  # noqa: E402
+from server.memory import MemoryClient  # noqa: E402
+from server.room import GameRoom  # noqa: E402
+from server.spectator import SpectatorHub  # noqa: E402
+
+PHRASES = [
+    "占い結果を発表します",
+    "昨夜はプレイヤー{n}を占いました",
+    "結果は人狼です",
+    "結果は村人でした",
+    "私が本物の占い師です",
+    "プレイヤー{n}が怪しいと思います",
+    "今日はプレイヤー{n}に投票します",
+    "霊能COします",
+    "騎士はいませんか",
+    "発言が少ない人を吊りましょう",
+]
+
+# (名前, 設定)。None は圧縮しない
+POLICIES = [
+    ("off", None),
+    ("library default", CompressionPolicy(window_bits=12, mem_level=5, threshold=0)),
+    ("w15 m8", CompressionPolicy(threshold=0)),
+    ("w15 m8 t128", CompressionPolicy()),
+    ("w15 m8 level1", CompressionPolicy(level=1)),
+    ("w12 m5 t128", CompressionPolicy(window_bits=12, mem_level=5)),
+    ("w15 no-takeover", CompressionPolicy(context_takeover=False)),
+    ("w12 no-takeover", CompressionPolicy(window_bits=12, context_takeover=False)),
+]
+
+
+async def capture(messages: int, players: int, seed: int):
+    """メモリ上の部屋で発言・投票し、神視点に配信する差分フレームを集める"""
+    rng = random.Random(seed)
+    room = GameRoom("bench", spectator_history=0, reconnect_grace=0, verbose=False)
+    frames = []
+    room.spectators.on_publish = lambda frame: frames.append(
+        SpectatorHub._delta(len(frames) + 1, frame).data
+    )
+    clients = [MemoryClient(room, f"Player{i}", "villager") for i in range(players)]
+    for client in clients:
+        await client.connect()
+    for i in range(messages):
+        client = rng.choice(clients)
+        if i % 10 == 9:
+            target = rng.choice(clients)
+            await client.send_action("vote", target=target.player_id)
+        else:
+            content = "。".join(
+                rng.choice(PHRASES).format(n=rng.randrange(players))
+                for _ in range(rng.randrange(1, 4))
+            )
+            await client.send_chat(content)
+    return frames
+
+
+def extension(policy: CompressionPolicy) -> ThresholdDeflate:
+    """ハンドシェイクで合意したのと同じ、サーバー側の拡張"""
+    takeover = policy.context_takeover
+    negotiated = PerMessageDeflate(
+        False,
+        not takeover,
+        15,
+        policy.window_bits,
+        policy.compress_settings(),
+    )
+    return ThresholdDeflate(negotiated, policy)
+
+
+def measure(frames, policy, recipients: int):
+    """(1フレームあたりの送信バイト数, 受信者1人・1フレームあたりの CPU μs, 使い回し率)"""
+    extensions = [
+        [extension(policy)] if policy is not None else []
+        for _ in range(recipients)
+    ]
+    wire = 0
+    start = time.process_time()
+    for data in frames:
+        # 同じバイト列を全員に送る（ブロードキャストの経路と同じ）
+        for exts in extensions:
+            frame = Frame(Opcode.TEXT, data)
+            wire += len(frame.serialize(mask=False, extensions=exts))
+    cpu = time.process_time() - start
+    hit_rate = None
+    if policy is not None and policy.caches:
+        hits = sum(cache.hits for cache in policy.caches.values())
+        misses = sum(cache.misses for cache in policy.caches.values())
+        hit_rate = hits / max(hits + misses, 1)
+    per_frame = wire / (len(frames) * recipients)
+    return per_frame, cpu / (len(frames) * recipients) * 1e6, hit_rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="compression benchmark")
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--recipients", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    frames = asyncio.run(capture(args.messages, args.players, args.seed))
+    raw = sum(len(data) for data in frames) / len(frames)
+    print(
+        f"{len(frames)} frames, {raw:.0f} bytes/frame on average, "
+        f"{args.recipients} recipients"
+    )
+    print(f"{'policy':<18} {'wire B/frame':>12} {'ratio':>6} {'cpu us':>8} {'reuse':>6}")
+    for name, policy in POLICIES:
+        per_frame, cpu_us, hit_rate = measure(frames, policy, args.recipients)
+        reuse = "-" if hit_rate is None else f"{hit_rate:.0%}"
+        print(
+            f"{name:<18} {per_frame:>12.1f} {per_frame / raw:>6.2f} "
+            f"{cpu_us:>8.2f} {reuse:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
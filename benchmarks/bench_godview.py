@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+神視点の描画ベンチマーク
+
+合成したフレームを高頻度で流し込み、描画回数/秒と
+メッセージ1件あたりのCPU時間を計測する。
+比較用に、受信のたびにレイアウト全体を作り直す素朴な方式も計測する。
+
+    uv run python benchmarks/bench_godview.py --rate 500 --seconds 3
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rich.console import Console  # noqa: E402
+from rich.live import Live  # noqa: E402
+
+from server.godview import WerewolfGodview  # noqa: E402
+
+CHANNELS = ("public", "werewolf", "moderator")
+
+
+def synthetic_frames(count: int):
+    """チャットと参加イベントを混ぜた合成フレーム"""
+    for i in range(count):
+        if i % 50 == 0:
+            yield json.dumps(
+                {
+                    "type": "player_joined",
+                    "player": {
+                        "id": f"p{i}",
+                        "name": f"Player{i}",
+                        "role": "villager",
+                        "is_alive": True,
+                    },
+                }
+            )
+        else:
+            yield json.dumps(
+                {
+                    "type": "channel_message",
+                    "channel": CHANNELS[i % 3],
+                    "message": {
+                        "type": "chat",
+                        "player": f"Player{i % 16}",
+                        "role": "villager",
+                        "content": f"昨日の投票について考えてみました。({i})",
+                        "seq": i,
+                        "timestamp": "2026-01-01T12:00:00.000000",
+                    },
+                }
+            )
+
+
+def make_console() -> Console:
+    return Console(file=io.StringIO(), force_terminal=True, width=120, height=40)
+
+
+async def feed(godview: WerewolfGodview, rate: int, seconds: float, on_message=None):
+    """rate 件/秒のペースでフレームを流し込む"""
+    total = int(rate * seconds)
+    batch = max(1, rate // 100)
+    start = time.perf_counter()
+    for i, frame in enumerate(synthetic_frames(total)):
+        await godview.handle_message(frame)
+        if on_message is not None:
+            on_message()
+        if i % batch == batch - 1:
+            # 予定時刻まで待つ（10ms ごとにまとめて届く想定）
+            delay = start + (i + 1) / rate - time.perf_counter()
+            await asyncio.sleep(max(0, delay))
+    return total
+
+
+async def run_throttled(rate: int, seconds: float, fps: float) -> dict:
+    godview = WerewolfGodview(max_fps=fps, console=make_console())
+    godview.render()
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    with Live(godview.layout, console=godview.console, auto_refresh=False) as live:
+        task = asyncio.create_task(godview.render_loop(live))
+        total = await feed(godview, rate, seconds)
+        task.cancel()
+    return summarize("dirty-flag", total, godview.renders, cpu, wall)
+
+
+async def run_naive(rate: int, seconds: float) -> dict:
+    godview = WerewolfGodview(console=make_console())
+    renders = 0
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    with Live(godview.create_layout(), console=godview.console, auto_refresh=False) as live:
+
+        def rebuild():
+            nonlocal renders
+            live.update(godview.create_layout(), refresh=True)
+            renders += 1
+
+        total = await feed(godview, rate, seconds, rebuild)
+    return summarize("naive", total, renders, cpu, wall)
+
+
+def summarize(label: str, total: int, renders: int, cpu: float, wall: float) -> dict:
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return {
+        "mode": label,
+        "messages": total,
+        "renders": renders,
+        "renders_per_sec": renders / wall,
+        "cpu_us_per_message": cpu / total * 1e6,
+        "cpu_percent": cpu / wall * 100,
+    }
+
+
+async def run(rate: int, seconds: float, fps: float):
+    results = [await run_throttled(rate, seconds, fps), await run_naive(rate, seconds)]
+    print(
+        f"{'mode':>10} {'messages':>9} {'renders':>8} {'renders/s':>10} "
+        f"{'CPU us/msg':>11} {'CPU %':>6}"
+    )
+    for r in results:
+        print(
+            f"{r['mode']:>10} {r['messages']:>9} {r['renders']:>8} "
+            f"{r['renders_per_sec']:>10.1f} {r['cpu_us_per_message']:>11.1f} "
+            f"{r['cpu_percent']:>6.1f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=int, default=500, help="メッセージ/秒")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--fps", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.rate, args.seconds, args.fps))
+
+
+if __name__ == "__main__":
+    main()
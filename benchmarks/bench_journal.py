@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+ジャーナルのオーバーヘッド計測
+
+メモリのみの場合とジャーナル有効時（fsync あり／なし）で、
+イベントループ上のブロードキャスト処理時間を比較する。
+
+    uv run python benchmarks/bench_journal.py
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_broadcast import FakeWebSocket, chat_message, close_all, drain  # noqa: E402
+from server.journal import GameJournal  # noqa: E402
+from server.room import GameRoom  # noqa: E402
+from server.server import WerewolfServer  # noqa: E402
+
+
+async def run_case(
+    players: int, messages: int, journal_dir, fsync: bool, verbose: bool = False
+) -> dict:
+    server = WerewolfServer(queue_size=messages + 1)
+    journal = None
+    if journal_dir is not None:
+        journal = GameJournal(journal_dir, fsync=fsync)
+        journal.start()
+    room = GameRoom(journal=journal, verbose=verbose)
+    for i in range(players):
+        connection = server.create_connection(FakeWebSocket(), label=f"p{i}")
+        await room.register_player(f"p{i}", f"Player{i}", connection=connection)
+    await drain(room)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        await room.broadcast_to_channel("public", chat_message(i))
+    loop_elapsed = time.perf_counter() - start
+    await drain(room)
+
+    result = {"loop_ms": loop_elapsed * 1000}
+    if journal is not None:
+        start = time.perf_counter()
+        journal.close()
+        result["close_ms"] = (time.perf_counter() - start) * 1000
+        result["batches"] = journal.batches
+        result["fsyncs"] = journal.fsyncs
+
+    await close_all(room)
+    return result
+
+
+async def run(players: int, messages: int, verbose: bool = False):
+    cases = [("memory", None, False), ("journal", True, False), ("journal+fsync", True, True)]
+    print(f"{'case':>14} {'loop ms':>9} {'msg/s':>10} {'batches':>8} {'fsyncs':>7}")
+    baseline = None
+    for label, use_journal, fsync in cases:
+        with tempfile.TemporaryDirectory() as tmp:
+            result = await run_case(
+                players, messages, tmp if use_journal else None, fsync, verbose
+            )
+        rate = messages / (result["loop_ms"] / 1000)
+        if baseline is None:
+            baseline = result["loop_ms"]
+        overhead = (result["loop_ms"] / baseline - 1) * 100
+        print(
+            f"{label:>14} {result['loop_ms']:>9.1f} {rate:>10.0f} "
+            f"{result.get('batches', '-'):>8} {result.get('fsyncs', '-'):>7}"
+            f"   overhead {overhead:+.1f}%"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--players", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--verbose", action="store_true", help="登録のログを表示")
+    args = parser.parse_args()
+    asyncio.run(run(args.players, args.messages, args.verbose))
+
+
+if __name__ == "__main__":
+    main()
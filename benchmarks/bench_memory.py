@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+メッセージ保持量と配信ごとの確保量のベンチマーク
+
+- 保持しているチャットメッセージ1件あたりのバイト数
+  （チャンネルの履歴と神視点の差分履歴を含む。本文の文字列は除く）
+- 1回の配信（fan-out）で確保されたまま残るメモリブロック数とピークのバイト数
+
+    uv run python benchmarks/bench_memory.py
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.outbound import Connection  # noqa: E402
+from server.room import GameRoom  # noqa: E402
+
+CONTENT = "占い結果を発表します。昨夜はプレイヤー3を占いました。結果は人狼です！"
+
+
+class FakeWebSocket:
+    """送信しないダミー接続（フレームは送信キューに残る）"""
+
+    async def send(self, data, text=None):
+        pass
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+def chat_message(i: int) -> dict:
+    return {
+        "type": "chat",
+        "channel": "public",
+        "player": "Player1",
+        "role": "villager",
+        "content": f"{CONTENT} ({i})",
+    }
+
+
+async def bytes_per_message(messages: int) -> dict:
+    """保持しているメッセージ1件あたりのバイト数"""
+    room = GameRoom(history_size=messages, spectator_history=messages, verbose=False)
+    contents = [chat_message(i)["content"] for i in range(messages)]
+    content_bytes = sum(sys.getsizeof(c) for c in contents)
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(messages):
+        message = chat_message(i)
+        # 本文は事前に作った文字列を使い、計測から除く
+        message["content"] = contents[i]
+        await room.broadcast_to_channel("public", message)
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    total = after - before
+    return {
+        "messages": messages,
+        "bytes_per_message": total / messages,
+        "content_bytes_per_message": content_bytes / messages,
+    }
+
+
+async def fan_out_allocations(recipients: int, broadcasts: int) -> dict:
+    """1回の配信で残るブロック数とピークのバイト数"""
+    room = GameRoom(spectator_history=broadcasts, verbose=False)
+    for i in range(recipients):
+        # 送信タスクを開始しないので、フレームはキューに溜まる
+        connection = Connection(FakeWebSocket(), maxsize=broadcasts + 1)
+        await room.register_player(f"p{i}", f"Player{i}", connection=connection)
+    for player in room.players.values():
+        player.connection.queue.clear()
+
+    messages = [chat_message(i) for i in range(broadcasts)]
+    gc.collect()
+    tracemalloc.start()
+    blocks = sys.getallocatedblocks()
+    peak = 0
+    for message in messages:
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        await room.broadcast_to_channel("public", message)
+        peak += tracemalloc.get_traced_memory()[1] - current
+    retained = sys.getallocatedblocks() - blocks
+    tracemalloc.stop()
+
+    return {
+        "recipients": recipients,
+        "blocks_per_fan_out": retained / broadcasts,
+        "peak_bytes_per_fan_out": peak / broadcasts,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="memory benchmark")
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--broadcasts", type=int, default=200)
+    args = parser.parse_args()
+
+    result = await bytes_per_message(args.messages)
+    print(
+        f"retained: {result['bytes_per_message']:.0f} bytes/message "
+        f"(本文 {result['content_bytes_per_message']:.0f} bytes を除く)"
+    )
+
+    print(f"{'recipients':>10} {'blocks/fan-out':>15} {'peak bytes/fan-out':>19}")
+    for recipients in (10, 100, 1000):
+        result = await fan_out_allocations(recipients, args.broadcasts)
+        print(
+            f"{recipients:>10} {result['blocks_per_fan_out']:>15.1f} "
+            f"{result['peak_bytes_per_fan_out']:>19.0f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
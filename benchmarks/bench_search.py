@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+チャット検索（n-gram 転置索引）のベンチマーク
+
+大会1回分の発言を索引に追加する時間と、よく使う条件での検索時間を計測する。
+
+    uv run python benchmarks/bench_search.py --messages 200000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.records import CHANNELS, ROLES, ChatMessage  # noqa: E402
+from server.search import ChatIndex  # noqa: E402
+
+PHRASES = [
+    "占い結果を発表します",
+    "昨夜はプレイヤー{n}を占いました",
+    "結果は人狼です",
+    "結果は村人でした",
+    "私が本物の占い師です",
+    "プレイヤー{n}が怪しいと思います",
+    "今日はプレイヤー{n}に投票します",
+    "霊能COします",
+    "騎士はいませんか",
+    "発言が少ない人を吊りましょう",
+]
+
+QUERIES = {
+    "text": {"text": "占い師"},
+    "text+speaker": {"text": "投票", "player": "Player3"},
+    "speaker+day": {"player": "Player5", "day": 2},
+    "channel+seq": {"channels": [CHANNELS.id("public")], "since": 1000, "until": 2000},
+    "text+phase": {"text": "人狼", "phase": "night"},
+    "rare text": {"text": "騎士はいません"},
+    "short text": {"text": "狼"},
+    "missing char": {"text": "霧"},
+}
+
+
+def build(messages: int, players: int, seed: int):
+    """発言を索引に追加し、1件あたりの時間（μs）を返す"""
+    rng = random.Random(seed)
+    channels = [CHANNELS.id("public")] * 8 + [CHANNELS.id("werewolf")] * 2
+    seqs = {}
+    records = []
+    for i in range(messages):
+        channel_id = rng.choice(channels)
+        seqs[channel_id] = seqs.get(channel_id, 0) + 1
+        content = "。".join(
+            rng.choice(PHRASES).format(n=rng.randrange(players))
+            for _ in range(rng.randrange(1, 4))
+        )
+        records.append(
+            ChatMessage(
+                channel_id,
+                f"Player{rng.randrange(players)}",
+                ROLES.id("villager"),
+                content,
+                seqs[channel_id],
+            )
+        )
+
+    index = ChatIndex()
+    # 1日 = 昼 500 件 + 夜 100 件
+    start = time.perf_counter()
+    for i, record in enumerate(records):
+        day, offset = divmod(i, 600)
+        index.add(record, "day" if offset < 500 else "night", day + 1)
+    elapsed = time.perf_counter() - start
+    return index, elapsed / messages * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="chat search benchmark")
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    index, add_us = build(args.messages, args.players, args.seed)
+    stats = index.stats()
+    print(
+        f"indexed {stats['messages']} messages: {add_us:.2f} us/message, "
+        f"{stats['grams']} grams, {stats['chars']} chars, {stats['postings']} postings"
+    )
+
+    print(f"{'query':<14} {'hits':>5} {'ms':>8}")
+    for name, query in QUERIES.items():
+        docs, _ = index.search(**query)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            index.search(**query)
+        elapsed = (time.perf_counter() - start) / args.repeat
+        print(f"{name:<14} {len(docs):>5} {elapsed * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
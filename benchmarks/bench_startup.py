@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+コマンドの起動時間のベンチマーク
+
+サーバー・クライアント・神視点（と中継）をそれぞれ別プロセスで起動し、
+プロセスを起動してから接続できる状態になるまでの時間を計測する。
+
+- server: WebSocket で接続できるようになるまで
+- client: 登録が済んで "* connected" を出力するまで
+- godview: "接続成功" を出力するまで
+- relay: 観戦者が接続できるようになるまで
+
+    uv run python benchmarks/bench_startup.py --repeat 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import websockets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def spawn(*args: str, stdin=subprocess.DEVNULL):
+    return await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        *args,
+        cwd=ROOT,
+        stdin=stdin,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+async def stop(process):
+    if process.returncode is None:
+        process.terminate()
+        await process.wait()
+
+
+async def wait_port(url: str, timeout: float = 30.0):
+    """接続できるようになるまで待つ"""
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            async with websockets.connect(url):
+                return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.005)
+
+
+async def wait_output(process, marker: str, timeout: float = 30.0):
+    """marker を含む行が出力されるまで待つ"""
+
+    async def read():
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                raise RuntimeError(f"exited before {marker!r}")
+            if marker in line.decode("utf-8", "replace"):
+                return
+
+    await asyncio.wait_for(read(), timeout)
+
+
+async def time_server(port: int) -> float:
+    start = time.perf_counter()
+    process = await spawn("server.server", "--port", str(port))
+    try:
+        await wait_port(f"ws://localhost:{port}")
+        return time.perf_counter() - start
+    finally:
+        await stop(process)
+
+
+async def time_client(url: str) -> float:
+    start = time.perf_counter()
+    process = await spawn(
+        "server.client", "--url", url, "--name", "bench", stdin=subprocess.PIPE
+    )
+    try:
+        await wait_output(process, "* connected")
+        return time.perf_counter() - start
+    finally:
+        process.stdin.close()
+        await stop(process)
+
+
+async def time_godview(url: str) -> float:
+    start = time.perf_counter()
+    process = await spawn("server.godview", "--url", url, "--stats-interval", "0")
+    try:
+        await wait_output(process, "接続成功")
+        return time.perf_counter() - start
+    finally:
+        await stop(process)
+
+
+async def time_relay(url: str, port: int) -> float:
+    start = time.perf_counter()
+    process = await spawn(
+        "server.godview", "--relay", "--url", url, "--port", str(port)
+    )
+    try:
+        await wait_port(f"ws://localhost:{port}")
+        return time.perf_counter() - start
+    finally:
+        await stop(process)
+
+
+def import_time(module: str) -> float:
+    """モジュールを読み込むだけのプロセスの実行時間"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", f"import {module}"], cwd=ROOT, check=True)
+    return time.perf_counter() - start
+
+
+async def run(args):
+    results = {name: [] for name in ("server", "client", "godview", "relay")}
+    for i in range(args.repeat):
+        results["server"].append(await time_server(args.port + 1))
+
+    server = await spawn("server.server", "--port", str(args.port))
+    url = f"ws://localhost:{args.port}"
+    try:
+        await wait_port(url)
+        for i in range(args.repeat):
+            results["client"].append(await time_client(url))
+            results["godview"].append(await time_godview(url))
+            results["relay"].append(await time_relay(url, args.port + 2))
+    finally:
+        await stop(server)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=18765)
+    args = parser.parse_args()
+
+    print(f"{'module':<16} {'import ms':>10}")
+    for module in ("server.server", "server.client", "server.godview"):
+        elapsed = statistics.median(import_time(module) for _ in range(args.repeat))
+        print(f"{module:<16} {elapsed * 1000:>10.1f}")
+
+    results = asyncio.run(run(args))
+    print(f"\n{'command':<16} {'connected ms':>13} {'min':>8} {'max':>8}")
+    for name, samples in results.items():
+        print(
+            f"{name:<16} {statistics.median(samples) * 1000:>13.1f} "
+            f"{min(samples) * 1000:>8.1f} {max(samples) * 1000:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
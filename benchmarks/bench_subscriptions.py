@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+観戦者の購読条件（サーバー側の絞り込み）のベンチマーク
+
+メモリ上の部屋で発言・夜の相談・投票を流して神視点のイベントを集め、
+--observers 人の観戦者に配信するときの、配信にかかる時間・送信フレーム数・
+送信バイト数を比べる。
+
+- firehose: 全員が全イベントを受け取り、クライアント側で捨てる（従来）
+- filtered: 観戦者の 3/4 が購読条件を指定する
+  （人狼チャンネルだけ・行動だけ・特定のプレイヤーだけ、残りは全イベント）
+
+    uv run python benchmarks/bench_subscriptions.py --observers 100
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.memory import MemoryClient  # noqa: E402
+from server.outbound import Connection  # noqa: E402
+from server.room import GameRoom  # noqa: E402
+from server.spectator import SpectatorHub, parse_subscription  # noqa: E402
+
+CONTENT = "占い結果を発表します。昨夜はプレイヤー3を占いました。結果は人狼です！"
+
+
+class FakeWebSocket:
+    """送信したフレーム数とバイト数を数えるだけのダミー接続"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    async def send(self, data, text=None):
+        self.frames += 1
+        self.bytes += len(data)
+
+    async def close(self, code=1000, reason=""):
+        pass
+
+
+async def capture(messages: int, players: int, seed: int):
+    """メモリ上の部屋で発言・投票し、神視点に配信するイベントとプレイヤー ID を集める"""
+    rng = random.Random(seed)
+    room = GameRoom("bench", spectator_history=0, reconnect_grace=0, verbose=False)
+    events = []
+    room.spectators.on_publish = events.append
+    clients = [
+        MemoryClient(room, f"Player{i}", "werewolf" if i < 2 else "villager")
+        for i in range(players)
+    ]
+    for client in clients:
+        await client.connect()
+    events.clear()
+    for i in range(messages):
+        client = rng.choice(clients)
+        if i % 10 == 9:
+            await client.send_action("vote", target=rng.choice(clients).player_id)
+        elif i % 4 == 3:
+            await rng.choice(clients[:2]).send_chat(f"{CONTENT} ({i})", "werewolf")
+        else:
+            await client.send_chat(f"{CONTENT} ({i})")
+    return room, events, [client.player_id for client in clients]
+
+
+def subscriptions(observers: int, filtered: bool, player_ids):
+    """観戦者ごとの購読条件"""
+    if not filtered:
+        return [None] * observers
+    specs = [
+        {"channels": "werewolf", "types": "channel_message"},
+        {"types": "action"},
+        None,  # プレイヤーごと（下で割り当てる）
+        None,
+    ]
+    result = []
+    for i in range(observers):
+        spec = specs[i % len(specs)]
+        if i % len(specs) == 2:
+            spec = {"players": player_ids[(i // len(specs)) % len(player_ids)]}
+        result.append(parse_subscription(spec))
+    return result
+
+
+async def drain(connections):
+    while any(c.queue or c._busy for c in connections):
+        await asyncio.sleep(0)
+
+
+async def measure(room, events, observers: int, filtered: bool, player_ids, tick, batch):
+    """(配信時間 ms, 送信フレーム数, 送信バイト数, 配信先の延べ数)"""
+    hub = SpectatorHub(room.spectator_state, history=0, tick=tick)
+    sockets = []
+    connections = []
+    for subscription in subscriptions(observers, filtered, player_ids):
+        ws = FakeWebSocket()
+        connection = Connection(ws, maxsize=len(events) + 16, label="godview")
+        connection.start()
+        hub.add(connection, protocol=2, subscription=subscription)
+        sockets.append(ws)
+        connections.append(connection)
+    await drain(connections)
+    for ws in sockets:
+        ws.frames = ws.bytes = 0
+
+    delivered = 0
+    start = time.perf_counter()
+    for i, frame in enumerate(events, 1):
+        delivered += hub.publish(frame)
+        # tick の代わりに batch 件ごとにまとめて送る
+        if tick and i % batch == 0:
+            hub.flush()
+    if tick:
+        hub.flush()
+    await drain(connections)
+    elapsed = time.perf_counter() - start
+
+    for connection in connections:
+        await connection.close()
+    frames = sum(ws.frames for ws in sockets)
+    sent = sum(ws.bytes for ws in sockets)
+    return elapsed * 1000, frames, sent, delivered
+
+
+async def run(args):
+    room, events, player_ids = await capture(args.messages, args.players, args.seed)
+    print(
+        f"{len(events)} events, {args.observers} observers, "
+        f"tick={args.tick}s batch={args.batch}"
+    )
+    print(
+        f"{'mode':<10} {'ms':>8} {'frames':>8} {'KiB':>9} {'delivered':>10}"
+    )
+    for name, filtered in (("firehose", False), ("filtered", True)):
+        elapsed, frames, sent, delivered = await measure(
+            room, events, args.observers, filtered, player_ids, args.tick, args.batch
+        )
+        print(
+            f"{name:<10} {elapsed:>8.1f} {frames:>8} {sent / 1024:>9.1f} "
+            f"{delivered:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--observers", type=int, default=100)
+    parser.add_argument("--tick", type=float, default=0.0, help="0 なら差分を都度送る")
+    parser.add_argument("--batch", type=int, default=20, help="tick 1回あたりのイベント数")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,530 @@
+#!/usr/bin/env python3
+"""
+負荷生成・レイテンシ計測ハーネス
+
+WerewolfClient で多数の模擬プレイヤーと神視点をローカルサーバーに接続し、
+送信からの配信レイテンシ（p50/p95/p99）、メッセージ/秒、
+サーバーの CPU 使用率と RSS を計測する。
+結果を保存したベースライン JSON と比較して劣化を検出できる。
+
+    uv run python benchmarks/loadgen.py --players 200 --godviews 5 --rate 0.5
+    uv run python benchmarks/loadgen.py --save-baseline baseline.json
+    uv run python benchmarks/loadgen.py --baseline baseline.json --tolerance 0.15
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from array import array
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import websockets  # noqa: E402
+from websockets.exceptions import ConnectionClosed  # noqa: E402
+
+from server.client import WerewolfClient  # noqa: E402
+from server.codec import CODECS, JSON, get_codec  # noqa: E402
+
+MARKER = "LG|"
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+# 比較する指標と、値が大きいほど悪いかどうか
+COMPARED_METRICS = {
+    "latency_p50_ms": True,
+    "latency_p95_ms": True,
+    "latency_p99_ms": True,
+    "delivered_per_sec": False,
+    "server_cpu_percent": True,
+    "server_rss_mb": True,
+    "godview_bytes_per_frame": True,
+}
+
+
+def parse_roles(spec: str) -> List[tuple]:
+    """'villager=0.7,werewolf=0.2' を (役職, 割合) のリストに"""
+    roles = []
+    for part in spec.split(","):
+        role, _, weight = part.partition("=")
+        roles.append((role.strip(), float(weight or 1)))
+    return roles
+
+
+def assign_roles(count: int, roles: List[tuple]) -> List[str]:
+    """割合どおりに役職を割り当てる（決定的）"""
+    total = sum(weight for _, weight in roles)
+    assigned = []
+    for role, weight in roles:
+        assigned += [role] * round(count * weight / total)
+    assigned += [roles[0][0]] * (count - len(assigned))
+    return assigned[:count]
+
+
+def now_ns() -> int:
+    # CLOCK_MONOTONIC はプロセス間で共通なので、送信側と受信側が別プロセスでも比較できる
+    return time.monotonic_ns()
+
+
+def make_content(sender: str, payload: int) -> str:
+    head = f"{MARKER}{sender}|{now_ns()}|"
+    return head + "あ" * max(0, payload - len(head))
+
+
+def latency_of(content: str) -> Optional[int]:
+    if not content.startswith(MARKER):
+        return None
+    try:
+        sent = int(content.split("|", 3)[2])
+    except (IndexError, ValueError):
+        return None
+    return now_ns() - sent
+
+
+class Recorder:
+    """受信側で計測したレイテンシの記録"""
+
+    def __init__(self):
+        self.latencies = array("q")
+        # プレイヤーが受信した分だけのレイテンシ（観戦者の影響を見る）
+        self.player_latencies = array("q")
+        self.delivered = 0
+        self.sent = 0
+        self.errors = 0
+        # 神視点が受信したフレームの数とバイト数
+        self.frames = 0
+        self.frame_bytes = 0
+        self.active = False
+
+    def observe(self, content: str, player: bool = False):
+        latency = latency_of(content)
+        if latency is not None and self.active:
+            self.latencies.append(latency)
+            if player:
+                self.player_latencies.append(latency)
+            self.delivered += 1
+
+
+async def run_player(
+    url: str,
+    index: int,
+    role: str,
+    room: str,
+    args,
+    recorder: Recorder,
+    ready: asyncio.Event,
+    stop: asyncio.Event,
+):
+    """模擬プレイヤー1人"""
+    registered = asyncio.Event()
+    client = WerewolfClient(
+        url, name=f"bot{index}", role=role, room=room, codec=args.codec
+    )
+    client.player_id = f"{room}-bot{index}"
+
+    async def on_message(message: dict):
+        msg_type = message.get("type")
+        if msg_type == "system":
+            registered.set()
+        elif msg_type == "chat":
+            recorder.observe(message.get("content", ""), player=True)
+
+    client.on_message = on_message
+    connect_task = asyncio.create_task(client.connect())
+    try:
+        await asyncio.wait_for(registered.wait(), timeout=30)
+    except asyncio.TimeoutError:
+        recorder.errors += 1
+        connect_task.cancel()
+        return
+    ready.set()
+
+    if args.rate > 0:
+        interval = 1 / args.rate
+        # 送信タイミングをばらけさせる
+        await asyncio.sleep(random.random() * interval)
+        while not stop.is_set():
+            channel = "public"
+            if role == "werewolf" and random.random() < args.werewolf_ratio:
+                channel = "werewolf"
+            try:
+                await client.send_chat(
+                    make_content(client.player_id, args.payload), channel
+                )
+                if recorder.active:
+                    recorder.sent += 1
+            except ConnectionClosed:
+                recorder.errors += 1
+                break
+            await asyncio.sleep(interval)
+    else:
+        await stop.wait()
+
+    await client.close()
+    connect_task.cancel()
+
+
+async def run_godview(
+    url: str, room: str, recorder: Recorder, stop: asyncio.Event, codec=JSON
+):
+    """模擬神視点1つ（観戦プロトコル 2）"""
+
+    def observe(event: dict):
+        if event.get("type") == "channel_message":
+            recorder.observe(event.get("message", {}).get("content", ""))
+
+    async with websockets.connect(url, max_size=None) as websocket:
+        handshake = {"type": "godview", "room": room, "protocol": 2}
+        if codec is not JSON:
+            handshake["codec"] = codec.name
+        await websocket.send(json.dumps(handshake))
+        first = codec.decode(await websocket.recv())
+        if first.get("type") == "redirect":
+            return await run_godview(first["url"], room, recorder, stop, codec)
+
+        stop_task = asyncio.create_task(stop.wait())
+        while not stop.is_set():
+            recv_task = asyncio.create_task(websocket.recv())
+            done, _ = await asyncio.wait(
+                {recv_task, stop_task}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if recv_task not in done:
+                recv_task.cancel()
+                break
+            frame = recv_task.result()
+            if recorder.active:
+                recorder.frames += 1
+                recorder.frame_bytes += len(frame)
+            data = codec.decode(frame)
+            if data.get("type") == "delta":
+                observe(data.get("event", {}))
+            elif data.get("type") == "deltas":
+                for delta in data.get("deltas", []):
+                    observe(delta.get("event", {}))
+
+
+async def run_clients(
+    url: str, players: List[tuple], godviews: List[tuple], args
+) -> dict:
+    """このプロセスが担当するクライアント群を動かす"""
+    recorder = Recorder()
+    stop = asyncio.Event()
+    readies = []
+    tasks = []
+
+    for room, godview_url in godviews:
+        tasks.append(
+            asyncio.create_task(
+                run_godview(godview_url, room, recorder, stop, get_codec(args.codec))
+            )
+        )
+
+    for index, role, room in players:
+        ready = asyncio.Event()
+        readies.append(ready)
+        tasks.append(
+            asyncio.create_task(
+                run_player(url, index, role, room, args, recorder, ready, stop)
+            )
+        )
+        # 接続を少しずつ張る
+        if index % 50 == 49:
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(ready.wait() for ready in readies))
+    await asyncio.sleep(args.warmup)
+
+    recorder.active = True
+    await asyncio.sleep(args.duration)
+    recorder.active = False
+    # 送信済みメッセージの配信を待つ
+    await asyncio.sleep(args.drain)
+
+    stop.set()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return {
+        "latencies": recorder.latencies.tobytes(),
+        "player_latencies": recorder.player_latencies.tobytes(),
+        "delivered": recorder.delivered,
+        "sent": recorder.sent,
+        "errors": recorder.errors,
+        "frames": recorder.frames,
+        "frame_bytes": recorder.frame_bytes,
+    }
+
+
+def client_process(url: str, players: List[tuple], godviews: List[tuple], args) -> dict:
+    return asyncio.run(run_clients(url, players, godviews, args))
+
+
+def read_proc(pid: int) -> dict:
+    """/proc からプロセスの CPU 時間（秒）と RSS（MB）を読む"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+        rss = 0.0
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1]) / 1024
+        return {"cpu": cpu, "rss_mb": rss}
+    except (OSError, IndexError, ValueError):
+        return {"cpu": 0.0, "rss_mb": 0.0}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def start_process(argv: List[str], port: int) -> subprocess.Popen:
+    """サーバー（または中継）を起動して接続できるまで待つ"""
+    process = subprocess.Popen(
+        [sys.executable, "-m"] + argv,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("localhost", port), timeout=0.2):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"{argv[0]} did not start")
+
+
+def start_server(port: int, extra: List[str]) -> subprocess.Popen:
+    """ローカルサーバーを起動して接続できるまで待つ"""
+    return start_process(["server.server", "--port", str(port)] + extra, port)
+
+
+def start_relay(port: int, upstream: str) -> subprocess.Popen:
+    """観戦者の中継を起動して接続できるまで待つ"""
+    return start_process(
+        ["server.godview", "--relay", "--url", upstream, "--port", str(port)], port
+    )
+
+
+def percentile(sorted_values, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run(args) -> dict:
+    server = None
+    url = args.url
+    pid = args.server_pid
+    if url is None:
+        port = free_port()
+        server = start_server(port, args.server_args.split())
+        url = f"ws://localhost:{port}"
+        pid = server.pid
+
+    roles = assign_roles(args.players, parse_roles(args.roles))
+    players = [
+        (i, roles[i], f"room{i % args.rooms}") for i in range(args.players)
+    ]
+    processes = [server] if server is not None else []
+    try:
+        # 神視点は中継があれば中継に均等に振り分ける
+        relay_urls = []
+        for _ in range(args.relays):
+            relay_port = free_port()
+            processes.append(start_relay(relay_port, url))
+            relay_urls.append(f"ws://localhost:{relay_port}")
+        relay_urls = relay_urls or [url]
+        godviews = [
+            (f"room{i % args.rooms}", relay_urls[i % len(relay_urls)])
+            for i in range(args.godviews)
+        ]
+
+        # クライアントをプロセスに振り分ける
+        procs = max(1, args.procs)
+        shares = [
+            (players[i::procs], godviews[i::procs]) for i in range(procs)
+        ]
+
+        before = read_proc(pid) if pid else None
+        start = time.monotonic()
+        if procs == 1:
+            results = [client_process(url, shares[0][0], shares[0][1], args)]
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            with ctx.Pool(procs) as pool:
+                results = pool.starmap(
+                    client_process,
+                    [(url, p, g, args) for p, g in shares],
+                )
+        wall = time.monotonic() - start
+        after = read_proc(pid) if pid else None
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    latencies = array("q")
+    for result in results:
+        latencies.frombytes(result["latencies"])
+    ordered = sorted(latencies)
+    player_latencies = array("q")
+    for result in results:
+        player_latencies.frombytes(result["player_latencies"])
+    player_ordered = sorted(player_latencies)
+
+    report = {
+        "config": {
+            "players": args.players,
+            "godviews": args.godviews,
+            "rooms": args.rooms,
+            "rate": args.rate,
+            "payload": args.payload,
+            "duration": args.duration,
+            "procs": procs,
+            "codec": args.codec,
+            "relays": args.relays,
+            "server_args": args.server_args,
+        },
+        "sent": sum(r["sent"] for r in results),
+        "delivered": sum(r["delivered"] for r in results),
+        "errors": sum(r["errors"] for r in results),
+        "sent_per_sec": sum(r["sent"] for r in results) / args.duration,
+        "delivered_per_sec": sum(r["delivered"] for r in results) / args.duration,
+        "latency_p50_ms": percentile(ordered, 50) / 1e6,
+        "latency_p95_ms": percentile(ordered, 95) / 1e6,
+        "latency_p99_ms": percentile(ordered, 99) / 1e6,
+        "latency_max_ms": (ordered[-1] / 1e6) if ordered else 0.0,
+        "player_latency_p50_ms": percentile(player_ordered, 50) / 1e6,
+        "player_latency_p99_ms": percentile(player_ordered, 99) / 1e6,
+    }
+    frames = sum(r["frames"] for r in results)
+    if frames:
+        report["godview_bytes_per_frame"] = (
+            sum(r["frame_bytes"] for r in results) / frames
+        )
+    if before and after:
+        report["server_cpu_percent"] = (after["cpu"] - before["cpu"]) / wall * 100
+        report["server_rss_mb"] = after["rss_mb"]
+    return report
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """ベースラインより tolerance 以上悪化した指標を返す"""
+    regressions = []
+    for metric, higher_is_worse in COMPARED_METRICS.items():
+        old = baseline.get(metric)
+        new = report.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change > tolerance if higher_is_worse else change < -tolerance
+        mark = "❌" if worse else "  "
+        print(f"  {mark} {metric:<20} {old:>10.2f} -> {new:>10.2f} ({change:+.1%})")
+        if worse:
+            regressions.append(metric)
+    return regressions
+
+
+def print_report(report: dict):
+    print(
+        f"players={report['config']['players']} godviews={report['config']['godviews']} "
+        f"rooms={report['config']['rooms']} rate={report['config']['rate']}/s "
+        f"payload={report['config']['payload']}"
+    )
+    print(f"  sent        {report['sent']:>10} ({report['sent_per_sec']:.1f}/s)")
+    print(
+        f"  delivered   {report['delivered']:>10} "
+        f"({report['delivered_per_sec']:.1f}/s)"
+    )
+    print(f"  errors      {report['errors']:>10}")
+    print(
+        f"  latency ms  p50={report['latency_p50_ms']:.2f} "
+        f"p95={report['latency_p95_ms']:.2f} p99={report['latency_p99_ms']:.2f} "
+        f"max={report['latency_max_ms']:.2f}"
+    )
+    print(
+        f"  players ms  p50={report['player_latency_p50_ms']:.2f} "
+        f"p99={report['player_latency_p99_ms']:.2f}"
+    )
+    if "server_cpu_percent" in report:
+        print(
+            f"  server      cpu={report['server_cpu_percent']:.1f}% "
+            f"rss={report['server_rss_mb']:.1f}MB"
+        )
+    if "godview_bytes_per_frame" in report:
+        print(
+            f"  godview     {report['godview_bytes_per_frame']:.0f} bytes/frame "
+            f"({report['config']['codec']})"
+        )
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Werewolf load generator")
+    parser.add_argument("--url", help="既存サーバーに接続（省略時はローカルに起動）")
+    parser.add_argument("--server-pid", type=int, help="--url 使用時に CPU/RSS を測るサーバーの PID")
+    parser.add_argument("--server-args", default="", help="起動するサーバーへの追加引数")
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--godviews", type=int, default=2)
+    parser.add_argument("--rooms", type=int, default=1)
+    parser.add_argument(
+        "--roles", default="villager=0.7,werewolf=0.2,moderator=0.1"
+    )
+    parser.add_argument("--rate", type=float, default=0.5, help="1人あたりの送信数/秒")
+    parser.add_argument("--payload", type=int, default=80, help="本文の文字数")
+    parser.add_argument(
+        "--werewolf-ratio", type=float, default=0.3, help="人狼が werewolf チャンネルに送る割合"
+    )
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument("--drain", type=float, default=1)
+    parser.add_argument("--procs", type=int, default=1, help="クライアントを動かすプロセス数")
+    parser.add_argument(
+        "--codec", choices=sorted(CODECS), default="json", help="クライアントの符号化方式"
+    )
+    parser.add_argument(
+        "--relays", type=int, default=0, help="神視点を中継経由で接続する（中継の数）"
+    )
+    parser.add_argument("--json", action="store_true", help="結果を JSON で出力")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--baseline", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 baseline saved: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"📊 compare with {args.baseline} (tolerance {args.tolerance:.0%})")
+        if compare(report, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,112 @@
 werewolf-ai-battle Chat Client
 
 チャットサーバーに接続するクライアントライブラリ。
+
+- 接続は裏のタスクが管理し、切れたら指数バックオフで接続し直す
+  （置き換えられた・ポリシー違反などの切断では接続し直さずに止まる）。
+  同じ player_id と resume_token で登録し直して元のプレイヤーに戻り、抜けたチャットを history で取り戻す
+- 送信は送信キューに積むだけで待たない。送信中に溜まった分は batch にまとめて1フレームで送る
+- 受信は on_message のほか、async for event in client（チャンネル・種類で絞り込める）
+- `python -m server.client` は標準入出力で1行ずつ送受信する（エージェント向け、rich は使わない）
+
+    client = WerewolfClient(name="村人1")
+    client.start()
+    await client.wait_connected()
+    await client.send_chat("こんにちは")
+    async for event in client.events(types=("chat",), channels=("public",)):
+        ...
 """
 
 import asyncio
+import random
+import sys
+import traceback
 import websockets
 import json
-from typing import Optional, Callable
+from collections import deque
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from websockets.exceptions import ConnectionClosed, InvalidURI, WebSocketException
+
+from .codec import CODECS, JSON, get_codec
+from .compression import DEFAULT_POLICIES, PLAYER, CompressionPolicy, parse_policy
+from .outbound import CLOSE_REPLACED
+from .tasks import spawn
+
+if TYPE_CHECKING:
+    import argparse
+
+# 接続し直しても同じ結果になる切断（未知のコーデック・ポリシー違反・別の接続に置き換えられた）
+TERMINAL_CLOSE_CODES = frozenset((1003, 1008, CLOSE_REPLACED))
+
+# 1フレームにまとめる最大件数とおおよその大きさ
+BATCH_MAX = 20
+BATCH_BYTES = 32 * 1024
+
+# エンコードできないメッセージ（シリアライズできない値・循環参照など）
+ENCODE_ERRORS = (TypeError, ValueError, OverflowError, RecursionError)
+
+
+class Subscription:
+    """async for で受け取るイベントの購読（有界で、溢れたら古いものから捨てる）"""
+
+    def __init__(
+        self,
+        client: "WerewolfClient",
+        channels: Optional[Iterable[str]] = None,
+        types: Optional[Iterable[str]] = None,
+        maxsize: int = 1000,
+    ):
+        self.client = client
+        self.channels = None if channels is None else set(channels)
+        self.types = None if types is None else set(types)
+        self.maxsize = maxsize
+        self.events: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self.closed = False
+        self.dropped = 0
+
+    def matches(self, event: dict) -> bool:
+        """絞り込みの条件に合うか"""
+        if self.types is not None and event.get("type") not in self.types:
+            return False
+        if self.channels is not None and event.get("channel") not in self.channels:
+            return False
+        return True
+
+    def put(self, event: dict):
+        if len(self.events) >= self.maxsize:
+            self.events.popleft()
+            self.dropped += 1
+        self.events.append(event)
+        self._wakeup.set()
+
+    def close(self):
+        """購読をやめる（溜まっているイベントを返し終えたら async for が終わる）"""
+        self.closed = True
+        self.client._subscriptions.discard(self)
+        self._wakeup.set()
+
+    def __aiter__(self) -> "Subscription":
+        return self
+
+    async def __anext__(self) -> dict:
+        while not self.events:
+            if self.closed:
+                raise StopAsyncIteration
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        return self.events.popleft()
 
 
 class WerewolfClient:
@@ -19,87 +119,637 @@ class WerewolfClient:
         server_url: str = "ws://localhost:8765",
         name: str = "Anonymous",
         role: str = "villager",
+        room: str = "default",
+        codec: str = "json",
+        reconnect: bool = True,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+        stable_after: float = 10.0,
+        queue_size: int = 1000,
+        verbose: bool = True,
+        compression: Optional[CompressionPolicy] = None,
     ):
         self.server_url = server_url
         self.name = name
         self.role = role
+        self.room = room
+        # 登録後の送受信に使う符号化方式（登録メッセージ自体は常に JSON）
+        self.codec = get_codec(codec)
+        if self.codec is None:
+            raise ValueError(f"unknown codec: {codec}")
+        # 提示する圧縮の設定（既定はプレイヤー向けの設定 = 圧縮しない）
+        self.compression = compression or DEFAULT_POLICIES[PLAYER]
         self.player_id = None
+        # 元のプレイヤーに戻るための合言葉（最初の登録でサーバーから届く）
+        self.resume_token: Optional[str] = None
         self.websocket = None
         self.on_message: Optional[Callable] = None
+        # サーバーから届いた直近のエラー
+        self.last_error: Optional[dict] = None
+        # 流量制御で断られたとき、この時刻（ループの時計）まで送信を待つ
+        self._resume_at = 0.0
+
+        # 接続の管理（切れたら backoff 秒から max_backoff 秒まで倍々に待って接続し直す）
+        # 登録から stable_after 秒続いた接続が切れたときだけ backoff 秒に戻す
+        self.reconnect = reconnect
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self._registered_at = 0.0
+        # 直近の切断のコードと理由
+        self.close_code: Optional[int] = None
+        self.close_reason = ""
+        # 再接続をやめた切断（{"code", "reason"}、再接続を続けている間は None）
+        self.failure: Optional[dict] = None
+        self.verbose = verbose
+        self.connected = asyncio.Event()
+        self.closed = False
+        self._task: Optional[asyncio.Task] = None
+        # サーバーが対応している機能（登録時の system メッセージで届く）
+        self.features: Set[str] = set()
+
+        # 送信キュー（接続していない間も溜めておき、つながったら送る）
+        self.queue_size = queue_size
+        self._outbox: Deque[dict] = deque()
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        # 送信タスクが予期しないエラーで止まったときの例外
+        self.writer_error: Optional[BaseException] = None
+
+        # 受信したチャットのチャンネルごとの最後の通し番号（再接続時の取り戻し用）
+        self.last_seq: Dict[str, int] = {}
+        # 取り戻し中のチャンネル -> その間に届いたチャット
+        self._held: Dict[str, List[dict]] = {}
+        self._subscriptions: Set[Subscription] = set()
+
+        # 統計
+        self.frames_sent = 0
+        self.messages_sent = 0
+        self.dropped = 0
+        self.reconnects = 0
+
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def start(self):
+        """接続を管理するタスクを開始（待たない）"""
+        if self.closed:
+            self._raise_failure()
+            raise ConnectionError("client is closed")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
 
     async def connect(self):
-        """サーバーに接続"""
+        """サーバーに接続し、close() するまで（reconnect=False なら切断まで）待つ
+
+        サーバーが再接続しても無駄な理由で切断したら ConnectionError。
+        """
+        self.start()
+        await self._task
+        self._raise_failure()
+
+    async def wait_connected(self, timeout: Optional[float] = None):
+        """登録が済むまで待つ（再接続をやめたら ConnectionError）"""
+        self.start()
+        waiter = asyncio.ensure_future(self.connected.wait())
         try:
-            self.websocket = await websockets.connect(self.server_url)
+            await asyncio.wait(
+                (waiter, self._task),
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            waiter.cancel()
+        if self.connected.is_set():
+            return
+        if self._task.done():
+            self._raise_failure()
+            raise ConnectionError("client is closed")
+        raise asyncio.TimeoutError()
+
+    def _raise_failure(self):
+        if self.failure is not None:
+            raise ConnectionError(
+                f"closed by server: {self.failure['code']} {self.failure['reason']}"
+            )
 
-            # プレイヤーとして登録
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while not self.closed:
+            registered = False
+            try:
+                registered = await self._session()
+            except InvalidURI:
+                raise
+            except (OSError, ValueError, WebSocketException) as e:
+                # 接続できない・切断された・壊れたフレームが届いた
+                self.log(f"接続エラー: {e!r}")
+            if registered is None:
+                # 別のワーカーに誘導された
+                continue
+            if self.writer_error is not None and not self.closed:
+                # 送信できない状態で再接続しても送信キューが溜まるだけ
+                await self._fail()
+                break
+            if self.close_code in TERMINAL_CLOSE_CODES and not self.closed:
+                await self._fail()
+                break
+            if self.closed or not self.reconnect:
+                break
+            # すぐ切れる接続（奪い合いなど）では待ち時間を伸ばし続ける
+            stable = registered and loop.time() - self._registered_at >= self.stable_after
+            attempt = 0 if stable else attempt + 1
+            delay = min(self.max_backoff, self.backoff * 2**attempt)
+            # 一斉に再接続しないよう揺らす
+            delay *= random.uniform(0.5, 1.0)
+            self.reconnects += 1
+            self.log(f"🔁 {delay:.1f} 秒後に再接続します: {self.name}")
+            await asyncio.sleep(delay)
+
+    async def _session(self) -> Optional[bool]:
+        """1回分の接続。登録まで済んだら True、誘導されたら None"""
+        websocket = await websockets.connect(
+            self.server_url, **self.compression.connect_options()
+        )
+        self.websocket = websocket
+        self.close_code = None
+        self.close_reason = ""
+        writer = None
+        registered = False
+        try:
+            # プレイヤーとして登録（player_id があれば元のプレイヤーに戻る）
             register_msg = {
                 "type": "register",
                 "name": self.name,
                 "role": self.role,
+                "room": self.room,
             }
-            await self.websocket.send(json.dumps(register_msg))
+            if self.player_id:
+                register_msg["player_id"] = self.player_id
+                if self.resume_token:
+                    register_msg["resume_token"] = self.resume_token
+            if self.codec is not JSON:
+                register_msg["codec"] = self.codec.name
+            await websocket.send(json.dumps(register_msg))
+            writer = asyncio.create_task(self._writer(websocket))
+            writer.add_done_callback(
+                lambda task: self._writer_finished(task, websocket)
+            )
 
             # メッセージ受信ループ
-            async for message in self.websocket:
-                if self.on_message:
-                    await self.on_message(json.loads(message))
+            async for message in websocket:
+                data = self.codec.decode(message)
+                if data.get("type") == "redirect":
+                    # 部屋を担当するワーカーに接続し直す
+                    self.server_url = data["url"]
+                    return None
+                if data.get("type") == "system" and data.get("player_id"):
+                    registered = True
+                    await self._registered(data)
+                await self._receive(data)
+            return registered
+        finally:
+            self.connected.clear()
+            self.websocket = None
+            if writer is not None:
+                writer.cancel()
+                await asyncio.gather(writer, return_exceptions=True)
+            await websocket.close()
+            if websocket.close_code is not None:
+                self.close_code = websocket.close_code
+                self.close_reason = websocket.close_reason or ""
+            if registered:
+                await self._dispatch(
+                    {"type": "connection", "state": "disconnected"}
+                )
+
+    def _writer_finished(self, task: asyncio.Task, websocket):
+        """送信タスクが予期しないエラーで止まったら、接続を閉じて受信ループも終える"""
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None or isinstance(error, ConnectionClosed):
+            return
+        self.writer_error = error
+        print(f"⚠️ 送信タスクのエラー: {self.name}: {error!r}")
+        traceback.print_exception(error)
+        spawn(websocket.close(1011, "writer failed"), name=f"client-close:{self.name}")
+
+    async def _fail(self):
+        """再接続しても無駄な切断で止まる（送信キューは捨て、購読も終える）"""
+        self.failure = {"code": self.close_code, "reason": self.close_reason}
+        self.closed = True
+        self.log(f"⛔ 再接続をやめます: {self.close_code} {self.close_reason}")
+        self.dropped += len(self._outbox)
+        self._outbox.clear()
+        self._idle.set()
+        await self._dispatch({"type": "connection", "state": "failed", **self.failure})
+        for subscription in tuple(self._subscriptions):
+            subscription.close()
+
+    async def _registered(self, welcome: dict):
+        """登録（再接続）できたら、抜けたチャットを要求して送信を再開"""
+        # 再接続時に同じプレイヤーに戻れるよう ID を覚えておく
+        self._registered_at = asyncio.get_running_loop().time()
+        self.player_id = welcome["player_id"]
+        self.resume_token = welcome.get("resume_token", self.resume_token)
+        self.features = set(welcome.get("features") or ())
+        resumed = bool(welcome.get("resumed"))
+        if not resumed:
+            # 新しいプレイヤーとして登録された（通し番号が続いている保証はない）
+            self.last_seq.clear()
+        # 送信キューに溜まっているメッセージより先に送る
+        for channel, seq in self.last_seq.items():
+            self._held[channel] = []
+            self._outbox.appendleft(
+                {"type": "history", "channel": channel, "since": seq}
+            )
+        self.connected.set()
+        self._wakeup.set()
+        await self._dispatch(
+            {"type": "connection", "state": "connected", "resumed": resumed}
+        )
+
+    async def _receive(self, data: dict):
+        msg_type = data.get("type")
+        channel = data.get("channel")
+        if msg_type == "chat":
+            if channel in self._held:
+                # 取り戻し中の history より後に並べる
+                self._held[channel].append(data)
+                return
+            if not self._advance(data):
+                return
+        elif msg_type == "history" and channel in self._held:
+            await self._replay(channel, data.get("messages") or ())
+            return
+        elif msg_type == "error":
+            self.handle_error(data)
+            if data.get("request") == "history" and channel in self._held:
+                await self._replay(channel, ())
+        await self._dispatch(data)
+
+    def _advance(self, message: dict) -> bool:
+        """チャットの通し番号を進める（受信済みなら False）"""
+        channel = message.get("channel")
+        seq = message.get("seq")
+        if not isinstance(seq, int):
+            return True
+        if seq <= self.last_seq.get(channel, 0):
+            return False
+        self.last_seq[channel] = seq
+        return True
+
+    async def _replay(self, channel: str, messages: Iterable[dict]):
+        """取り戻したチャットと、その間に届いたチャットを順に渡す"""
+        held = self._held.pop(channel, [])
+        for message in list(messages) + held:
+            if self._advance(message):
+                await self._dispatch(message)
+
+    async def _dispatch(self, event: dict):
+        if self.on_message:
+            await self.on_message(event)
+        for subscription in tuple(self._subscriptions):
+            if subscription.matches(event):
+                subscription.put(event)
+
+    def events(
+        self,
+        channels: Optional[Iterable[str]] = None,
+        types: Optional[Iterable[str]] = None,
+        maxsize: int = 1000,
+    ) -> Subscription:
+        """受信イベントの購読（async for で受け取る）
+
+        channels / types を指定するとそのチャンネル・種類のイベントだけが届く。
+        接続の状態は {"type": "connection", "state": "connected" | "disconnected"} で届く。
+        再接続をやめたときは {"type": "connection", "state": "failed", "code", "reason"}。
+        """
+        subscription = Subscription(self, channels, types, maxsize)
+        if self.closed:
+            subscription.closed = True
+        else:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def __aiter__(self) -> Subscription:
+        return self.events()
+
+    def handle_error(self, error: dict):
+        """サーバーからのエラーを記録し、rate_limited なら retry_after 秒送信を止める"""
+        self.last_error = error
+        if error.get("code") == "rate_limited":
+            loop = asyncio.get_running_loop()
+            self._resume_at = max(
+                self._resume_at, loop.time() + float(error.get("retry_after") or 0)
+            )
 
-        except Exception as e:
-            print(f"接続エラー: {e}")
+    async def _writer(self, websocket):
+        """送信キューから取り出し、溜まっていればまとめて送る"""
+        await self.connected.wait()
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._outbox:
+                self._idle.set()
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            delay = self._resume_at - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            batch, data = await self._take_batch()
+            if not batch:
+                continue
+            if len(batch) > 1:
+                data = self.codec.encode({"type": "batch", "messages": batch})
+            try:
+                await websocket.send(data, text=self.codec.text)
+            except ConnectionClosed:
+                # 再接続後に送り直す
+                self._outbox.extendleft(reversed(batch))
+                raise
+            self.frames_sent += 1
+            self.messages_sent += len(batch)
+
+    async def _take_batch(self) -> Tuple[List[dict], bytes]:
+        """送信キューの先頭から1フレーム分を取り出す（と先頭のエンコード結果）
+
+        エンコードできないメッセージは捨て、error イベントで知らせる。
+        """
+        batch: List[dict] = []
+        first = b""
+        size = 0
+        limit = BATCH_MAX if "batch" in self.features else 1
+        while self._outbox and len(batch) < limit:
+            message = self._outbox[0]
+            try:
+                data = self.codec.encode(message)
+            except ENCODE_ERRORS as e:
+                self._outbox.popleft()
+                await self._drop_unencodable(message, e)
+                continue
+            size += len(data)
+            if batch and size > BATCH_BYTES:
+                break
+            if not batch:
+                first = data
+            batch.append(self._outbox.popleft())
+        return batch, first
+
+    async def _drop_unencodable(self, message: dict, error: Exception):
+        """エンコードできないメッセージを捨てたことを知らせる"""
+        self.dropped += 1
+        kind = message.get("type") if isinstance(message, dict) else None
+        self.log(f"⚠️ 送信できないメッセージを捨てました: {kind}: {error!r}")
+        event = {
+            "type": "error",
+            "code": "encode_failed",
+            "request": kind,
+            "message": f"送信できないメッセージを捨てました: {error}",
+        }
+        self.last_error = event
+        await self._dispatch(event)
+
+    async def send(self, message: dict):
+        """送信キューに追加（接続していなければ、つながってから送る）"""
+        if self.closed:
+            raise ConnectionError("client is closed")
+        if len(self._outbox) >= self.queue_size:
+            self._outbox.popleft()
+            self.dropped += 1
+        self._outbox.append(message)
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def flush(self, timeout: Optional[float] = None):
+        """送信キューが空になるまで待つ
+
+        送り切る前に接続を管理するタスクが終わったら（再接続をやめた・
+        reconnect=False で切断された・送信タスクがエラーで止まった）ConnectionError。
+        """
+        self._raise_failure()
+        if self._idle.is_set():
+            return
+        if self._task is None or self._task.done():
+            raise ConnectionError("client is not running")
+        waiter = asyncio.ensure_future(self._idle.wait())
+        try:
+            done, _ = await asyncio.wait(
+                (waiter, self._task),
+                timeout=timeout,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+        finally:
+            waiter.cancel()
+        if not done:
+            raise asyncio.TimeoutError()
+        self._raise_failure()
+        if not self._idle.is_set():
+            raise ConnectionError("client stopped before the queue was flushed")
 
     async def send_chat(self, content: str, channel: str = "public"):
         """チャットメッセージを送信"""
-        if self.websocket:
-            message = {
-                "type": "chat",
-                "channel": channel,
-                "content": content,
-            }
-            await self.websocket.send(json.dumps(message))
+        message = {
+            "type": "chat",
+            "channel": channel,
+            "content": content,
+        }
+        await self.send(message)
 
     async def send_action(self, action: str, **kwargs):
         """ゲームアクションを送信"""
-        if self.websocket:
-            message = {
-                "type": "action",
-                "action": action,
-                **kwargs,
-            }
-            await self.websocket.send(json.dumps(message))
+        message = {
+            "type": "action",
+            "action": action,
+            **kwargs,
+        }
+        await self.send(message)
 
-    async def close(self):
-        """接続を閉じる"""
-        if self.websocket:
-            await self.websocket.close()
+    async def request_history(
+        self, channel: str = "public", since: int = 0, limit: Optional[int] = None
+    ):
+        """通し番号 since より後の履歴を要求（結果は history メッセージで届く）"""
+        message = {
+            "type": "history",
+            "channel": channel,
+            "since": since,
+        }
+        if limit is not None:
+            message["limit"] = limit
+        await self.send(message)
 
+    async def query(self, text: Optional[str] = None, **filters):
+        """参加しているチャンネルの発言を検索（結果は query_result メッセージで届く）
 
-# 簡易テスト用の関数
-async def test_chat(name: str, role: str):
-    """テスト用チャットクライアント"""
+        filters: player, channel, phase, day, since, until, limit, id
+        """
+        message = {"type": "query", **filters}
+        if text is not None:
+            message["text"] = text
+        await self.send(message)
 
-    async def on_message(msg):
-        msg_type = msg.get("type")
-        if msg_type == "chat":
-            print(f"[{name}] {msg.get('player')}: {msg.get('content')}")
-        elif msg_type == "system":
-            print(f"[{name}] システム: {msg.get('message')}")
+    async def close(self, timeout: float = 5.0):
+        """送信キューを送り切ってから接続を閉じる"""
+        if self.closed:
+            return
+        if self.connected.is_set() and self._outbox:
+            try:
+                await self.flush(timeout)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        self.closed = True
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        for subscription in tuple(self._subscriptions):
+            subscription.close()
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected.is_set(),
+            "queued": len(self._outbox),
+            "frames_sent": self.frames_sent,
+            "messages_sent": self.messages_sent,
+            "dropped": self.dropped,
+            "reconnects": self.reconnects,
+        }
+
+
+def format_event(event: dict) -> str:
+    """イベントを1行の文字列に（--json を付けないときの表示）"""
+    msg_type = event.get("type")
+    if msg_type == "chat":
+        return f"[{event.get('channel')}] {event.get('player')}: {event.get('content')}"
+    if msg_type == "system":
+        return f"* {event.get('message')}"
+    if msg_type == "connection":
+        if event.get("state") == "failed":
+            return f"* failed: {event.get('code')} {event.get('reason')}"
+        return f"* {event.get('state')}"
+    if msg_type == "error":
+        return f"! {event.get('code')}: {event.get('message')}"
+    return json.dumps(event, ensure_ascii=False)
+
+
+async def run(args: "argparse.Namespace") -> int:
+    """標準入力の行を送り、受信したイベントを1行ずつ標準出力に書く
+
+    `{` で始まる行はそのままメッセージとして、それ以外は --channel へのチャットとして送る。
+    標準入力が終わったら送り切り、--linger 秒だけ受信してから終了する。
+    """
+    client = WerewolfClient(
+        args.url,
+        args.name,
+        args.role,
+        args.room,
+        codec=args.codec,
+        verbose=False,
+        compression=args.compression,
+    )
+    client.player_id = args.player_id
+    client.resume_token = args.resume_token
+
+    async def on_message(event: dict):
+        if args.json:
+            line = json.dumps(event, ensure_ascii=False)
+        else:
+            line = format_event(event)
+        print(line, flush=True)
 
-    client = WerewolfClient(name=name, role=role)
     client.on_message = on_message
+    client.start()
+
+    loop = asyncio.get_running_loop()
+    while client.failure is None:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            if line.startswith("{"):
+                try:
+                    await client.send(json.loads(line))
+                except ValueError as e:
+                    print(f"! invalid_json: {e}", flush=True)
+            else:
+                await client.send_chat(line, args.channel)
+        except ConnectionError:
+            # サーバーに切断されて再接続をやめた（failed は on_message で出力済み）
+            break
+
+    if client._outbox and client.failure is None:
+        # まだつながっていなければ、つながってから送り切る
+        try:
+            await client.wait_connected(args.timeout)
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+    if client.connected.is_set():
+        await client.flush(args.timeout)
+        await asyncio.sleep(args.linger)
+    await client.close(args.timeout)
+    return 1 if client.failure is not None else 0
+
+
+def parse_args(argv=None) -> "argparse.Namespace":
+    """コマンドライン引数を解析（ライブラリとして使うときは argparse を読み込まない）"""
+    import argparse
 
-    # 接続タスク
-    connect_task = asyncio.create_task(client.connect())
+    parser = argparse.ArgumentParser(
+        description="Werewolf chat client (標準入出力で1行ずつ送受信)"
+    )
+    parser.add_argument("--url", default="ws://localhost:8765")
+    parser.add_argument("--name", default="Anonymous")
+    parser.add_argument("--role", default="villager")
+    parser.add_argument("--room", default="default")
+    parser.add_argument("--player-id", help="元のプレイヤーに戻るときの ID")
+    parser.add_argument(
+        "--resume-token", help="元のプレイヤーに戻るときの合言葉（最初の登録で届いたもの）"
+    )
+    parser.add_argument("--channel", default="public", help="チャットの送信先")
+    parser.add_argument("--codec", choices=sorted(CODECS), default="json")
+    parser.add_argument(
+        "--compression",
+        type=parse_policy,
+        metavar="SPEC",
+        help="圧縮（off / on / window=15,mem=8,level=6,threshold=128,takeover=yes、既定: off）",
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="受信したイベントを JSON Lines で出力"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=5.0,
+        metavar="SECONDS",
+        help="終了時に送信キューを送り切るまで待つ秒数",
+    )
+    parser.add_argument(
+        "--linger",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="標準入力が終わってから受信を続ける秒数",
+    )
+    return parser.parse_args(argv)
 
-    # 少し待ってからメッセージを送信
-    await asyncio.sleep(1)
-    await client.send_chat(f"こんにちは、{name}です！")
 
-    # 維持
-    await connect_task
+def main(argv=None):
+    """メイン関数（werewolf-client コマンド）"""
+    try:
+        code = asyncio.run(run(parse_args(argv)))
+    except KeyboardInterrupt:
+        return
+    if code:
+        sys.exit(code)
 
 
 if __name__ == "__main__":
-    # テスト実行
-    print("テストクライアントを起動します...")
-    asyncio.run(test_chat("TestPlayer", "villager"))
+    main()
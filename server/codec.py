@@ -0,0 +1,434 @@
+"""
+werewolf-ai-battle Codecs
+
+送受信フレームの符号化方式。
+クライアントは register / godview の登録メッセージの "codec" で選ぶ（既定は json）。
+登録メッセージとその前の誘導（redirect）は常に JSON のテキストフレーム。
+
+binary はバイナリフレームで送る。よく流れるイベント（chat, channel_message,
+player_joined / player_updated / player_left）と差分の封筒（delta, deltas）は
+固定のスキーマで詰め、それ以外は JSON をそのまま埋め込む。
+
+    先頭1バイトがタグ。整数はリトルエンディアン
+    JSON            0  | UTF-8 の JSON
+    chat            1  | seq u32 | 実時刻(μs) i64 | channel sym | role sym | player str16 | content str32
+    channel_message 2  | channel sym | message
+    player_*        3  | 種類 u8 | id str16 | name str16 | role sym | フラグ u8（bit0 生存, bit1 接続中）
+    delta           4  | seq u64 | event
+    deltas          5  | from u64 | to u64 | 件数 u32 | (長さ u32 | delta) * 件数
+    channel_message 6  | channel sym | player_id str16 | message（神視点向けの発言者付き）
+    delta           7  | seq u64 | prev u64 | event（購読条件で絞り込んだ差分）
+
+    sym   : SYMBOLS の番号 u8（0xff なら str16 が続く）
+    str16 : 長さ u16 + UTF-8、str32 : 長さ u32 + UTF-8
+"""
+
+import json
+import struct
+from typing import TYPE_CHECKING, Dict, Optional, Tuple, Union
+
+from .records import ChatMessage, format_wall_us, parse_wall_us, wall_time_us
+
+if TYPE_CHECKING:
+    from .frames import Frame
+
+
+def dumps(message: dict) -> str:
+    """JSON にエンコード（送信フレーム用の詰めた形式）"""
+    return json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+
+
+class CodecError(ValueError):
+    """フレームを復号できない"""
+
+
+class Codec:
+    """符号化方式"""
+
+    name = ""
+    # テキストフレームで送るか（False ならバイナリフレーム）
+    text = True
+
+    def encode(self, message: dict) -> bytes:
+        raise NotImplementedError
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        """受信したフレームを復号（失敗したら ValueError）"""
+        raise NotImplementedError
+
+    def encode_frame(self, frame: "Frame") -> bytes:
+        """フレームをエンコード（Frame.encode からコーデックごとに一度だけ呼ばれる）"""
+        return self.encode(frame.message)
+
+
+class JsonCodec(Codec):
+    """JSON のテキストフレーム"""
+
+    name = "json"
+    text = True
+
+    def encode(self, message: dict) -> bytes:
+        return dumps(message).encode("utf-8")
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        return json.loads(data)
+
+    def encode_frame(self, frame: "Frame") -> bytes:
+        return frame.data
+
+
+# 名前の代わりに番号で送る文字列（チャンネル名と役職。末尾にだけ追加すること）
+SYMBOLS = ("public", "werewolf", "moderator", "villager", "seer")
+_SYMBOL_IDS = {name: i for i, name in enumerate(SYMBOLS)}
+_INLINE = 0xFF
+
+TAG_JSON = 0
+TAG_CHAT = 1
+TAG_CHANNEL_MESSAGE = 2
+TAG_PLAYER = 3
+TAG_DELTA = 4
+TAG_DELTAS = 5
+TAG_CHANNEL_MESSAGE_FROM = 6
+TAG_DELTA_PREV = 7
+
+PLAYER_EVENTS = ("player_joined", "player_updated", "player_left")
+_PLAYER_EVENT_IDS = {name: i for i, name in enumerate(PLAYER_EVENTS)}
+
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+_U64 = struct.Struct("<Q")
+_CHAT = struct.Struct("<BIq")
+_RANGE = struct.Struct("<BQQI")
+_SEQ_PREV = struct.Struct("<QQ")
+
+_CHAT_KEYS = {"type", "channel", "player", "role", "content", "seq", "timestamp"}
+_CHANNEL_MESSAGE_KEYS = {"type", "channel", "message"}
+_CHANNEL_MESSAGE_FROM_KEYS = {"type", "channel", "player_id", "message"}
+_PLAYER_EVENT_KEYS = {"type", "player"}
+_PLAYER_KEYS = {"id", "name", "role", "is_alive", "connected"}
+_DELTA_KEYS = {"type", "seq", "event"}
+_DELTA_PREV_KEYS = {"type", "seq", "prev", "event"}
+_DELTAS_KEYS = {"type", "from", "to", "deltas"}
+
+
+def _sym(value: str) -> bytes:
+    index = _SYMBOL_IDS.get(value)
+    if index is not None:
+        return _U8.pack(index)
+    return _U8.pack(_INLINE) + _str16(value)
+
+
+def _str16(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    return _U16.pack(len(raw)) + raw
+
+
+def _str32(value: str) -> bytes:
+    raw = value.encode("utf-8")
+    return _U32.pack(len(raw)) + raw
+
+
+def _flag(value) -> int:
+    if not isinstance(value, bool):
+        raise TypeError("flag must be bool")
+    return int(value)
+
+
+class BinaryCodec(Codec):
+    """固定スキーマのバイナリフレーム"""
+
+    name = "binary"
+    text = False
+
+    def encode(self, message: dict) -> bytes:
+        try:
+            data = self._encode_known(message)
+        except (struct.error, TypeError, ValueError, AttributeError, KeyError):
+            data = None
+        if data is None:
+            data = _U8.pack(TAG_JSON) + dumps(message).encode("utf-8")
+        return data
+
+    def _encode_known(self, message: dict) -> Optional[bytes]:
+        """スキーマのあるメッセージをエンコード（なければ None）"""
+        kind = message.get("type")
+        keys = message.keys()
+        if kind == "chat" and keys == _CHAT_KEYS:
+            return self._chat(
+                message["seq"],
+                parse_wall_us(message["timestamp"]),
+                message["channel"],
+                message["role"],
+                message["player"],
+                message["content"],
+            )
+        if kind == "channel_message" and keys == _CHANNEL_MESSAGE_KEYS:
+            return b"".join(
+                (
+                    _U8.pack(TAG_CHANNEL_MESSAGE),
+                    _sym(message["channel"]),
+                    self.encode(message["message"]),
+                )
+            )
+        if kind == "channel_message" and keys == _CHANNEL_MESSAGE_FROM_KEYS:
+            return self._channel_message_from(
+                message["channel"],
+                message["player_id"],
+                self.encode(message["message"]),
+            )
+        if kind in _PLAYER_EVENT_IDS and keys == _PLAYER_EVENT_KEYS:
+            player = message["player"]
+            if player.keys() == _PLAYER_KEYS:
+                return b"".join(
+                    (
+                        _U8.pack(TAG_PLAYER),
+                        _U8.pack(_PLAYER_EVENT_IDS[kind]),
+                        _str16(player["id"]),
+                        _str16(player["name"]),
+                        _sym(player["role"]),
+                        _U8.pack(
+                            _flag(player["is_alive"]) | _flag(player["connected"]) << 1
+                        ),
+                    )
+                )
+        if kind == "delta" and keys == _DELTA_KEYS:
+            return _U8.pack(TAG_DELTA) + _U64.pack(message["seq"]) + self.encode(
+                message["event"]
+            )
+        if kind == "delta" and keys == _DELTA_PREV_KEYS:
+            return (
+                _U8.pack(TAG_DELTA_PREV)
+                + _SEQ_PREV.pack(message["seq"], message["prev"])
+                + self.encode(message["event"])
+            )
+        if kind == "deltas" and keys == _DELTAS_KEYS:
+            return self._deltas(
+                message["from"],
+                message["to"],
+                [self.encode(delta) for delta in message["deltas"]],
+            )
+        return None
+
+    @staticmethod
+    def _chat(seq, wall_us, channel, role, player, content) -> bytes:
+        return b"".join(
+            (
+                _CHAT.pack(TAG_CHAT, seq, wall_us),
+                _sym(channel),
+                _sym(role),
+                _str16(player),
+                _str32(content),
+            )
+        )
+
+    @staticmethod
+    def _channel_message_from(channel: str, player_id: str, inner: bytes) -> bytes:
+        return b"".join(
+            (
+                _U8.pack(TAG_CHANNEL_MESSAGE_FROM),
+                _sym(channel),
+                _str16(player_id),
+                inner,
+            )
+        )
+
+    @staticmethod
+    def _deltas(first: int, last: int, items) -> bytes:
+        parts = [_RANGE.pack(TAG_DELTAS, first, last, len(items))]
+        for item in items:
+            parts.append(_U32.pack(len(item)))
+            parts.append(item)
+        return b"".join(parts)
+
+    def encode_frame(self, frame: "Frame") -> bytes:
+        """レコードと封筒から直接エンコード（埋め込んだフレームの結果を再利用）"""
+        try:
+            data = self._encode_parts(frame)
+        except (struct.error, TypeError, ValueError, AttributeError, KeyError):
+            data = None
+        if data is None:
+            return self.encode(frame.message)
+        return data
+
+    def _encode_parts(self, frame: "Frame") -> Optional[bytes]:
+        source = frame.source
+        if isinstance(source, ChatMessage):
+            return self._chat(
+                source.seq,
+                wall_time_us(source.time_ns),
+                source.channel,
+                source.role,
+                source.player,
+                source.content,
+            )
+
+        envelope = frame.envelope
+        if envelope is None:
+            return None
+        kind = envelope.get("type")
+        field = frame.field
+        inner = frame.inner
+        if kind == "channel_message" and field == "message" and len(envelope) == 2:
+            return b"".join(
+                (
+                    _U8.pack(TAG_CHANNEL_MESSAGE),
+                    _sym(envelope["channel"]),
+                    inner.encode(self),
+                )
+            )
+        if (
+            kind == "channel_message"
+            and field == "message"
+            and len(envelope) == 3
+            and "player_id" in envelope
+        ):
+            return self._channel_message_from(
+                envelope["channel"], envelope["player_id"], inner.encode(self)
+            )
+        if kind == "delta" and field == "event" and len(envelope) == 2:
+            return _U8.pack(TAG_DELTA) + _U64.pack(envelope["seq"]) + inner.encode(self)
+        if (
+            kind == "delta"
+            and field == "event"
+            and len(envelope) == 3
+            and "prev" in envelope
+        ):
+            return (
+                _U8.pack(TAG_DELTA_PREV)
+                + _SEQ_PREV.pack(envelope["seq"], envelope["prev"])
+                + inner.encode(self)
+            )
+        if kind == "deltas" and field == "deltas" and len(envelope) == 3:
+            return self._deltas(
+                envelope["from"], envelope["to"], [item.encode(self) for item in inner]
+            )
+        return None
+
+    def decode(self, data: Union[str, bytes]) -> dict:
+        # テキストフレームは JSON として受け付ける
+        if isinstance(data, str):
+            return json.loads(data)
+        try:
+            message, pos = self._read(data, 0, len(data))
+        except (struct.error, IndexError, UnicodeDecodeError, ValueError) as e:
+            raise CodecError(f"invalid binary frame: {e}") from None
+        if pos != len(data):
+            raise CodecError("trailing bytes in binary frame")
+        return message
+
+    def _read(self, data: bytes, pos: int, end: int) -> Tuple[dict, int]:
+        """data[pos:end] の1メッセージを復号し、読み終えた位置を返す"""
+        tag = data[pos]
+        if tag == TAG_JSON:
+            return json.loads(data[pos + 1 : end]), end
+        if tag == TAG_CHAT:
+            _, seq, wall_us = _CHAT.unpack_from(data, pos)
+            pos += _CHAT.size
+            channel, pos = _read_sym(data, pos, end)
+            role, pos = _read_sym(data, pos, end)
+            player, pos = _read_str(data, pos, end, _U16)
+            content, pos = _read_str(data, pos, end, _U32)
+            return {
+                "type": "chat",
+                "channel": channel,
+                "player": player,
+                "role": role,
+                "content": content,
+                "seq": seq,
+                "timestamp": format_wall_us(wall_us),
+            }, pos
+        if tag == TAG_CHANNEL_MESSAGE:
+            channel, pos = _read_sym(data, pos + 1, end)
+            message, pos = self._read(data, pos, end)
+            return {"type": "channel_message", "channel": channel, "message": message}, pos
+        if tag == TAG_CHANNEL_MESSAGE_FROM:
+            channel, pos = _read_sym(data, pos + 1, end)
+            player_id, pos = _read_str(data, pos, end, _U16)
+            message, pos = self._read(data, pos, end)
+            return {
+                "type": "channel_message",
+                "channel": channel,
+                "player_id": player_id,
+                "message": message,
+            }, pos
+        if tag == TAG_PLAYER:
+            kind = PLAYER_EVENTS[data[pos + 1]]
+            player_id, pos = _read_str(data, pos + 2, end, _U16)
+            name, pos = _read_str(data, pos, end, _U16)
+            role, pos = _read_sym(data, pos, end)
+            flags = data[pos]
+            player = {
+                "id": player_id,
+                "name": name,
+                "role": role,
+                "is_alive": bool(flags & 1),
+                "connected": bool(flags & 2),
+            }
+            return {"type": kind, "player": player}, pos + 1
+        if tag == TAG_DELTA:
+            (seq,) = _U64.unpack_from(data, pos + 1)
+            event, pos = self._read(data, pos + 1 + _U64.size, end)
+            return {"type": "delta", "seq": seq, "event": event}, pos
+        if tag == TAG_DELTA_PREV:
+            seq, prev = _SEQ_PREV.unpack_from(data, pos + 1)
+            event, pos = self._read(data, pos + 1 + _SEQ_PREV.size, end)
+            return {"type": "delta", "seq": seq, "prev": prev, "event": event}, pos
+        if tag == TAG_DELTAS:
+            _, first, last, count = _RANGE.unpack_from(data, pos)
+            pos += _RANGE.size
+            deltas = []
+            for _ in range(count):
+                (size,) = _U32.unpack_from(data, pos)
+                pos += _U32.size
+                if pos + size > end:
+                    raise CodecError("truncated delta")
+                delta, read = self._read(data, pos, pos + size)
+                if read != pos + size:
+                    raise CodecError("malformed delta")
+                deltas.append(delta)
+                pos += size
+            return {"type": "deltas", "from": first, "to": last, "deltas": deltas}, pos
+        raise CodecError(f"unknown tag: {tag}")
+
+
+def _read_str(data: bytes, pos: int, end: int, length: struct.Struct) -> Tuple[str, int]:
+    (size,) = length.unpack_from(data, pos)
+    pos += length.size
+    if pos + size > end:
+        raise CodecError("truncated string")
+    return bytes(data[pos : pos + size]).decode("utf-8"), pos + size
+
+
+def _read_sym(data: bytes, pos: int, end: int) -> Tuple[str, int]:
+    index = data[pos]
+    if index == _INLINE:
+        return _read_str(data, pos + 1, end, _U16)
+    return SYMBOLS[index], pos + 1
+
+
+JSON = JsonCodec()
+BINARY = BinaryCodec()
+
+# 登録メッセージの "codec" で選べるコーデック
+CODECS: Dict[str, Codec] = {codec.name: codec for codec in (JSON, BINARY)}
+
+
+def get_codec(name: Optional[str]) -> Optional[Codec]:
+    """名前からコーデックを求める（省略時は JSON、未知なら None）"""
+    if name is None:
+        return JSON
+    return CODECS.get(name)
+
+
+def unknown_codec_error(name) -> str:
+    """未知のコーデックを指定した登録への応答（JSON テキスト）"""
+    return json.dumps(
+        {
+            "type": "error",
+            "code": "unknown_codec",
+            "request": "codec",
+            "message": f"コーデック {name} には対応していません",
+        },
+        ensure_ascii=False,
+    )
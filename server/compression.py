@@ -0,0 +1,280 @@
+"""
+werewolf-ai-battle Compression
+
+接続の種類（プレイヤー・神視点・中継）ごとの WebSocket 圧縮（permessage-deflate）の設定。
+
+- player: 同じマシンで動くエージェントが多いので既定では圧縮しない
+- godview / relay: 細い回線の先にいることが多いので圧縮する
+
+接続の種類は接続先のパス（/godview, /relay、それ以外はプレイヤー）で決まり、
+サーバーはハンドシェイクの時点でその種類の設定を提示する。
+threshold バイト未満のフレームは圧縮せずにそのまま送る。
+
+context_takeover=False（メッセージごとに辞書を捨てる）にすると、同じ設定の接続には
+同じフレームが同じバイト列に圧縮されるので、ブロードキャストでは最初の1回だけ圧縮して
+残りの接続には結果を使い回す（圧縮率は下がるが、CPU は受信者数に比例しなくなる）。
+"""
+
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from websockets.extensions.permessage_deflate import (
+    ClientPerMessageDeflateFactory,
+    PerMessageDeflate,
+    ServerPerMessageDeflateFactory,
+)
+from websockets.frames import CONT, CTRL_OPCODES, Frame
+
+PLAYER = "player"
+GODVIEW = "godview"
+RELAY = "relay"
+CLIENT_CLASSES = (PLAYER, GODVIEW, RELAY)
+
+# ブロードキャスト用に保持する圧縮済みフレームの数
+CACHE_SIZE = 256
+
+
+class DeflateCache:
+    """圧縮済みフレームの使い回し（元のバイト列 -> 圧縮結果、古いものから捨てる）"""
+
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries: Dict[bytes, bytes] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, data: bytes) -> Optional[bytes]:
+        compressed = self.entries.get(data)
+        if compressed is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return compressed
+
+    def put(self, data: bytes, compressed: bytes):
+        if len(self.entries) >= self.maxsize:
+            del self.entries[next(iter(self.entries))]
+        self.entries[data] = compressed
+
+
+class CompressionPolicy:
+    """permessage-deflate の設定（enabled=False なら圧縮を提示しない）"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        window_bits: int = 15,
+        mem_level: int = 8,
+        level: int = 6,
+        threshold: int = 128,
+        context_takeover: bool = True,
+    ):
+        if not 9 <= window_bits <= 15:
+            raise ValueError("window_bits must be between 9 and 15")
+        if not 1 <= mem_level <= 9:
+            raise ValueError("mem_level must be between 1 and 9")
+        if not 0 <= level <= 9:
+            raise ValueError("level must be between 0 and 9")
+        self.enabled = enabled
+        self.window_bits = window_bits
+        self.mem_level = mem_level
+        self.level = level
+        self.threshold = threshold
+        self.context_takeover = context_takeover
+        # 辞書を持ち越さない接続で共有する圧縮済みフレーム（ウィンドウサイズごと）
+        self.caches: Dict[int, DeflateCache] = {}
+
+    def cache(self, window_bits: int) -> DeflateCache:
+        cache = self.caches.get(window_bits)
+        if cache is None:
+            cache = self.caches[window_bits] = DeflateCache()
+        return cache
+
+    def compress_settings(self) -> dict:
+        return {"memLevel": self.mem_level, "level": self.level}
+
+    def server_extensions(self) -> list:
+        """サーバー側でハンドシェイクに使う拡張（圧縮しないなら空）"""
+        if not self.enabled:
+            return []
+        return [ServerDeflateFactory(self)]
+
+    def client_extensions(self) -> Optional[list]:
+        """クライアント側で提示する拡張（圧縮しないなら None）"""
+        if not self.enabled:
+            return None
+        return [ClientDeflateFactory(self)]
+
+    def connect_options(self) -> dict:
+        """websockets.connect に渡す圧縮の設定"""
+        extensions = self.client_extensions()
+        if extensions is None:
+            return {"compression": None}
+        return {"compression": None, "extensions": extensions}
+
+    def to_dict(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "window_bits": self.window_bits,
+            "mem_level": self.mem_level,
+            "level": self.level,
+            "threshold": self.threshold,
+            "context_takeover": self.context_takeover,
+        }
+
+    def __repr__(self) -> str:
+        return f"CompressionPolicy({format_policy(self)})"
+
+
+# 接続の種類ごとの既定の設定
+# 観戦者は数が多いので接続あたりのメモリが小さい設定（websockets の既定と同じ）、
+# 中継は部屋ごとに1本なので圧縮率の高い設定
+DEFAULT_POLICIES: Dict[str, CompressionPolicy] = {
+    PLAYER: CompressionPolicy(enabled=False),
+    GODVIEW: CompressionPolicy(window_bits=12, mem_level=5),
+    RELAY: CompressionPolicy(),
+}
+
+_SPEC_KEYS = {
+    "window": "window_bits",
+    "mem": "mem_level",
+    "level": "level",
+    "threshold": "threshold",
+}
+
+
+def parse_policy(value: str) -> CompressionPolicy:
+    """'off' / 'on' / 'window=12,mem=5,level=6,threshold=256,takeover=no' を設定に"""
+    value = value.strip()
+    if value in ("off", "none", "0"):
+        return CompressionPolicy(enabled=False)
+    options = {}
+    if value not in ("on", ""):
+        for part in value.split(","):
+            key, _, raw = part.partition("=")
+            key = key.strip()
+            raw = raw.strip()
+            if key == "takeover":
+                if raw not in ("yes", "no"):
+                    raise ValueError("takeover must be yes or no")
+                options["context_takeover"] = raw == "yes"
+            elif key in _SPEC_KEYS:
+                options[_SPEC_KEYS[key]] = int(raw)
+            else:
+                raise ValueError(f"unknown compression option: {key}")
+    return CompressionPolicy(**options)
+
+
+def format_policy(policy: CompressionPolicy) -> str:
+    """parse_policy の逆"""
+    if not policy.enabled:
+        return "off"
+    return (
+        f"window={policy.window_bits},mem={policy.mem_level},level={policy.level},"
+        f"threshold={policy.threshold},"
+        f"takeover={'yes' if policy.context_takeover else 'no'}"
+    )
+
+
+def client_class(path: str) -> str:
+    """接続先のパスから接続の種類を決める"""
+    name = path.split("?", 1)[0].strip("/")
+    return name if name in (GODVIEW, RELAY) else PLAYER
+
+
+def class_url(url: str, kind: str) -> str:
+    """接続の種類をパスで伝える URL（パスが指定済みならそのまま）"""
+    parts = urlsplit(url)
+    if kind == PLAYER or parts.path not in ("", "/"):
+        return url
+    return urlunsplit(parts._replace(path=f"/{kind}"))
+
+
+def negotiator(policies: Dict[str, CompressionPolicy]):
+    """接続のパスに応じて圧縮の設定を選ぶ websockets.serve の process_request"""
+    extensions = {kind: policy.server_extensions() for kind, policy in policies.items()}
+
+    def process_request(connection, request):
+        kind = client_class(request.path)
+        connection.protocol.available_extensions = extensions.get(kind, [])
+        return None
+
+    return process_request
+
+
+class ThresholdDeflate(PerMessageDeflate):
+    """小さいフレームは圧縮せず、辞書を持ち越さないなら圧縮結果を使い回す"""
+
+    def __init__(self, extension: PerMessageDeflate, policy: CompressionPolicy):
+        super().__init__(
+            extension.remote_no_context_takeover,
+            extension.local_no_context_takeover,
+            extension.remote_max_window_bits,
+            extension.local_max_window_bits,
+            extension.compress_settings,
+        )
+        self.threshold = policy.threshold
+        # 辞書を持ち越さない（相手が要求した場合も含む）ときだけ同じ結果になる
+        self.cache = None
+        if extension.local_no_context_takeover:
+            self.cache = policy.cache(extension.local_max_window_bits)
+        self._raw = False
+
+    def encode(self, frame: Frame) -> Frame:
+        if frame.opcode in CTRL_OPCODES:
+            return frame
+        if frame.opcode is not CONT:
+            # 圧縮するかどうかはメッセージの最初のフレームで決める
+            self._raw = len(frame.data) < self.threshold
+        if self._raw:
+            return frame
+
+        data = frame.data
+        if (
+            self.cache is None
+            or frame.opcode is CONT
+            or not frame.fin
+            or type(data) is not bytes
+        ):
+            return super().encode(frame)
+        compressed = self.cache.get(data)
+        if compressed is None:
+            compressed = bytes(super().encode(frame).data)
+            self.cache.put(data, compressed)
+        return Frame(frame.opcode, compressed, True, True, frame.rsv2, frame.rsv3)
+
+
+class ServerDeflateFactory(ServerPerMessageDeflateFactory):
+    """CompressionPolicy に従うサーバー側の permessage-deflate"""
+
+    def __init__(self, policy: CompressionPolicy):
+        super().__init__(
+            server_no_context_takeover=not policy.context_takeover,
+            server_max_window_bits=policy.window_bits,
+            compress_settings=policy.compress_settings(),
+        )
+        self.policy = policy
+
+    def process_request_params(self, params, accepted_extensions):
+        response, extension = super().process_request_params(
+            params, accepted_extensions
+        )
+        return response, ThresholdDeflate(extension, self.policy)
+
+
+class ClientDeflateFactory(ClientPerMessageDeflateFactory):
+    """CompressionPolicy に従うクライアント側の permessage-deflate"""
+
+    def __init__(self, policy: CompressionPolicy):
+        super().__init__(
+            client_no_context_takeover=not policy.context_takeover,
+            client_max_window_bits=policy.window_bits,
+            compress_settings=policy.compress_settings(),
+        )
+        self.policy = policy
+
+    def process_response_params(self, params, accepted_extensions):
+        extension = super().process_response_params(params, accepted_extensions)
+        return ThresholdDeflate(extension, self.policy)
@@ -0,0 +1,160 @@
+"""
+werewolf-ai-battle Frames
+
+イベントを一度だけシリアライズした送信フレーム。
+同じフレームを全ての受信者で共有し、受信者ごとの json.dumps をなくす。
+
+dict はレコードや埋め込み元から必要になったときに作る。
+エンコード結果はコーデックごとに一度だけ作って保持する（data は JSON）。
+"""
+
+from typing import Dict, Optional, Sequence, Union
+
+from .codec import JSON, Codec, dumps as _dumps
+
+
+class Frame:
+    """一度だけエンコードされる送信フレーム（変更しないこと）"""
+
+    __slots__ = (
+        "_message",
+        "_source",
+        "_data",
+        "_encodings",
+        "_envelope",
+        "_field",
+        "_inner",
+    )
+
+    def __init__(self, message: Optional[dict] = None, source=None):
+        self._message = message
+        # to_dict() を持つレコード（message を遅延生成する）
+        self._source = source
+        self._data: Optional[bytes] = None
+        # JSON 以外のコーデックのエンコード結果（コーデック名 -> バイト列）
+        self._encodings: Optional[Dict[str, bytes]] = None
+        self._envelope: Optional[dict] = None
+        self._field = ""
+        self._inner: Union["Frame", Sequence["Frame"], None] = None
+
+    @classmethod
+    def from_record(cls, record) -> "Frame":
+        """レコードから作るフレーム（dict はエンコード時か message 参照時に作る）"""
+        return cls(None, record)
+
+    @property
+    def message(self) -> dict:
+        """メッセージの dict（初回のみ作成）"""
+        if self._message is None:
+            if self._source is not None:
+                self._message = self._source.to_dict()
+            else:
+                message = dict(self._envelope)
+                if isinstance(self._inner, Frame):
+                    message[self._field] = self._inner.message
+                else:
+                    message[self._field] = [frame.message for frame in self._inner]
+                self._message = message
+        return self._message
+
+    @property
+    def type(self) -> Optional[str]:
+        """メッセージの種類（dict を作らずに求める）"""
+        if self._envelope is not None:
+            return self._envelope.get("type")
+        if self._message is not None:
+            return self._message.get("type")
+        if self._source is not None:
+            return self._source.type
+        return self.message.get("type")
+
+    def get(self, key: str, default=None):
+        """メッセージのトップレベルの値（封筒があれば dict を作らずに封筒から）"""
+        if self._envelope is not None:
+            return self._envelope.get(key, default)
+        return self.message.get(key, default)
+
+    @property
+    def text(self) -> str:
+        """JSON 文字列"""
+        return self.data.decode("utf-8")
+
+    @property
+    def data(self) -> bytes:
+        """UTF-8 バイト列（初回のみエンコード。テキストフレームとしてそのまま送信できる）"""
+        if self._data is None:
+            if self._envelope is not None:
+                self._data = self._compose()
+            elif self._message is not None:
+                self._data = _dumps(self._message).encode("utf-8")
+            else:
+                self._data = _dumps(self._source.to_dict()).encode("utf-8")
+        return self._data
+
+    def encode(self, codec: Codec) -> bytes:
+        """codec でエンコードしたバイト列（コーデックごとに初回のみエンコード）"""
+        if codec.name == JSON.name:
+            return self.data
+        if self._encodings is None:
+            self._encodings = {}
+        data = self._encodings.get(codec.name)
+        if data is None:
+            data = self._encodings[codec.name] = codec.encode_frame(self)
+        return data
+
+    @property
+    def source(self):
+        """元のレコード（なければ None）"""
+        return self._source
+
+    @property
+    def envelope(self) -> Optional[dict]:
+        """wrap で作ったフレームの封筒（なければ None）"""
+        return self._envelope
+
+    @property
+    def field(self) -> str:
+        return self._field
+
+    @property
+    def inner(self) -> Union["Frame", Sequence["Frame"], None]:
+        """wrap で埋め込んだフレーム（またはその列）"""
+        return self._inner
+
+    @classmethod
+    def wrap(
+        cls, envelope: dict, field: str, inner: Union["Frame", Sequence["Frame"]]
+    ) -> "Frame":
+        """inner のエンコード結果を再利用し、envelope[field] に埋め込んだフレーム
+
+        inner にフレームの列を渡すと JSON 配列として埋め込む。
+        エンコードは data を初めて参照したときに行う。envelope は変更しないこと
+        （同じ envelope を複数のフレームで共有してよい）。
+        """
+        if not isinstance(inner, Frame):
+            inner = tuple(inner)
+        frame = cls()
+        frame._envelope = envelope
+        frame._field = field
+        frame._inner = inner
+        return frame
+
+    def _compose(self) -> bytes:
+        head = _dumps(self._envelope).encode("utf-8")
+        if isinstance(self._inner, Frame):
+            body = self._inner.data
+        else:
+            body = b"[" + b",".join(frame.data for frame in self._inner) + b"]"
+        return b"".join(
+            (
+                head[:-1],
+                b"," if self._envelope else b"",
+                _dumps(self._field).encode("utf-8"),
+                b":",
+                body,
+                b"}",
+            )
+        )
+
+    def __len__(self) -> int:
+        return len(self.data)
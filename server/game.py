@@ -0,0 +1,383 @@
+"""
+werewolf-ai-battle Game Engine
+
+部屋ごとのフェーズ進行（昼の議論 → 投票 → 夜の行動 → 朝）。
+投票・襲撃・占いは action メッセージで受け付け、1票ごとに O(1) で集計する。
+フェーズの期限は全ての部屋で共有する TimerWheel で管理し、
+全員が行動し終えたら期限を待たずに次へ進む。
+"""
+
+import time
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from .tasks import spawn
+from .timerwheel import Timer, TimerWheel
+
+if TYPE_CHECKING:
+    from .room import GameRoom, Player
+
+# フェーズ
+WAITING = "waiting"
+DAY = "day"
+VOTE = "vote"
+NIGHT = "night"
+ENDED = "ended"
+
+# フェーズの長さ（秒）
+DEFAULT_DURATIONS: Dict[str, float] = {DAY: 120.0, VOTE: 30.0, NIGHT: 60.0}
+
+# 夜に行動する役職とその行動
+NIGHT_ACTIONS: Dict[str, str] = {"werewolf": "attack", "seer": "divine"}
+
+# ゲームに参加しない役職
+OBSERVER_ROLES = ("moderator",)
+
+# 勝者
+VILLAGERS = "villagers"
+WEREWOLVES = "werewolves"
+
+
+def winner(players: Iterable["Player"]) -> Optional[str]:
+    """勝敗判定（決着していなければ None）"""
+    wolves = others = 0
+    for player in players:
+        if not player.is_alive or player.role in OBSERVER_ROLES:
+            continue
+        if player.role == "werewolf":
+            wolves += 1
+        else:
+            others += 1
+    if wolves == 0:
+        return VILLAGERS
+    if wolves >= others:
+        return WEREWOLVES
+    return None
+
+
+class Tally:
+    """投票先・襲撃先の集計（投票や変更ごとに O(1) で更新）"""
+
+    def __init__(self):
+        # 投票者 -> 対象
+        self.choices: Dict[str, str] = {}
+        # 対象 -> 票数
+        self.counts: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.choices)
+
+    def cast(self, voter: str, target: str):
+        """投票（投票し直すと前の票は取り消される）"""
+        old = self.choices.get(voter)
+        if old == target:
+            return
+        if old is not None:
+            self._decrement(old)
+        self.choices[voter] = target
+        self.counts[target] = self.counts.get(target, 0) + 1
+
+    def withdraw(self, voter: str):
+        """票を取り消す"""
+        old = self.choices.pop(voter, None)
+        if old is not None:
+            self._decrement(old)
+
+    def _decrement(self, target: str):
+        count = self.counts[target] - 1
+        if count:
+            self.counts[target] = count
+        else:
+            del self.counts[target]
+
+    def leader(self) -> Optional[str]:
+        """最多得票の対象（同数なら None）"""
+        best = None
+        best_count = 0
+        tied = False
+        for target, count in self.counts.items():
+            if count > best_count:
+                best, best_count, tied = target, count, False
+            elif count == best_count:
+                tied = True
+        return None if tied else best
+
+    def clear(self):
+        self.choices.clear()
+        self.counts.clear()
+
+
+class WerewolfGame:
+    """部屋ごとのゲーム進行"""
+
+    def __init__(
+        self,
+        room: "GameRoom",
+        timers: Optional[TimerWheel] = None,
+        durations: Optional[Dict[str, float]] = None,
+    ):
+        self.room = room
+        self.timers = timers
+        self.durations = dict(DEFAULT_DURATIONS)
+        if durations:
+            self.durations.update(durations)
+
+        self.phase = WAITING
+        self.day = 0
+        self.deadline: Optional[float] = None
+        self.result: Optional[str] = None
+
+        self.votes = Tally()
+        self.attacks = Tally()
+        self.divinations: Dict[str, str] = {}
+        # 現在のフェーズで行動するプレイヤーの数（揃ったら早く進める）
+        self.expected = 0
+
+        self._timer: Optional[Timer] = None
+        self._advancing = False
+
+    def participants(self) -> List["Player"]:
+        """ゲームに参加している生存プレイヤー"""
+        return [
+            p
+            for p in self.room.players.values()
+            if p.is_alive and p.role not in OBSERVER_ROLES
+        ]
+
+    def roster(self) -> List[dict]:
+        """プレイヤーに知らせる参加者の一覧（行動の対象に使う ID と名前・生死、役職は含めない）"""
+        return [
+            {"id": p.id, "name": p.name, "is_alive": p.is_alive}
+            for p in self.room.players.values()
+            if p.role not in OBSERVER_ROLES
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            "phase": self.phase,
+            "day": self.day,
+            "deadline": self.deadline,
+            "result": self.result,
+        }
+
+    def stop(self):
+        """期限のタイマーを止める（部屋を片付けるとき）"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    async def start(self) -> Optional[str]:
+        """1日目の昼から開始（エラーコードを返す）"""
+        if self.phase not in (WAITING, ENDED):
+            return "already_started"
+        if winner(self.room.players.values()) is not None:
+            return "not_enough_players"
+        self.day = 1
+        self.result = None
+        await self._enter(DAY)
+        return None
+
+    async def advance(self):
+        """現在のフェーズを締めて次のフェーズへ"""
+        if self._advancing or self.phase in (WAITING, ENDED):
+            return
+        self._advancing = True
+        try:
+            if self.phase == DAY:
+                await self._enter(VOTE)
+            elif self.phase == VOTE:
+                await self._resolve_vote()
+                if not await self._check_end():
+                    await self._enter(NIGHT)
+            elif self.phase == NIGHT:
+                await self._resolve_night()
+                if not await self._check_end():
+                    self.day += 1
+                    await self._enter(DAY)
+        finally:
+            self._advancing = False
+
+    async def _enter(self, phase: str):
+        """フェーズを切り替え、期限を設定して全員に通知"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        self.phase = phase
+        self.votes.clear()
+        self.attacks.clear()
+        self.divinations.clear()
+        alive = self.participants()
+        if phase == VOTE:
+            self.expected = len(alive)
+        elif phase == NIGHT:
+            self.expected = sum(1 for p in alive if p.role in NIGHT_ACTIONS)
+        else:
+            self.expected = 0
+
+        duration = self.durations.get(phase, 0)
+        self.deadline = None
+        if self.timers is not None and duration > 0:
+            self.deadline = time.time() + duration
+            self._timer = self.timers.schedule(
+                duration, self._on_deadline, phase, self.day
+            )
+
+        self.room._record("phase", {"phase": phase, "day": self.day})
+        await self._announce(
+            {
+                "type": "phase",
+                **self.to_dict(),
+                "duration": duration,
+                "players": self.roster(),
+            }
+        )
+
+    def _on_deadline(self, phase: str, day: int):
+        # 期限までに別のフェーズに進んでいれば何もしない
+        if self.phase == phase and self.day == day:
+            spawn(self.advance(), f"advance {self.room.id} {phase} {day}")
+
+    async def _announce(self, message: dict):
+        """全プレイヤーと神視点に通知"""
+        self.room.broadcast_to_players(message)
+        await self.room.broadcast_godview(message)
+
+    async def _resolve_vote(self):
+        """最多得票のプレイヤーを処刑（同数なら処刑なし）"""
+        executed = self.votes.leader()
+        if executed is not None:
+            await self.room.set_alive(executed, False)
+        await self._announce(
+            {
+                "type": "phase_result",
+                "phase": VOTE,
+                "day": self.day,
+                "executed": executed,
+                "tally": dict(self.votes.counts),
+            }
+        )
+
+    async def _resolve_night(self):
+        """襲撃と占いの結果を反映"""
+        killed = self.attacks.leader()
+        if killed is not None:
+            await self.room.set_alive(killed, False)
+
+        for seer_id, target_id in self.divinations.items():
+            target = self.room.players.get(target_id)
+            if target is not None:
+                await self.room.send_to_player(
+                    seer_id,
+                    {
+                        "type": "divination",
+                        "day": self.day,
+                        "target": target_id,
+                        "werewolf": target.role == "werewolf",
+                    },
+                )
+
+        await self.room.broadcast_godview(
+            {
+                "type": "night_actions",
+                "day": self.day,
+                "attacks": dict(self.attacks.counts),
+                "divinations": dict(self.divinations),
+            }
+        )
+        await self._announce(
+            {"type": "phase_result", "phase": NIGHT, "day": self.day, "killed": killed}
+        )
+
+    async def _check_end(self) -> bool:
+        """決着していればゲームを終える"""
+        result = winner(self.room.players.values())
+        if result is None:
+            return False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.phase = ENDED
+        self.result = result
+        self.deadline = None
+        self.room._record("game_over", {"winner": result, "day": self.day})
+        await self._announce(
+            {
+                "type": "game_over",
+                "winner": result,
+                "day": self.day,
+                "players": [p.to_dict() for p in self.room.players.values()],
+            }
+        )
+        return True
+
+    def _valid_target(self, target_id) -> bool:
+        target = self.room.players.get(target_id)
+        return (
+            target is not None
+            and target.is_alive
+            and target.role not in OBSERVER_ROLES
+        )
+
+    def check_action(self, player_id: str, action: dict) -> Optional[str]:
+        """ゲームアクションを受け付けられるか調べ、だめならエラーコードを返す
+
+        ゲームに関係しない action はそのまま受け付ける。
+        """
+        kind = action.get("action")
+        target = action.get("target")
+        player = self.room.players.get(player_id)
+        if player is None:
+            return "not_registered"
+
+        if kind in ("start", "next"):
+            if player.role != "moderator":
+                return "not_allowed"
+            if kind == "start" and self.phase not in (WAITING, ENDED):
+                return "already_started"
+            if kind == "start" and winner(self.room.players.values()) is not None:
+                return "not_enough_players"
+            return None
+
+        if kind == "vote":
+            if self.phase != VOTE:
+                return "wrong_phase"
+            if not player.is_alive or player.role in OBSERVER_ROLES:
+                return "not_allowed"
+            if target == player_id or not self._valid_target(target):
+                return "invalid_target"
+            return None
+
+        if kind in ("attack", "divine"):
+            if self.phase != NIGHT:
+                return "wrong_phase"
+            if not player.is_alive or NIGHT_ACTIONS.get(player.role) != kind:
+                return "not_allowed"
+            if not self._valid_target(target):
+                return "invalid_target"
+            if kind == "attack" and self.room.players[target].role == "werewolf":
+                return "invalid_target"
+            return None
+
+        return None
+
+    async def apply_action(self, player_id: str, action: dict):
+        """check_action で受け付けたアクションを反映"""
+        kind = action.get("action")
+        target = action.get("target")
+
+        if kind == "start":
+            await self.start()
+        elif kind == "next":
+            await self.advance()
+        elif kind == "vote":
+            self.votes.cast(player_id, target)
+            if len(self.votes) >= self.expected:
+                await self.advance()
+        elif kind == "attack":
+            self.attacks.cast(player_id, target)
+            if len(self.attacks) + len(self.divinations) >= self.expected:
+                await self.advance()
+        elif kind == "divine":
+            self.divinations[player_id] = target
+            if len(self.attacks) + len(self.divinations) >= self.expected:
+                await self.advance()
@@ -4,39 +4,92 @@ werewolf-ai-battle Godview CLI
 
 神視点でゲーム全体を監視するCLIツール。
 全てのチャットメッセージとプレイヤーの状態をリアルタイムで表示。
+
+rich は描画するときに読み込む（中継モードでは読み込まない）。
 """
 
+import argparse
 import asyncio
 import websockets
+import websockets.exceptions
 import json
-from datetime import datetime
-from rich.console import Console
-from rich.layout import Layout
-from rich.panel import Panel
-from rich.table import Table
-from rich.text import Text
-from rich import box
-from rich.live import Live
-from rich.align import Align
+from itertools import islice
+from typing import TYPE_CHECKING, List, Optional, Set, Union
+
+from .codec import CODECS, JSON, get_codec
+from .compression import (
+    DEFAULT_POLICIES,
+    GODVIEW,
+    CompressionPolicy,
+    class_url,
+    parse_policy,
+)
+from .outbound import DROP_OLDEST, SLOW_CONSUMER_POLICIES
+from .viewmodel import CHANNEL_PREFIX, GodviewState
+
+if TYPE_CHECKING:
+    from rich.console import Console
+    from rich.layout import Layout
+    from rich.live import Live
+    from rich.panel import Panel
+    from rich.table import Table
+
+# 個別に再描画されるパネル
+PANELS = ("players", "chat", "events", "stats")
 
 
 class WerewolfGodview:
     """神視点クライアント"""
 
-    def __init__(self, server_url: str = "ws://localhost:8765"):
+    def __init__(
+        self,
+        server_url: str = "ws://localhost:8765",
+        room: str = "default",
+        max_fps: float = 10,
+        console: Optional["Console"] = None,
+        stats_interval: float = 2.0,
+        codec: str = "json",
+        compression: Optional[CompressionPolicy] = None,
+        channel: str = "public",
+        subscription: Optional[dict] = None,
+    ):
         self.server_url = server_url
-        self.console = Console()
-        self.players = []
-        self.messages = {
-            "public": [],
-            "werewolf": [],
-            "moderator": [],
-        }
-        self.events = []
-        self.current_channel = "public"
-
-    def create_header(self) -> Panel:
+        self.room = room
+        self.max_fps = max_fps
+        self.stats_interval = stats_interval
+        self.codec = get_codec(codec)
+        if self.codec is None:
+            raise ValueError(f"unknown codec: {codec}")
+        self.compression = compression or DEFAULT_POLICIES[GODVIEW]
+        self._console = console
+        self.state = GodviewState()
+        self.current_channel = channel
+        # 表示するチャンネル以外の発言はサーバー側で絞り込んで受け取らない
+        self.state.subscription = subscription or {"channels": [channel]}
+
+        # 再描画が必要なパネル（メッセージ受信時に印を付け、描画ループで処理）
+        self.dirty: Set[str] = set(PANELS)
+        self.layout: Optional["Layout"] = None
+        self.renders = 0
+
+    @property
+    def console(self) -> "Console":
+        if self._console is None:
+            from rich.console import Console
+
+            self._console = Console()
+        return self._console
+
+    def mark_dirty(self, *panels: str):
+        """パネルに再描画の印を付ける"""
+        self.dirty.update(panels)
+
+    def create_header(self) -> "Panel":
         """ヘッダーを作成"""
+        from rich.align import Align
+        from rich.panel import Panel
+        from rich.text import Text
+
         header_text = Text()
         header_text.append("🐺 ", style="bold red")
         header_text.append("WEREWOLF AI BATTLE", style="bold magenta")
@@ -48,8 +101,12 @@ class WerewolfGodview:
             height=3,
         )
 
-    def create_player_table(self) -> Table:
+    def create_player_table(self) -> "Table":
         """プレイヤーテーブルを作成"""
+        from rich import box
+        from rich.table import Table
+        from rich.text import Text
+
         table = Table(
             title="プレイヤー一覧",
             box=box.ROUNDED,
@@ -62,9 +119,12 @@ class WerewolfGodview:
         table.add_column("役職", style="yellow")
         table.add_column("状態", style="bold")
 
-        for i, player in enumerate(self.players, 1):
+        for i, player in enumerate(self.state.players.values(), 1):
             status = "🟢 生存" if player.get("is_alive", True) else "💀 死亡"
             status_style = "green" if player.get("is_alive", True) else "red"
+            if not player.get("connected", True):
+                status += " 🔌"
+                status_style = "dim " + status_style
 
             # 役職によって色を変える
             role = player.get("role", "unknown")
@@ -84,9 +144,12 @@ class WerewolfGodview:
 
         return table
 
-    def create_chat_panel(self) -> Panel:
+    def create_chat_panel(self) -> "Panel":
         """チャットパネルを作成"""
-        messages = self.messages.get(self.current_channel, [])
+        from rich.panel import Panel
+        from rich.text import Text
+
+        messages = self.state.recent_messages(self.current_channel, 15)
 
         if not messages:
             chat_text = Text(
@@ -97,8 +160,8 @@ class WerewolfGodview:
             chat_text = Text()
             chat_text.append(f"チャンネル: {self.current_channel}\n\n", style="bold")
 
-            for msg in messages[-15:]:  # 最新15件を表示
-                timestamp = msg.get("timestamp", "")[-8:]
+            for msg in messages:  # 最新15件を表示
+                timestamp = msg.get("timestamp", "")[11:19]
                 player = msg.get("player", "Unknown")
                 role = msg.get("role", "unknown")
                 content = msg.get("content", "")
@@ -122,32 +185,89 @@ class WerewolfGodview:
             height=20,
         )
 
-    def create_event_panel(self) -> Panel:
+    def create_event_panel(self) -> "Panel":
         """イベントパネルを作成"""
-        if not self.events:
+        from rich.panel import Panel
+        from rich.text import Text
+
+        events = self.state.events
+        if not events:
             event_text = Text("イベントはありません", style="dim")
         else:
             event_text = Text()
-            for event in self.events[-5:]:  # 最新5件
+            for event in islice(events, max(0, len(events) - 5), None):  # 最新5件
                 event_type = event.get("type", "")
-                event_str = f"[{datetime.now().strftime('%H:%M:%S')}] {event_type}"
+                event_str = f"[{event.get('time', '')}] {event_type}"
                 event_text.append(event_str + "\n")
 
         return Panel(
             event_text,
             title="イベントログ",
             border_style="yellow",
-            height=8,
+            height=10,
+        )
+
+    def create_stats_panel(self) -> "Panel":
+        """サーバー統計パネルを作成"""
+        from rich.panel import Panel
+        from rich.table import Table
+        from rich.text import Text
+
+        stats = self.state.stats
+        if stats is None:
+            return Panel(
+                Text("統計はまだありません", style="dim"),
+                title="サーバー統計",
+                border_style="cyan",
+                height=10,
+            )
+
+        table = Table(box=None, show_header=False, padding=(0, 1))
+        table.add_column(style="dim")
+        table.add_column()
+
+        connections = stats.get("connections", {})
+        table.add_row(
+            "接続",
+            f"{connections.get('players', 0)} players / "
+            f"{connections.get('godview', 0)} godview",
+        )
+        queues = stats.get("queues", {})
+        failures = sum(stats.get("send_failures", {}).values())
+        table.add_row(
+            "キュー",
+            f"max {queues.get('max_depth', 0)}  失敗 {failures:g}  "
+            f"エラー {stats.get('errors', 0):g}",
         )
+        for name, rates in self.state.channel_rates.items():
+            table.add_row(
+                name, f"in {rates.get('in', 0):.1f}/s  out {rates.get('out', 0):.1f}/s"
+            )
+        for label, key in (("処理", "handle_ms"), ("配信", "fan_out_ms")):
+            for name, summary in stats.get(key, {}).items():
+                if summary.get("p95") is not None:
+                    table.add_row(
+                        f"{label} {name}",
+                        f"p50 {summary['p50']:.2f}ms  p95 {summary['p95']:.2f}ms",
+                    )
 
-    def create_layout(self) -> Layout:
+        return Panel(table, title="サーバー統計", border_style="cyan", height=10)
+
+    def create_layout(self) -> "Layout":
         """レイアウトを作成"""
+        from rich.layout import Layout
+
         layout = Layout()
 
         layout.split_column(
             Layout(name="header", size=3),
             Layout(name="main"),
-            Layout(name="events", size=8),
+            Layout(name="footer", size=10),
+        )
+
+        layout["footer"].split_row(
+            Layout(name="events", ratio=1),
+            Layout(name="stats", ratio=1),
         )
 
         layout["main"].split_row(
@@ -156,85 +276,318 @@ class WerewolfGodview:
         )
 
         layout["header"].update(self.create_header())
-        layout["players"].update(Panel(self.create_player_table(), title="プレイヤー"))
+        layout["players"].update(self.create_players_panel())
         layout["chat"].update(self.create_chat_panel())
         layout["events"].update(self.create_event_panel())
+        layout["stats"].update(self.create_stats_panel())
 
         return layout
 
-    def add_event(self, event: dict):
-        """イベントを追加"""
-        self.events.append(event)
-        if len(self.events) > 20:
-            self.events = self.events[-20:]
-
-    async def handle_message(self, message: str):
+    def create_players_panel(self) -> "Panel":
+        """プレイヤーパネルを作成"""
+        from rich.panel import Panel
+
+        return Panel(self.create_player_table(), title="プレイヤー")
+
+    def render(self) -> bool:
+        """印の付いたパネルだけ作り直す。作り直したら True"""
+        if self.layout is None:
+            self.layout = self.create_layout()
+            self.dirty.clear()
+            self.renders += 1
+            return True
+        if not self.dirty:
+            return False
+
+        builders = {
+            "players": self.create_players_panel,
+            "chat": self.create_chat_panel,
+            "events": self.create_event_panel,
+            "stats": self.create_stats_panel,
+        }
+        for name in self.dirty:
+            self.layout[name].update(builders[name]())
+        self.dirty.clear()
+        self.renders += 1
+        return True
+
+    async def render_loop(self, live: "Live"):
+        """最大 max_fps 回/秒で、変更があったときだけ描画"""
+        interval = 1 / self.max_fps
+        while True:
+            if self.render():
+                live.update(self.layout, refresh=True)
+            await asyncio.sleep(interval)
+
+    def encode(self, message: dict) -> bytes:
+        return self.codec.encode(message)
+
+    async def send(self, websocket, message: Union[dict, bytes]):
+        """選んだ符号化方式で送信"""
+        data = self.encode(message) if isinstance(message, dict) else message
+        await websocket.send(data, text=self.codec.text)
+
+    async def handle_message(self, message: Union[str, bytes]):
         """サーバーからのメッセージを処理"""
         try:
-            data = json.loads(message)
-
-            if data.get("type") == "init":
-                # 初期データ
-                self.players = data.get("players", [])
-
-            elif data.get("type") == "player_joined":
-                # プレイヤー参加
-                player = data.get("player", {})
-                self.players.append(player)
-                self.add_event({"type": f"🎮 {player.get('name')} が参加", "data": player})
-
-            elif data.get("type") == "player_left":
-                # プレイヤー退出
-                player = data.get("player", {})
-                self.players = [
-                    p for p in self.players if p.get("id") != player.get("id")
-                ]
-                self.add_event({"type": f"👋 {player.get('name')} が退出", "data": player})
-
-            elif data.get("type") == "channel_message":
-                # チャンネルメッセージ
-                channel = data.get("channel", "public")
-                msg = data.get("message", {})
-                if channel in self.messages:
-                    self.messages[channel].append(msg)
-
-        except json.JSONDecodeError:
+            data = self.codec.decode(message)
+        except ValueError:
+            return
+
+        for changed in self.state.apply(data):
+            if changed.startswith(CHANNEL_PREFIX):
+                if changed[len(CHANNEL_PREFIX) :] == self.current_channel:
+                    self.mark_dirty("chat")
+            else:
+                self.mark_dirty(changed)
+
+    async def request_stats(self, websocket):
+        """一定間隔でサーバー統計を要求"""
+        request = self.encode({"type": "stats"})
+        try:
+            while True:
+                await self.send(websocket, request)
+                await asyncio.sleep(self.stats_interval)
+        except websockets.exceptions.ConnectionClosed:
             pass
 
+    async def session(self, websocket):
+        """1回の接続の受信ループ"""
+        stats_task = None
+        if self.stats_interval > 0:
+            stats_task = asyncio.create_task(self.request_stats(websocket))
+        try:
+            async for message in websocket:
+                await self.handle_message(message)
+                if self.state.needs_resync:
+                    # 差分が欠けたのでスナップショットを要求
+                    self.state.needs_resync = False
+                    await self.send(websocket, {"type": "resync"})
+        finally:
+            if stats_task is not None:
+                stats_task.cancel()
+
+    async def open_connection(self):
+        """接続して神視点として登録（担当ワーカーへの誘導に従う）"""
+        while True:
+            # パス /godview で神視点向けの圧縮の設定を選んでもらう
+            websocket = await websockets.connect(
+                class_url(self.server_url, GODVIEW),
+                **self.compression.connect_options(),
+            )
+            handshake = self.state.handshake(self.room)
+            if self.codec is not JSON:
+                handshake["codec"] = self.codec.name
+            # 登録メッセージは常に JSON
+            await websocket.send(json.dumps(handshake))
+
+            first = await websocket.recv()
+            data = self.codec.decode(first)
+            if data.get("type") == "redirect":
+                await websocket.close()
+                self.server_url = data["url"]
+                continue
+
+            await self.handle_message(first)
+            return websocket
+
     async def connect(self):
-        """サーバーに接続"""
+        """サーバーに接続（切断されたら前回の位置から再開）"""
         self.console.print(
             f"[bold cyan]🐺 Godview に接続中... [/] {self.server_url}"
         )
 
         try:
-            async with websockets.connect(self.server_url) as websocket:
-                # 神視点として登録
-                await websocket.send(json.dumps({"type": "godview"}))
-
-                self.console.print("[bold green]✅ 接続成功！[/]")
-
-                # Live Display開始
-                with Live(self.create_layout(), console=self.console, refresh_per_second=10):
-                    async for message in websocket:
-                        await self.handle_message(message)
-
-        except ConnectionRefusedError:
+            websocket = await self.open_connection()
+        except (ConnectionRefusedError, OSError):
             self.console.print(
                 "[bold red]❌ 接続失敗。サーバーが起動しているか確認してください。[/]"
             )
+            return
         except Exception as e:
             self.console.print(f"[bold red]❌ エラー: {e}[/]")
-
-
-async def main():
-    """メイン関数"""
-    godview = WerewolfGodview()
+            return
+
+        self.console.print("[bold green]✅ 接続成功！[/]")
+
+        # Live Display開始（受信と描画を分離）
+        from rich.live import Live
+
+        self.render()
+        with Live(self.layout, console=self.console, auto_refresh=False) as live:
+            render_task = asyncio.create_task(self.render_loop(live))
+            try:
+                backoff = 0.5
+                while True:
+                    try:
+                        async with websocket:
+                            await self.session(websocket)
+                    except websockets.exceptions.ConnectionClosed:
+                        pass
+
+                    # 再接続（指数バックオフ）
+                    self.state.add_event({"type": "🔌 切断されました。再接続中..."})
+                    self.mark_dirty("events")
+                    while True:
+                        await asyncio.sleep(backoff)
+                        try:
+                            websocket = await self.open_connection()
+                            backoff = 0.5
+                            break
+                        except (OSError, websockets.exceptions.WebSocketException):
+                            backoff = min(backoff * 2, 10)
+                    self.state.add_event({"type": "🔗 再接続しました"})
+                    self.mark_dirty("events")
+            finally:
+                render_task.cancel()
+
+
+def comma_list(value: str) -> List[str]:
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Werewolf Godview")
+    parser.add_argument("--url", default="ws://localhost:8765")
+    parser.add_argument("--room", default="default")
+    parser.add_argument(
+        "--fps", type=float, default=10, help="最大描画回数/秒（既定: 10）"
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=2.0,
+        metavar="SECONDS",
+        help="サーバー統計の更新間隔（0 で取得しない）",
+    )
+    parser.add_argument(
+        "--codec",
+        choices=sorted(CODECS),
+        default="json",
+        help="受信フレームの符号化方式（既定: json）",
+    )
+    parser.add_argument(
+        "--channel", default="public", help="表示するチャンネル（既定: public）"
+    )
+    parser.add_argument(
+        "--types",
+        type=comma_list,
+        metavar="TYPE,...",
+        help="受け取るイベントの種類（例: channel_message,action、既定: 全て）",
+    )
+    parser.add_argument(
+        "--players",
+        type=comma_list,
+        metavar="ID,...",
+        help="受け取るイベントのプレイヤー ID（既定: 全員）",
+    )
+    parser.add_argument(
+        "--compression",
+        type=parse_policy,
+        metavar="SPEC",
+        help="--url への接続の圧縮（off / on / window=15,mem=8,level=6,"
+        "threshold=128,takeover=yes、既定: on）",
+    )
+
+    relay = parser.add_argument_group(
+        "relay", "--url のサーバー（または中継）を購読して観戦者に配信し直す中継モード"
+    )
+    relay.add_argument("--relay", action="store_true", help="中継サーバーとして起動")
+    relay.add_argument("--host", default="localhost", help="中継の待ち受けアドレス")
+    relay.add_argument("--port", type=int, default=8775, help="中継の待ち受けポート")
+    relay.add_argument(
+        "--relays",
+        type=int,
+        default=1,
+        metavar="N",
+        help="中継プロセス数（--port から連番のポートで待ち受ける）",
+    )
+    relay.add_argument(
+        "--spectator-compression",
+        type=parse_policy,
+        metavar="SPEC",
+        help="観戦者への接続の圧縮（既定: on）",
+    )
+    relay.add_argument(
+        "--queue-size",
+        type=int,
+        default=256,
+        metavar="N",
+        help="観戦者ごとの送信キューの上限（既定: 256）",
+    )
+    relay.add_argument(
+        "--slow-consumer-policy",
+        choices=SLOW_CONSUMER_POLICIES,
+        default=DROP_OLDEST,
+        help="観戦者の送信キューが溢れたときの対処（既定: drop_oldest）",
+    )
+    relay.add_argument(
+        "--room-grace",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="観戦者がいなくなった部屋（--room 以外）の購読をやめるまでの猶予",
+    )
+    relay.add_argument(
+        "--spectator-tick",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="観戦者への差分をこの間隔でまとめて送る（0 で即時）",
+    )
+    return parser.parse_args(argv)
+
+
+def relay_options(args: argparse.Namespace) -> dict:
+    """コマンドライン引数から SpectatorRelay の設定を作る（上流には --codec で接続）"""
+    return {
+        "rooms": (args.room,),
+        "upstream_codec": args.codec,
+        "upstream_compression": args.compression,
+        "spectator_compression": args.spectator_compression,
+        "spectator_tick": args.spectator_tick,
+        "room_grace": args.room_grace,
+        "queue_size": args.queue_size,
+        "slow_consumer_policy": args.slow_consumer_policy,
+    }
+
+
+async def run(args: argparse.Namespace):
+    """神視点を起動して接続"""
+    godview = WerewolfGodview(
+        args.url,
+        args.room,
+        max_fps=args.fps,
+        stats_interval=args.stats_interval,
+        codec=args.codec,
+        compression=args.compression,
+        channel=args.channel,
+        subscription={
+            "channels": [args.channel],
+            "types": args.types,
+            "players": args.players,
+        },
+    )
     await godview.connect()
 
 
-if __name__ == "__main__":
+def main(argv=None):
+    """メイン関数（werewolf-godview コマンド）"""
+    args = parse_args(argv)
     try:
-        asyncio.run(main())
+        if args.relay:
+            # 中継モードは描画しないので rich も読み込まない
+            from .relay import run_relays
+
+            run_relays(
+                args.relays, args.url, args.host, args.port, **relay_options(args)
+            )
+        else:
+            asyncio.run(run(args))
     except KeyboardInterrupt:
         print("\n👋 Godview を終了します")
+
+
+if __name__ == "__main__":
+    main()
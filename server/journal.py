@@ -0,0 +1,192 @@
+"""
+werewolf-ai-battle Game Journal
+
+ゲームイベントの追記専用ジャーナル。
+書き込みはバックグラウンドスレッドでまとめて行い（グループコミット）、
+fsync もバッチごとに一回だけ呼ぶ。一定サイズでセグメントを切り替える。
+
+レコード形式: [長さ uint32][CRC32 uint32][JSON 配列 [種別, データ]]
+"""
+
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+HEADER = struct.Struct("<II")
+SEGMENT_PREFIX = "journal-"
+SEGMENT_SUFFIX = ".log"
+
+
+def encode_record(kind: str, data: dict) -> bytes:
+    """レコードをバイト列にエンコード"""
+    payload = json.dumps(
+        [kind, data], ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    return HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+def segment_paths(directory: str) -> List[str]:
+    """セグメントファイルを番号順に列挙"""
+    if not os.path.isdir(directory):
+        return []
+    names = sorted(
+        name
+        for name in os.listdir(directory)
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+    )
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_segment(path: str) -> Tuple[List[Tuple[str, dict]], int]:
+    """セグメントを読み、レコードと正しく読めた末尾の位置を返す
+
+    クラッシュで途中まで書かれたレコードがあれば、その手前で止まる。
+    """
+    records = []
+    valid = 0
+    with open(path, "rb") as f:
+        buf = f.read()
+    while valid + HEADER.size <= len(buf):
+        length, crc = HEADER.unpack_from(buf, valid)
+        start = valid + HEADER.size
+        payload = buf[start : start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        kind, data = json.loads(payload)
+        records.append((kind, data))
+        valid = start + length
+    return records, valid
+
+
+def replay(directory: str) -> Iterator[Tuple[str, dict]]:
+    """ジャーナル全体を書き込み順に読み出す"""
+    for path in segment_paths(directory):
+        records, _ = read_segment(path)
+        yield from records
+
+
+class GameJournal:
+    """バックグラウンドで書き込む追記専用ジャーナル"""
+
+    def __init__(
+        self,
+        directory: str,
+        segment_size: int = 16 * 1024 * 1024,
+        flush_interval: float = 0.05,
+        fsync: bool = True,
+    ):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self._pending: List[Tuple[str, dict]] = []
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._closing = False
+        self._file = None
+        self._segment_index = 0
+
+        # 統計
+        self.records_written = 0
+        self.bytes_written = 0
+        self.batches = 0
+        self.fsyncs = 0
+
+    def start(self):
+        """最後のセグメントの壊れた末尾を切り詰め、書き込みスレッドを開始"""
+        os.makedirs(self.directory, exist_ok=True)
+        paths = segment_paths(self.directory)
+        if paths:
+            last = paths[-1]
+            _, valid = read_segment(last)
+            with open(last, "r+b") as f:
+                f.truncate(valid)
+            self._segment_index = int(
+                os.path.basename(last)[len(SEGMENT_PREFIX) : -len(SEGMENT_SUFFIX)]
+            )
+        else:
+            self._segment_index = 1
+        self._open_segment()
+
+        self._thread = threading.Thread(
+            target=self._run, name="game-journal", daemon=True
+        )
+        self._thread.start()
+
+    def append(self, kind: str, data: dict):
+        """レコードを追加（待たない）。data は追加後に変更しないこと"""
+        with self._cond:
+            self._pending.append((kind, data))
+            # バッチの最初のレコードでだけ書き込みスレッドを起こす
+            if len(self._pending) == 1:
+                self._cond.notify()
+
+    def close(self):
+        """残りを書き出してスレッドを停止"""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _segment_path(self, index: int) -> str:
+        return os.path.join(
+            self.directory, f"{SEGMENT_PREFIX}{index:06d}{SEGMENT_SUFFIX}"
+        )
+
+    def _open_segment(self):
+        self._file = open(self._segment_path(self._segment_index), "ab")
+
+    def _rotate(self):
+        """現在のセグメントを閉じて次のセグメントに切り替える"""
+        self._file.close()
+        self._segment_index += 1
+        self._open_segment()
+
+    def _run(self):
+        """溜まったレコードをまとめて書き込む"""
+        while True:
+            with self._cond:
+                if not self._pending and not self._closing:
+                    self._cond.wait()
+                if not self._pending and self._closing:
+                    return
+                # 少し待って後続のレコードも同じバッチにまとめる
+                if not self._closing and self.flush_interval > 0:
+                    self._cond.wait(self.flush_interval)
+                batch, self._pending = self._pending, []
+            self._write_batch(batch)
+
+    def _write_batch(self, batch: List[Tuple[str, dict]]):
+        data = b"".join(encode_record(kind, record) for kind, record in batch)
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+            self.fsyncs += 1
+        self.records_written += len(batch)
+        self.bytes_written += len(data)
+        self.batches += 1
+        if self._file.tell() >= self.segment_size:
+            self._rotate()
+
+    def stats(self) -> dict:
+        """書き込み統計"""
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            "segment": self._segment_index,
+            "pending": pending,
+            "records": self.records_written,
+            "bytes": self.bytes_written,
+            "batches": self.batches,
+            "fsyncs": self.fsyncs,
+        }
@@ -0,0 +1,143 @@
+"""
+werewolf-ai-battle Memory Transport
+
+ソケットを使わずに GameRoom に参加するための接続とクライアント。
+フレームは JSON にエンコードせず、メッセージ（dict）をそのまま受け取る。
+ネットワーク越しのサーバーと同じ GameRoom を使うので、
+チャンネルの参加条件や配信の規則はまったく同じになる。
+
+受け取ったメッセージは全受信者で共有されるため、変更しないこと。
+"""
+
+from collections import deque
+from typing import Callable, Deque, List, Optional
+
+from .frames import Frame
+from .room import GameRoom, Player
+
+
+class MemoryConnection:
+    """メモリ上の接続（Connection と同じ操作を持つ）"""
+
+    def __init__(
+        self,
+        label: str = "",
+        on_message: Optional[Callable[[dict], None]] = None,
+        inbox_size: Optional[int] = 1000,
+    ):
+        self.label = label
+        self.on_message = on_message
+        # on_message を指定しなければ受信メッセージを溜めておく
+        self.inbox: Deque[dict] = deque(maxlen=inbox_size)
+        # 送信キューはない（常に即時に届く）
+        self.queue: tuple = ()
+        self.closed = False
+        self.sent = 0
+
+    def start(self):
+        pass
+
+    def can_write_directly(self) -> bool:
+        # fan_out では常に enqueue を経由させる
+        return False
+
+    def enqueue(self, frame: Frame, key: Optional[str] = None) -> bool:
+        """メッセージをエンコードせずにそのまま届ける"""
+        if self.closed:
+            return False
+        self.sent += 1
+        if self.on_message is not None:
+            self.on_message(frame.message)
+        else:
+            self.inbox.append(frame.message)
+        return True
+
+    async def close(self):
+        self.closed = True
+
+    async def terminate(self, reason: str = "", code: int = 1000):
+        self.closed = True
+
+    def stats(self) -> dict:
+        return {
+            "label": self.label,
+            "depth": 0,
+            "max_depth": 0,
+            "maxsize": 0,
+            "policy": "memory",
+            "sent": self.sent,
+            "dropped": 0,
+            "coalesced": 0,
+            "failed": 0,
+            "closed": self.closed,
+        }
+
+
+class MemoryClient:
+    """WerewolfClient と同じ操作をメモリ上の部屋に対して行うクライアント"""
+
+    def __init__(
+        self,
+        room: GameRoom,
+        name: str = "Anonymous",
+        role: str = "villager",
+        player_id: Optional[str] = None,
+        inbox_size: Optional[int] = 1000,
+    ):
+        self.room = room
+        self.name = name
+        self.role = role
+        self.player_id = player_id or name
+        self.inbox: Deque[dict] = deque(maxlen=inbox_size)
+        self.on_message: Optional[Callable[[dict], None]] = None
+        self.connection: Optional[MemoryConnection] = None
+        self.player: Optional[Player] = None
+        self.received = 0
+
+    def _receive(self, message: dict):
+        self.received += 1
+        self.inbox.append(message)
+        if self.on_message is not None:
+            self.on_message(message)
+
+    async def connect(self) -> Player:
+        """部屋に登録（同じ player_id なら元のプレイヤーに戻る）"""
+        self.connection = MemoryConnection(self.player_id, self._receive)
+        self.player = await self.room.register_player(
+            self.player_id, self.name, self.role, self.connection
+        )
+        return self.player
+
+    async def send_chat(self, content: str, channel: str = "public"):
+        """チャットメッセージを送信"""
+        await self.room.handle_message(
+            self.player_id, {"type": "chat", "channel": channel, "content": content}
+        )
+
+    async def send_action(self, action: str, **kwargs):
+        """ゲームアクションを送信"""
+        await self.room.handle_message(
+            self.player_id, {"type": "action", "action": action, **kwargs}
+        )
+
+    async def request_history(
+        self, channel: str = "public", since: int = 0, limit: Optional[int] = None
+    ):
+        """通し番号 since より後の履歴を要求（結果は history メッセージで届く）"""
+        message = {"type": "history", "channel": channel, "since": since}
+        if limit is not None:
+            message["limit"] = limit
+        await self.room.handle_message(self.player_id, message)
+
+    def messages(self, msg_type: Optional[str] = None) -> List[dict]:
+        """受信したメッセージ（種類で絞り込み）"""
+        if msg_type is None:
+            return list(self.inbox)
+        return [m for m in self.inbox if m.get("type") == msg_type]
+
+    async def close(self):
+        """切断（部屋の再接続猶予に従って削除される）"""
+        if self.connection is not None:
+            await self.connection.close()
+            await self.room.detach_player(self.player_id, self.connection)
+            self.connection = None
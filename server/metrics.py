@@ -0,0 +1,358 @@
+"""
+werewolf-ai-battle Metrics
+
+サーバー内部の計測値（カウンター・ゲージ・ヒストグラム）。
+Prometheus のテキスト形式で HTTP から取得できるほか、
+部屋ごとの値を神視点向けの stats フレームにまとめる。外部ライブラリには依存しない。
+"""
+
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# 処理時間（秒）のヒストグラムの境界
+LATENCY_BUCKETS = (
+    0.00005,
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    1.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(str(v))}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """単調増加するカウンター"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0)
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        for labels, value in self.values.items():
+            yield self.name, self.labels, labels, value
+
+
+class Gauge:
+    """現在値。collect を渡すと書き出すたびに値を集計する"""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, *labels: str):
+        self.values[labels] = value
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        values = self.collect() if self.collect is not None else self.values
+        for labels, value in values.items():
+            yield self.name, self.labels, labels, value
+
+
+class Histogram:
+    """累積バケットのヒストグラム"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # ラベル -> バケットごとの件数（最後は +Inf）
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, *labels: str):
+        counts = self.counts.get(labels)
+        if counts is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def count(self, *labels: str) -> int:
+        return sum(self.counts.get(labels, ()))
+
+    def quantile(self, q: float, *labels: str) -> Optional[float]:
+        """バケット内を線形補間した分位点（Prometheus の histogram_quantile と同じ）"""
+        counts = self.counts.get(labels)
+        if not counts:
+            return None
+        rank = q * sum(counts)
+        seen = 0
+        for index, count in enumerate(counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        names = self.labels + ("le",)
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                yield (
+                    self.name + "_bucket",
+                    names,
+                    labels + (_format_value(bound),),
+                    cumulative,
+                )
+            yield self.name + "_sum", self.labels, labels, self.sums[labels]
+            yield self.name + "_count", self.labels, labels, cumulative
+
+
+class MetricsRegistry:
+    """計測値の登録と Prometheus テキスト形式での書き出し"""
+
+    def __init__(self):
+        self.metrics: list = []
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        collect: Optional[Callable[[], Dict[LabelValues, float]]] = None,
+    ) -> Gauge:
+        metric = Gauge(name, help, labels, collect)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def forget(self, label: str, value: str):
+        """label が value の系列を全ての計測値から消す（片付けた部屋など）"""
+        for metric in self.metrics:
+            if label not in metric.labels:
+                continue
+            index = metric.labels.index(label)
+            for table in (
+                getattr(metric, "values", None),
+                getattr(metric, "counts", None),
+                getattr(metric, "sums", None),
+            ):
+                if table:
+                    for labels in [k for k in table if k[index] == value]:
+                        del table[labels]
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, label_names, labels, value in metric.samples():
+                lines.append(
+                    f"{name}{_format_labels(label_names, labels)} {_format_value(value)}"
+                )
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int) -> asyncio.AbstractServer:
+        """GET /metrics に答える HTTP サーバーを起動"""
+        return await asyncio.start_server(self._handle_http, host, port)
+
+    async def _handle_http(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # ヘッダーは読み捨てる
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+
+            parts = request.split()
+            if (
+                len(parts) >= 2
+                and parts[0] == b"GET"
+                and parts[1].split(b"?")[0] == b"/metrics"
+            ):
+                status, body = "200 OK", self.render().encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"not found\n"
+
+            writer.write(
+                (
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {CONTENT_TYPE}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    "Connection: close\r\n\r\n"
+                ).encode("ascii")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def _milliseconds(histogram: Histogram, *labels: str) -> dict:
+    """ヒストグラムの件数と分位点（ミリ秒）"""
+    summary = {"count": histogram.count(*labels)}
+    for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+        value = histogram.quantile(q, *labels)
+        summary[name] = round(value * 1000, 3) if value is not None else None
+    return summary
+
+
+class ServerMetrics(MetricsRegistry):
+    """チャットサーバーの計測値"""
+
+    def __init__(self):
+        super().__init__()
+        self.started = time.monotonic()
+        self.messages_in = self.counter(
+            "werewolf_messages_in_total",
+            "プレイヤーから受信したメッセージ数",
+            ("room", "channel", "type"),
+        )
+        self.messages_out = self.counter(
+            "werewolf_messages_out_total",
+            "配信したメッセージ数（受信者ごと）",
+            ("room", "channel", "type"),
+        )
+        self.handle_seconds = self.histogram(
+            "werewolf_handle_message_seconds",
+            "受信メッセージの処理時間",
+            ("room", "type"),
+        )
+        self.fan_out_seconds = self.histogram(
+            "werewolf_fan_out_seconds",
+            "1メッセージをチャンネルまたは神視点に配る時間",
+            ("room", "target"),
+        )
+        self.send_failures = self.counter(
+            "werewolf_send_failures_total",
+            "送信できなかったフレーム数",
+            ("room", "kind", "reason"),
+        )
+        self.errors = self.counter(
+            "werewolf_message_errors_total",
+            "処理できなかった受信メッセージ数",
+            ("room", "reason"),
+        )
+        self.rejected = self.counter(
+            "werewolf_messages_rejected_total",
+            "流量制御で捨てた受信メッセージ数",
+            ("room", "reason"),
+        )
+
+    def room_stats(self, room_id: str) -> dict:
+        """部屋ごとの値（stats フレーム用）"""
+        channels: Dict[str, Dict[str, float]] = {}
+        for key, counter in (("in", self.messages_in), ("out", self.messages_out)):
+            for (room, channel, _), value in counter.values.items():
+                if room == room_id and channel:
+                    totals = channels.setdefault(channel, {"in": 0, "out": 0})
+                    totals[key] += value
+
+        failures: Dict[str, float] = {}
+        for (room, _, reason), value in self.send_failures.values.items():
+            if room == room_id:
+                failures[reason] = failures.get(reason, 0) + value
+
+        errors = sum(
+            value for (room, _), value in self.errors.values.items() if room == room_id
+        )
+        rejected = {
+            reason: value
+            for (room, reason), value in self.rejected.values.items()
+            if room == room_id
+        }
+
+        return {
+            "uptime": round(time.monotonic() - self.started, 3),
+            "channels": channels,
+            "handle_ms": {
+                labels[1]: _milliseconds(self.handle_seconds, *labels)
+                for labels in self.handle_seconds.counts
+                if labels[0] == room_id
+            },
+            "fan_out_ms": {
+                labels[1]: _milliseconds(self.fan_out_seconds, *labels)
+                for labels in self.fan_out_seconds.counts
+                if labels[0] == room_id
+            },
+            "send_failures": failures,
+            "errors": errors,
+            "rejected": rejected,
+        }
@@ -0,0 +1,250 @@
+"""
+werewolf-ai-battle Outbound Queue
+
+接続ごとの送信キューと送信タスク。
+ブロードキャストはキューへの追加だけで終わり、遅いクライアントが
+他のプレイヤーや神視点への配信を止めないようにする。
+"""
+
+import asyncio
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Iterable, List, Optional, Union
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+from websockets.protocol import State
+
+from .codec import JSON, Codec
+from .frames import Frame
+from .tasks import spawn
+
+if TYPE_CHECKING:
+    from .metrics import ServerMetrics
+
+# 遅いクライアントへの対処ポリシー
+DROP_OLDEST = "drop_oldest"  # 最も古い未送信メッセージを捨てる
+COALESCE = "coalesce"  # 同じキーの未送信メッセージを最新のもので置き換える
+DISCONNECT = "disconnect"  # 接続を切断する
+
+SLOW_CONSUMER_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# サーバーが接続を閉じるときのコード
+CLOSE_SLOW_CONSUMER = 1008  # 送信が追いつかない
+CLOSE_REPLACED = 4000  # 同じプレイヤーの新しい接続に置き換えられた
+
+# 送信バッファがこのサイズ未満ならキューを経由せず直接書き込む
+DIRECT_WRITE_LIMIT = 64 * 1024
+
+
+class Connection:
+    """接続ごとの有界送信キュー"""
+
+    def __init__(
+        self,
+        websocket,
+        maxsize: int = 256,
+        policy: str = DROP_OLDEST,
+        label: str = "",
+        metrics: Optional["ServerMetrics"] = None,
+        room: str = "",
+        kind: str = "player",
+        codec: Codec = JSON,
+    ):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"unknown slow consumer policy: {policy}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        self.label = label
+        self.metrics = metrics
+        self.room = room
+        self.kind = kind
+        # 送受信の符号化方式（登録メッセージで選ばれたもの）
+        self.codec = codec
+        # 要素はフレーム。coalesce するフレームはキーだけを並べ、
+        # 本体は _pending に置く（同じキーが来たら本体だけ置き換える）
+        self.queue: Deque[Union[Frame, str]] = deque()
+        self._pending: Dict[str, Frame] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._busy = False
+        self.closed = False
+
+        # 統計
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.max_depth = 0
+
+    def start(self):
+        """送信タスクを開始"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._writer())
+
+    def can_write_directly(self) -> bool:
+        """キューが空で送信中でもなく、送信バッファに余裕があるか"""
+        if self.closed or self.queue or self._busy:
+            return False
+        # 閉じかけの接続は送信タスクに任せ、失敗として数える
+        if getattr(self.websocket, "state", State.OPEN) is not State.OPEN:
+            return False
+        transport = getattr(self.websocket, "transport", None)
+        if transport is None:
+            return False
+        return transport.get_write_buffer_size() < DIRECT_WRITE_LIMIT
+
+    def enqueue(self, frame: Frame, key: Optional[str] = None) -> bool:
+        """送信キューに追加（待たない）。受け付けたら True"""
+        if self.closed:
+            self._count_failure("closed")
+            return False
+
+        coalesce = self.policy == COALESCE and key is not None
+        if coalesce and key in self._pending:
+            self._pending[key] = frame
+            self.coalesced += 1
+            return True
+
+        if len(self.queue) >= self.maxsize:
+            if self.policy == DISCONNECT:
+                self.dropped += 1
+                self._count_failure("slow_consumer")
+                self._disconnect()
+                return False
+            self._drop_oldest()
+            self._count_failure("dropped")
+
+        if coalesce:
+            self._pending[key] = frame
+            self.queue.append(key)
+        else:
+            self.queue.append(frame)
+
+        depth = len(self.queue)
+        if depth > self.max_depth:
+            self.max_depth = depth
+        self._wakeup.set()
+        return True
+
+    def _pop(self) -> Frame:
+        item = self.queue.popleft()
+        if isinstance(item, str):
+            return self._pending.pop(item)
+        return item
+
+    def _drop_oldest(self):
+        self._pop()
+        self.dropped += 1
+
+    def _count_failure(self, reason: str):
+        """送信できなかったフレームを数える"""
+        self.failed += 1
+        if self.metrics is not None:
+            self.metrics.send_failures.inc(self.room, self.kind, reason)
+
+    def _disconnect(self):
+        """送信が追いつかないクライアントを切断"""
+        self.closed = True
+        self.queue.clear()
+        self._pending.clear()
+        self._wakeup.set()
+        spawn(
+            self.websocket.close(code=CLOSE_SLOW_CONSUMER, reason="slow consumer"),
+            f"disconnect {self.label}",
+        )
+
+    async def _writer(self):
+        """キューから取り出して順番に送信"""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                frame = self._pop()
+                self._busy = True
+                await self.websocket.send(
+                    frame.encode(self.codec), text=self.codec.text
+                )
+                self._busy = False
+                self.sent += 1
+        except ConnectionClosed:
+            self.closed = True
+            self._count_failure("closed")
+        except Exception as e:
+            self.closed = True
+            self._count_failure("error")
+            print(f"⚠️ 送信エラー: {self.label}: {e!r}")
+        finally:
+            self._busy = False
+            self.queue.clear()
+            self._pending.clear()
+
+    async def close(self):
+        """送信タスクを停止"""
+        self.closed = True
+        self._wakeup.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def terminate(self, reason: str = "", code: int = 1000):
+        """送信タスクを止めて接続自体も閉じる（別の接続に置き換えられたときなど）"""
+        await self.close()
+        spawn(self.websocket.close(code=code, reason=reason), f"terminate {self.label}")
+
+    def stats(self) -> dict:
+        """キュー統計"""
+        return {
+            "label": self.label,
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "maxsize": self.maxsize,
+            "policy": self.policy,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "closed": self.closed,
+        }
+
+
+def fan_out(
+    connections: Iterable[Connection], frame: Frame, key: Optional[str] = None
+) -> List[Connection]:
+    """同じフレームを複数の接続に配信し、受け付けなかった接続を返す
+
+    送信待ちのない接続にはコーデックごとに websockets.broadcast でまとめて
+    直接書き込み、それ以外は各接続の送信キューに追加する。
+    フレームはコーデックごとに一度だけエンコードされる。
+    """
+    direct: Dict[Codec, List[Connection]] = {}
+    rejected = []
+    for connection in connections:
+        if connection.can_write_directly():
+            group = direct.get(connection.codec)
+            if group is None:
+                group = direct[connection.codec] = []
+            group.append(connection)
+        elif not connection.enqueue(frame, key):
+            rejected.append(connection)
+
+    for codec, group in direct.items():
+        websockets.broadcast(
+            [connection.websocket for connection in group],
+            frame.encode(codec),
+            text=codec.text,
+        )
+        for connection in group:
+            connection.sent += 1
+
+    return rejected
@@ -0,0 +1,190 @@
+"""
+werewolf-ai-battle Rate Limiting
+
+プレイヤーからの受信の流量制御（トークンバケット）。
+
+- プレイヤーごと: 1人が送れるメッセージの頻度（デコードする前に判定する）
+- チャンネルごと: 1つのチャンネルに流れるチャットの頻度（全員の合計）
+- フレームの大きさとチャット本文の長さの上限
+
+超えたメッセージは処理せずに捨て、error フレーム（code: rate_limited など）で知らせる。
+同じ理由の拒否が続いている間は最初の1回だけ知らせる（エラー通知で送信キューを溢れさせない）。
+"""
+
+import time
+from typing import Callable, Dict, Optional
+
+# 拒否の理由（error フレームの code）
+RATE_LIMITED = "rate_limited"
+FRAME_TOO_LARGE = "frame_too_large"
+CONTENT_TOO_LONG = "content_too_long"
+
+
+class TokenBucket:
+    """トークンバケット（rate 個/秒で補充、最大 burst 個）"""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float, amount: float = 1.0) -> bool:
+        """トークンを取り出せれば True"""
+        tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if tokens < amount:
+            self.tokens = tokens
+            return False
+        self.tokens = tokens - amount
+        return True
+
+    def retry_after(self, amount: float = 1.0) -> float:
+        """次に取り出せるまでの秒数（直前の take の時点から）"""
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+
+class IngestLimits:
+    """受信の上限（0 または None で無効）"""
+
+    def __init__(
+        self,
+        player_rate: float = 20.0,
+        player_burst: float = 40.0,
+        channel_rate: float = 100.0,
+        channel_burst: float = 200.0,
+        max_frame_size: Optional[int] = 64 * 1024,
+        max_content_length: Optional[int] = 4000,
+    ):
+        self.player_rate = player_rate
+        self.player_burst = max(player_burst, 1.0)
+        self.channel_rate = channel_rate
+        self.channel_burst = max(channel_burst, 1.0)
+        self.max_frame_size = max_frame_size or None
+        self.max_content_length = max_content_length or None
+
+    def to_dict(self) -> dict:
+        return {
+            "player_rate": self.player_rate,
+            "player_burst": self.player_burst,
+            "channel_rate": self.channel_rate,
+            "channel_burst": self.channel_burst,
+            "max_frame_size": self.max_frame_size,
+            "max_content_length": self.max_content_length,
+        }
+
+
+class Admission:
+    """部屋ごとの受信の流量制御
+
+    check_* は受け付けるなら None、拒否するなら error フレームの dict を返す。
+    """
+
+    def __init__(
+        self, limits: IngestLimits, clock: Callable[[], float] = time.monotonic
+    ):
+        self.limits = limits
+        self.clock = clock
+        self.players: Dict[str, TokenBucket] = {}
+        self.channels: Dict[str, TokenBucket] = {}
+        # 拒否が続いていて、すでに知らせたプレイヤー -> 知らせた code
+        self._notified: Dict[str, str] = {}
+
+    def check_frame(self, player_id: str, size: int) -> Optional[dict]:
+        """デコードする前の判定（フレームの大きさとプレイヤーの頻度）"""
+        limits = self.limits
+        if limits.max_frame_size is not None and size > limits.max_frame_size:
+            return {
+                "type": "error",
+                "code": FRAME_TOO_LARGE,
+                "request": "message",
+                "limit": limits.max_frame_size,
+                "message": f"メッセージが大きすぎます（上限 {limits.max_frame_size}）",
+            }
+        return self.check_rate(player_id)
+
+    def check_rate(self, player_id: str) -> Optional[dict]:
+        """プレイヤーの頻度の判定（batch では中身の2件目以降も1件ずつ数える）"""
+        limits = self.limits
+        if limits.player_rate > 0:
+            now = self.clock()
+            bucket = self.players.get(player_id)
+            if bucket is None:
+                bucket = self.players[player_id] = TokenBucket(
+                    limits.player_rate, limits.player_burst, now
+                )
+            if not bucket.take(now):
+                return self._rate_limited("player", bucket)
+        return None
+
+    def check_chat(self, channel: str, content) -> Optional[dict]:
+        """デコードした後のチャットの判定（本文の長さとチャンネルの頻度）
+
+        channel は部屋に存在するチャンネル名であること（任意の名前でバケットを作らない）。
+        """
+        limits = self.limits
+        if (
+            limits.max_content_length is not None
+            and isinstance(content, str)
+            and len(content) > limits.max_content_length
+        ):
+            return {
+                "type": "error",
+                "code": CONTENT_TOO_LONG,
+                "request": "chat",
+                "channel": channel,
+                "limit": limits.max_content_length,
+                "message": f"発言が長すぎます（上限 {limits.max_content_length} 文字）",
+            }
+        if limits.channel_rate > 0:
+            now = self.clock()
+            bucket = self.channels.get(channel)
+            if bucket is None:
+                bucket = self.channels[channel] = TokenBucket(
+                    limits.channel_rate, limits.channel_burst, now
+                )
+            if not bucket.take(now):
+                error = self._rate_limited("channel", bucket)
+                error["request"] = "chat"
+                error["channel"] = channel
+                return error
+        return None
+
+    @staticmethod
+    def _rate_limited(scope: str, bucket: TokenBucket) -> dict:
+        return {
+            "type": "error",
+            "code": RATE_LIMITED,
+            "request": "message",
+            "scope": scope,
+            "retry_after": round(bucket.retry_after(), 3),
+            "message": "送信が速すぎます。retry_after 秒待ってから送ってください",
+        }
+
+    def accepted(self, player_id: str):
+        """受け付けたので、次に拒否したときはまた知らせる"""
+        if self._notified:
+            self._notified.pop(player_id, None)
+
+    def should_notify(self, player_id: str, code: str) -> bool:
+        """拒否を知らせるか（同じ理由の拒否が続いている間は最初の1回だけ）"""
+        if self._notified.get(player_id) == code:
+            return False
+        self._notified[player_id] = code
+        return True
+
+    def forget(self, player_id: str):
+        """退出したプレイヤーのバケットを捨てる"""
+        self.players.pop(player_id, None)
+        self._notified.pop(player_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "players": len(self.players),
+            "channels": len(self.channels),
+            "limited": len(self._notified),
+        }
@@ -0,0 +1,588 @@
+#!/usr/bin/env python3
+"""
+werewolf-ai-battle Recording
+
+動いているサーバーが受け取ったフレームを接続ごとに時刻付きで記録し、
+あとで同じ順序・間隔でサーバーに流し直す（負荷の再現と、配信結果の確認用）。
+
+記録は JSON Lines。1行目がヘッダーで、以降は次のいずれか:
+
+- {"t": 秒, "op": "open", "conn": 接続番号}
+- {"t": 秒, "op": "recv", "conn": 接続番号, "text": 文字列} （バイナリは "b64"）
+- {"t": 秒, "op": "close", "conn": 接続番号}
+- {"t": 秒, "op": "assign", "conn": 接続番号, "player_id": サーバーが振った ID}
+- {"t": 秒, "op": "event", "room": 部屋, "event": 神視点に配信したイベント}
+
+再生は記録どおりの速さ（--speed 1）、N 倍速、または待たずに（--fast）行う。
+既定ではサーバーをこのプロセス内に立てて websocket の代わりのダミー接続から流し込み、
+--url を指定すると実際のソケットで外部のサーバーに流し込む。
+元のプレイヤーに戻る登録フレームの resume_token は、再生先のサーバーが渡したものに差し替える。
+最後に神視点に配信されたイベントの列を記録と比べる（時刻や期限など毎回変わる値は除く）。
+
+    uv run python -m server.server --record game.jsonl
+    uv run python -m server.recording game.jsonl --speed 10
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import sys
+import time
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+from .codec import BINARY
+from .frames import Frame
+from .game import DEFAULT_DURATIONS
+from .ratelimit import IngestLimits
+
+if TYPE_CHECKING:
+    from .room import GameRoom
+    from .server import WerewolfServer
+
+RECORDING_VERSION = 1
+
+# 比べるときに無視する値（時刻・期限・再起動ごとに変わる値）
+VOLATILE_KEYS = frozenset(("timestamp", "time", "deadline", "duration", "epoch"))
+
+
+class Recorder:
+    """受信したフレームと神視点へのイベントを記録
+
+    path を省略するとファイルに書かず records に溜める（プロセス内の再生用）。
+    """
+
+    def __init__(self, path: Optional[str] = None, options: Optional[dict] = None):
+        self.path = path
+        self.started = time.perf_counter()
+        self.records: List[dict] = []
+        self._file = open(path, "w", encoding="utf-8") if path else None
+        self._next_conn = 0
+        self.frames = 0
+        self.events = 0
+        self._write(
+            {
+                "op": "header",
+                "version": RECORDING_VERSION,
+                "started": datetime.now().isoformat(),
+                "options": options or {},
+            }
+        )
+
+    def _write(self, record: dict):
+        if self._file is None:
+            self.records.append(record)
+        else:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def _now(self) -> float:
+        return round(time.perf_counter() - self.started, 6)
+
+    def open(self) -> int:
+        """接続を記録し、接続番号を返す"""
+        self._next_conn += 1
+        self._write({"t": self._now(), "op": "open", "conn": self._next_conn})
+        return self._next_conn
+
+    def close(self, conn: int):
+        self._write({"t": self._now(), "op": "close", "conn": conn})
+        self.flush()
+
+    def frame(self, conn: int, message: Union[str, bytes]):
+        """受信したフレームをそのまま記録"""
+        self.frames += 1
+        record: Dict[str, Any] = {"t": self._now(), "op": "recv", "conn": conn}
+        if isinstance(message, str):
+            record["text"] = message
+        else:
+            record["b64"] = base64.b64encode(message).decode("ascii")
+        self._write(record)
+
+    def assign(self, conn: int, player_id: str):
+        """player_id を指定しない登録にサーバーが振った ID"""
+        self._write(
+            {"t": self._now(), "op": "assign", "conn": conn, "player_id": player_id}
+        )
+
+    async def stream(self, conn: int, websocket):
+        """websocket から受け取ったフレームを記録しながら渡す"""
+        async for message in websocket:
+            self.frame(conn, message)
+            yield message
+
+    def watch(self, room: "GameRoom"):
+        """部屋の神視点に配信されるイベントを記録"""
+
+        def on_publish(frame: Frame):
+            self.events += 1
+            self._write(
+                {"t": self._now(), "op": "event", "room": room.id, "event": frame.message}
+            )
+
+        room.spectators.on_publish = on_publish
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+
+    def close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def load(path: str) -> Tuple[dict, List[dict]]:
+    """記録を読み込み、ヘッダーとレコードを返す"""
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    if not records or records[0].get("op") != "header":
+        raise ValueError(f"not a recording: {path}")
+    header = records[0]
+    if header.get("version") != RECORDING_VERSION:
+        raise ValueError(f"unsupported recording version: {header.get('version')}")
+    return header, records[1:]
+
+
+def payload(record: dict) -> Union[str, bytes]:
+    """recv レコードのフレーム"""
+    if "b64" in record:
+        return base64.b64decode(record["b64"])
+    return record["text"]
+
+
+def assigned_ids(records: Iterable[dict]) -> Dict[int, str]:
+    """接続番号 -> 記録時にサーバーが振ったプレイヤー ID"""
+    return {
+        record["conn"]: record["player_id"]
+        for record in records
+        if record.get("op") == "assign"
+    }
+
+
+def with_player_id(message: Union[str, bytes], player_id: str) -> Union[str, bytes]:
+    """登録フレームに記録時のプレイヤー ID を入れる"""
+    data = json.loads(message)
+    if data.get("type") != "register" or "player_id" in data:
+        return message
+    data["player_id"] = player_id
+    return json.dumps(data, ensure_ascii=False)
+
+
+def with_resume_token(
+    message: Union[str, bytes], tokens: Callable[[str, str], Optional[str]]
+) -> Union[str, bytes]:
+    """元のプレイヤーに戻る登録フレームの合言葉を、再生先のサーバーが渡したものにする
+
+    tokens(部屋, player_id) は再生先で発行された合言葉（分からなければ None）。
+    """
+    if not isinstance(message, str) or '"resume_token"' not in message:
+        return message
+    data = json.loads(message)
+    if data.get("type") != "register":
+        return message
+    token = tokens(str(data.get("room") or "default"), data.get("player_id", ""))
+    if token is None:
+        return message
+    data["resume_token"] = token
+    return json.dumps(data, ensure_ascii=False)
+
+
+def welcome_token(message: Union[str, bytes]) -> Optional[Tuple[str, str]]:
+    """登録時の system メッセージなら (player_id, 合言葉)"""
+    if isinstance(message, str):
+        if '"resume_token"' not in message:
+            return None
+        data = json.loads(message)
+    else:
+        if b"resume_token" not in message:
+            return None
+        data = BINARY.decode(message)
+    if not isinstance(data, dict) or data.get("type") != "system":
+        return None
+    return data.get("player_id", ""), data["resume_token"]
+
+
+def expected_events(records: Iterable[dict]) -> Dict[str, List[dict]]:
+    """記録した神視点へのイベント（部屋ごと）"""
+    events: Dict[str, List[dict]] = {}
+    for record in records:
+        if record.get("op") == "event":
+            events.setdefault(record["room"], []).append(record["event"])
+    return events
+
+
+def normalize(value: Any) -> Any:
+    """毎回変わる値（時刻・期限など）を除く"""
+    if isinstance(value, dict):
+        return {
+            key: normalize(item)
+            for key, item in value.items()
+            if key not in VOLATILE_KEYS
+        }
+    if isinstance(value, list):
+        return [normalize(item) for item in value]
+    return value
+
+
+def compare(
+    expected: Dict[str, List[dict]], actual: Dict[str, List[dict]]
+) -> List[str]:
+    """部屋ごとのイベント列を比べ、違いの説明を返す（一致すれば空）"""
+    problems = []
+    for room in sorted(set(expected) | set(actual)):
+        want = normalize(expected.get(room, []))
+        got = normalize(actual.get(room, []))
+        for i, (a, b) in enumerate(zip(want, got)):
+            if a != b:
+                problems.append(
+                    f"[{room}] event {i} differs:\n"
+                    f"  recorded: {json.dumps(a, ensure_ascii=False)}\n"
+                    f"  replayed: {json.dumps(b, ensure_ascii=False)}"
+                )
+                break
+        else:
+            if len(want) != len(got):
+                problems.append(
+                    f"[{room}] recorded {len(want)} events, replayed {len(got)}"
+                )
+    return problems
+
+
+def replay_options(header: dict, speed: float) -> dict:
+    """記録時のサーバー設定を再生の速さに合わせる
+
+    N 倍速ならフェーズの長さ・猶予を 1/N に、流量制御の頻度を N 倍にする。
+    待たずに流す（speed=0）ときは流量制御を外す。
+    """
+    options = header.get("options", {})
+    durations = {**DEFAULT_DURATIONS, **(options.get("phase_durations") or {})}
+    limits = dict(options.get("limits") or {})
+    grace = options.get("reconnect_grace", 30.0)
+    if speed > 0:
+        durations = {phase: seconds / speed for phase, seconds in durations.items()}
+        grace /= speed
+        for key in ("player_rate", "channel_rate"):
+            if key in limits:
+                limits[key] *= speed
+    else:
+        limits["player_rate"] = limits["channel_rate"] = 0
+    return {
+        "phase_durations": durations,
+        "reconnect_grace": grace,
+        "limits": IngestLimits(**limits),
+        "ping_interval": None,
+        "ping_timeout": None,
+    }
+
+
+class ReplaySocket:
+    """記録したフレームをサーバーに渡すダミー接続（プロセス内の再生用）"""
+
+    def __init__(self):
+        self.inbox: "asyncio.Queue[Optional[Union[str, bytes]]]" = asyncio.Queue()
+        # サーバーが次のフレームを待っている（前のフレームを処理し終えた）
+        self.waiting = asyncio.Event()
+        self.sent = 0
+        self.closed = False
+
+    def feed(self, message: Union[str, bytes]):
+        self.waiting.clear()
+        self.inbox.put_nowait(message)
+
+    def finish(self):
+        self.inbox.put_nowait(None)
+
+    async def __aiter__(self):
+        while True:
+            if self.inbox.empty():
+                self.waiting.set()
+            message = await self.inbox.get()
+            if message is None:
+                self.waiting.set()
+                return
+            yield message
+
+    async def send(self, data, text=None):
+        self.sent += 1
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        if not self.closed:
+            self.closed = True
+            self.finish()
+
+
+class Replayer:
+    """記録したフレームを同じ順序・間隔（speed 倍）でサーバーに流し直す
+
+    url を指定しなければプロセス内のサーバー（server）に流し込む。
+    """
+
+    def __init__(
+        self,
+        records: List[dict],
+        speed: float = 1.0,
+        server: Optional["WerewolfServer"] = None,
+        url: Optional[str] = None,
+        verbose: bool = True,
+    ):
+        self.records = records
+        self.speed = speed
+        self.server = server
+        self.url = url
+        self.verbose = verbose
+        self.assigned = assigned_ids(records)
+        # 再生先で発行された合言葉（player_id -> 合言葉、ソケットで再生するとき）
+        self.tokens: Dict[str, str] = {}
+        self._server: Optional["WerewolfServer"] = None
+        self.frames = 0
+        self.elapsed = 0.0
+        # 実際のソケットで再生するときに神視点として受け取ったイベント
+        self.observed: Dict[str, List[dict]] = {}
+
+    async def run(self) -> Dict[str, List[dict]]:
+        """再生して、神視点に配信されたイベント（部屋ごと）を返す"""
+        if self.url is None:
+            return await self._run_in_process()
+        return await self._run_sockets()
+
+    def _payload(self, record: dict) -> Union[str, bytes]:
+        """送り直すフレーム（登録には記録時のプレイヤー ID と再生先の合言葉を入れる）"""
+        message = payload(record)
+        player_id = self.assigned.pop(record["conn"], None)
+        if player_id is not None:
+            message = with_player_id(message, player_id)
+        return with_resume_token(message, self._token)
+
+    def _token(self, room_id: str, player_id: str) -> Optional[str]:
+        """再生先のサーバーがプレイヤーに渡した合言葉"""
+        if self._server is None:
+            return self.tokens.get(player_id)
+        room = self._server.rooms.get(room_id)
+        player = room.players.get(player_id) if room is not None else None
+        return player.resume_token if player is not None else None
+
+    async def _schedule(self, handle):
+        """記録の時刻どおりに handle(record) を呼ぶ"""
+        start = time.perf_counter()
+        for record in self.records:
+            if record["op"] not in ("open", "recv", "close"):
+                continue
+            if self.speed > 0:
+                delay = record["t"] / self.speed - (time.perf_counter() - start)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await handle(record)
+        self.elapsed = time.perf_counter() - start
+
+    async def _run_in_process(self) -> Dict[str, List[dict]]:
+        from .server import WerewolfServer
+
+        server = self._server = self.server or WerewolfServer()
+        recorder = Recorder()
+        server.recorder = recorder
+        for room_id in self._rooms():
+            server.get_room(room_id).verbose = self.verbose
+        server.timers.start()
+        sockets: Dict[int, ReplaySocket] = {}
+        tasks: List[asyncio.Task] = []
+
+        async def handle(record: dict):
+            conn = record["conn"]
+            if record["op"] == "open":
+                sockets[conn] = socket = ReplaySocket()
+                tasks.append(asyncio.create_task(server.handle_client(socket)))
+            elif record["op"] == "recv":
+                socket = sockets[conn]
+                socket.feed(self._payload(record))
+                self.frames += 1
+                if self.speed <= 0:
+                    # 待たずに流すときも、接続をまたいだ順序は記録どおりにする
+                    await socket.waiting.wait()
+            elif record["op"] == "close":
+                sockets[conn].finish()
+
+        try:
+            await self._schedule(handle)
+            for socket in sockets.values():
+                socket.finish()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            server.recorder = None
+            self._server = None
+            await server.timers.close()
+        return expected_events(recorder.records)
+
+    async def _run_sockets(self) -> Dict[str, List[dict]]:
+        sockets: Dict[int, Any] = {}
+        readers: List[asyncio.Task] = []
+        observers = [await self._observe(room) for room in self._rooms()]
+
+        async def drain(websocket):
+            try:
+                async for message in websocket:
+                    welcome = welcome_token(message)
+                    if welcome is not None:
+                        self.tokens[welcome[0]] = welcome[1]
+            except ConnectionClosed:
+                pass
+
+        async def handle(record: dict):
+            conn = record["conn"]
+            if record["op"] == "open":
+                websocket = await websockets.connect(self.url, max_size=None)
+                sockets[conn] = websocket
+                readers.append(asyncio.create_task(drain(websocket)))
+            elif record["op"] == "recv":
+                websocket = sockets.get(conn)
+                if websocket is not None:
+                    try:
+                        await websocket.send(self._payload(record))
+                    except ConnectionClosed:
+                        sockets.pop(conn)
+                    self.frames += 1
+            elif record["op"] == "close":
+                websocket = sockets.pop(conn, None)
+                if websocket is not None:
+                    await websocket.close()
+
+        try:
+            await self._schedule(handle)
+            for websocket in sockets.values():
+                await websocket.close()
+            await asyncio.gather(*readers, return_exceptions=True)
+            # 最後のイベントが届くのを待つ
+            await asyncio.sleep(0.5)
+        finally:
+            for task in observers:
+                task.cancel()
+            await asyncio.gather(*observers, return_exceptions=True)
+        return self.observed
+
+    def _rooms(self) -> List[str]:
+        """記録に出てくる部屋（登録・神視点の最初のフレームから）"""
+        rooms = []
+        for record in self.records:
+            if record["op"] != "recv" or "text" not in record:
+                continue
+            try:
+                data = json.loads(record["text"])
+            except ValueError:
+                continue
+            if isinstance(data, dict) and data.get("type") in ("register", "godview"):
+                room = str(data.get("room") or "default")
+                if room not in rooms:
+                    rooms.append(room)
+        return rooms
+
+    async def _observe(self, room: str) -> asyncio.Task:
+        """神視点（観戦プロトコル 2）として部屋のイベントを受け取る"""
+        url = self.url
+        while True:
+            websocket = await websockets.connect(url, max_size=None)
+            await websocket.send(
+                json.dumps({"type": "godview", "room": room, "protocol": 2})
+            )
+            first = json.loads(await websocket.recv())
+            if first.get("type") != "redirect":
+                break
+            await websocket.close()
+            url = first["url"]
+        events = self.observed.setdefault(room, [])
+
+        async def receive():
+            try:
+                async for message in websocket:
+                    data = json.loads(message)
+                    if data.get("type") == "delta":
+                        events.append(data["event"])
+                    elif data.get("type") == "deltas":
+                        events.extend(delta["event"] for delta in data["deltas"])
+            finally:
+                await websocket.close()
+
+        return asyncio.create_task(receive())
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Werewolf recording replayer")
+    parser.add_argument("recording", help="--record で保存した記録")
+    parser.add_argument(
+        "--speed", type=float, default=1.0, help="再生の速さ（既定: 1 = 記録どおり）"
+    )
+    parser.add_argument(
+        "--fast", action="store_true", help="待たずに流す（接続をまたいだ順序は保つ）"
+    )
+    parser.add_argument(
+        "--url", help="実際のソケットで外部のサーバーに流し込む（省略時はプロセス内）"
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="プロセス内のサーバーのログを表示"
+    )
+    parser.add_argument(
+        "--no-check", action="store_true", help="神視点へのイベントを記録と比べない"
+    )
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> int:
+    """記録を再生して結果を表示し、終了コードを返す"""
+    try:
+        header, records = load(args.recording)
+    except (OSError, ValueError) as e:
+        print(f"❌ 記録を読み込めません: {e}")
+        return 2
+    speed = 0.0 if args.fast else args.speed
+    server = None
+    if args.url is None:
+        from .server import WerewolfServer
+
+        server = WerewolfServer(**replay_options(header, speed))
+    replayer = Replayer(
+        records, speed, server=server, url=args.url, verbose=args.verbose
+    )
+    actual = await replayer.run()
+
+    rate = replayer.frames / replayer.elapsed if replayer.elapsed > 0 else 0.0
+    print(
+        f"▶️ 再生: {replayer.frames} フレーム / {replayer.elapsed:.2f} 秒 "
+        f"({rate:.0f} フレーム/秒)"
+    )
+    if args.no_check:
+        return 0
+    expected = expected_events(records)
+    problems = compare(expected, actual)
+    total = sum(len(events) for events in expected.values())
+    if problems:
+        print(f"❌ 神視点へのイベントが記録と一致しません（記録 {total} 件）")
+        for problem in problems:
+            print(problem)
+        return 1
+    print(f"✅ 神視点へのイベント {total} 件が記録と一致しました")
+    return 0
+
+
+def main(argv=None):
+    """メイン関数"""
+    try:
+        sys.exit(asyncio.run(run(parse_args(argv))))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
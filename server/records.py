@@ -0,0 +1,173 @@
+"""
+werewolf-ai-battle Records
+
+保持するデータのコンパクトな表現。
+チャットメッセージは __slots__ のレコードで持ち、チャンネルと役職は整数 ID、
+時刻はモノトニック時計のナノ秒で記録する。
+dict や ISO 形式の時刻文字列は送信・保存するときにだけ作る。
+"""
+
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+# モノトニック時計と実時刻の対応（表示用の時刻への変換に使う）
+_MONO_ORIGIN = time.monotonic_ns()
+_WALL_ORIGIN = time.time_ns()
+
+
+def now_ns() -> int:
+    """記録用の現在時刻（モノトニック時計のナノ秒）"""
+    return time.monotonic_ns()
+
+
+def wall_time_us(time_ns: int) -> int:
+    """記録用の時刻を実時刻（UNIX 時刻のマイクロ秒）に"""
+    return (_WALL_ORIGIN + (time_ns - _MONO_ORIGIN)) // 1000
+
+
+def format_wall_us(wall_us: int) -> str:
+    """実時刻（マイクロ秒）を ISO 形式（ローカル時刻）に"""
+    return datetime.fromtimestamp(wall_us / 1e6).isoformat()
+
+
+def parse_wall_us(value: str) -> int:
+    """ISO 形式の時刻を実時刻（マイクロ秒）に"""
+    return round(datetime.fromisoformat(value).timestamp() * 1e6)
+
+
+def format_timestamp(time_ns: int) -> str:
+    """記録用の時刻を ISO 形式（ローカル時刻）に"""
+    return format_wall_us(wall_time_us(time_ns))
+
+
+def parse_timestamp(value: str) -> int:
+    """ISO 形式の時刻を記録用の時刻に（ジャーナルの再生用）"""
+    return _MONO_ORIGIN + (parse_wall_us(value) * 1000 - _WALL_ORIGIN)
+
+
+class NameTable:
+    """名前と整数 ID の対応表
+
+    最初に渡した名前は固定。frozen なら新しい名前を受け付けない（ValueError）。
+    acquire した名前は参照を数え、release で誰も使わなくなれば ID を解放する。
+    """
+
+    def __init__(self, names: Iterable[str] = (), frozen: bool = False):
+        self.names: List[Optional[str]] = []
+        self.ids: Dict[str, int] = {}
+        self.frozen = False
+        # acquire で割り当てた ID の参照数と、解放して使い回せる ID
+        self._refs: Dict[int, int] = {}
+        self._free: List[int] = []
+        for name in names:
+            self.id(name)
+        self.frozen = frozen
+
+    def id(self, name: str) -> int:
+        """名前の ID（なければ割り当てる）"""
+        value = self.ids.get(name)
+        if value is None:
+            if self.frozen:
+                raise ValueError(f"unknown name: {name!r}")
+            if self._free:
+                value = self._free.pop()
+                self.names[value] = name
+            else:
+                value = len(self.names)
+                self.names.append(name)
+            self.ids[name] = value
+        return value
+
+    def acquire(self, name: str) -> int:
+        """参照を数えて名前の ID を得る（release するまで解放しない）"""
+        known = name in self.ids
+        value = self.id(name)
+        if not known or value in self._refs:
+            self._refs[value] = self._refs.get(value, 0) + 1
+        return value
+
+    def release(self, name: str):
+        """acquire した参照を返す（固定の名前や id で得た名前は解放しない）"""
+        value = self.ids.get(name)
+        refs = self._refs.get(value)
+        if refs is None:
+            return
+        if refs > 1:
+            self._refs[value] = refs - 1
+            return
+        del self._refs[value]
+        del self.ids[name]
+        self.names[value] = None
+        self._free.append(value)
+
+    def name(self, value: int) -> str:
+        return self.names[value]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+# 役職は決まったものだけ（登録時に確かめ、未知の役職で表を増やさない）
+ROLES = NameTable(("villager", "werewolf", "seer", "moderator"), frozen=True)
+# 動的チャンネルは部屋を閉じるときに release する
+CHANNELS = NameTable(("public", "werewolf", "moderator"))
+
+
+class ChatMessage:
+    """チャットメッセージ（送信時に dict に変換する）"""
+
+    __slots__ = ("seq", "channel_id", "player", "role_id", "content", "time_ns")
+
+    type = "chat"
+
+    def __init__(
+        self,
+        channel_id: int,
+        player: str,
+        role_id: int,
+        content: str,
+        seq: int = 0,
+        time_ns: int = 0,
+    ):
+        self.seq = seq
+        self.channel_id = channel_id
+        self.player = player
+        self.role_id = role_id
+        self.content = content
+        self.time_ns = time_ns
+
+    @property
+    def channel(self) -> str:
+        return CHANNELS.name(self.channel_id)
+
+    @property
+    def role(self) -> str:
+        return ROLES.name(self.role_id)
+
+    def to_dict(self) -> dict:
+        """送信・保存用の dict"""
+        return {
+            "type": "chat",
+            "channel": CHANNELS.name(self.channel_id),
+            "player": self.player,
+            "role": ROLES.name(self.role_id),
+            "content": self.content,
+            "seq": self.seq,
+            "timestamp": format_timestamp(self.time_ns),
+        }
+
+    @classmethod
+    def from_dict(cls, message: dict, channel_id: Optional[int] = None) -> "ChatMessage":
+        """dict（ジャーナルや外部から渡されたメッセージ）からレコードを作る"""
+        if channel_id is None:
+            channel_id = CHANNELS.id(message.get("channel", "public"))
+        timestamp = message.get("timestamp")
+        return cls(
+            channel_id,
+            message.get("player", ""),
+            ROLES.id(message.get("role", "villager")),
+            message.get("content", ""),
+            message.get("seq", 0),
+            parse_timestamp(timestamp) if timestamp else 0,
+        )
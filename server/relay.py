@@ -0,0 +1,531 @@
+"""
+werewolf-ai-battle Spectator Relay
+
+神視点（観戦者）向けの中継サーバー。
+部屋ごとにゲームサーバーへ観戦プロトコル 2 で一度だけ接続し、
+スナップショットと差分から部屋の状態を写し取って、
+任意の数の観戦者に同じプロトコルで配信し直す。
+
+- 上流の epoch と通し番号をそのまま使うため、観戦者は同じ系統の
+  どの中継にも since / epoch で再開を要求できる
+- 上流には中継も指定できる（多段にできる）
+- 観戦者への配信は中継プロセスが受け持つので、観戦者が増えても
+  ゲームサーバーの配信量は中継の数にしか比例しない
+
+    uv run python -m server.godview --relay --url ws://localhost:8765 --port 8775
+"""
+
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import websockets
+from websockets.exceptions import ConnectionClosed, WebSocketException
+
+from .codec import JSON, Codec, get_codec, unknown_codec_error
+from .compression import (
+    DEFAULT_POLICIES,
+    GODVIEW,
+    PLAYER,
+    RELAY,
+    CompressionPolicy,
+    class_url,
+    negotiator,
+)
+from .frames import Frame
+from .outbound import DROP_OLDEST, Connection
+from .tasks import spawn
+from .spectator import SpectatorHub, handshake_subscription, subscription_error
+
+DEFAULT_ROOM = "default"
+
+
+class RoomMirror:
+    """上流の部屋の状態の写し（スナップショットを差分で更新する）"""
+
+    def __init__(self, room_id: str, snapshot_messages: int = 50):
+        self.room = room_id
+        self.snapshot_messages = snapshot_messages
+        # player_id -> プレイヤー情報（挿入順が表示順）
+        self.players: Dict[str, dict] = {}
+        # チャンネル名 -> name / description / last_seq
+        self.channels: Dict[str, dict] = {}
+        # チャンネル名 -> 直近 snapshot_messages 件のメッセージ
+        self.messages: Dict[str, Deque[dict]] = {}
+        self.game: Optional[dict] = None
+
+    def _channel(self, name: str) -> dict:
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = {"name": name, "description": "", "last_seq": 0}
+            self.channels[name] = channel
+            self.messages[name] = deque(maxlen=self.snapshot_messages)
+        return channel
+
+    def load(self, snapshot: dict):
+        """スナップショットで状態を置き換える"""
+        self.room = snapshot.get("room", self.room)
+        self.players = {p.get("id"): p for p in snapshot.get("players", [])}
+        self.channels = {}
+        self.messages = {}
+        for name, data in snapshot.get("channels", {}).items():
+            channel = self._channel(name)
+            channel["description"] = data.get("description", "")
+            channel["last_seq"] = data.get("last_seq", 0)
+            self.messages[name].extend(data.get("messages", []))
+        self.game = snapshot.get("game")
+
+    def apply(self, event: dict):
+        """イベントを状態に反映（状態を変えないイベントは何もしない）"""
+        kind = event.get("type")
+        if kind == "channel_message":
+            message = event.get("message", {})
+            channel = self._channel(event.get("channel", "public"))
+            channel["last_seq"] = message.get("seq", channel["last_seq"])
+            self.messages[channel["name"]].append(message)
+        elif kind in ("player_joined", "player_updated"):
+            player = event.get("player", {})
+            self.players[player.get("id")] = player
+        elif kind == "player_left":
+            self.players.pop(event.get("player", {}).get("id"), None)
+        elif kind == "phase":
+            self.game = {
+                key: event.get(key) for key in ("phase", "day", "deadline", "result")
+            }
+        elif kind == "game_over":
+            self.game = {
+                "phase": "ended",
+                "day": event.get("day"),
+                "deadline": None,
+                "result": event.get("winner"),
+            }
+
+    def state(self) -> dict:
+        """スナップショットに含める部屋の状態（GameRoom.spectator_state と同じ形）"""
+        return {
+            "room": self.room,
+            "players": list(self.players.values()),
+            "channels": {
+                name: dict(channel, messages=list(self.messages[name]))
+                for name, channel in self.channels.items()
+            },
+            "game": self.game,
+        }
+
+    def init_message(self) -> dict:
+        """神視点（プロトコル 1）向けの初期データ"""
+        return {
+            "type": "init",
+            "room": self.room,
+            "players": list(self.players.values()),
+            "channels": {
+                name: dict(channel, message_count=len(self.messages[name]))
+                for name, channel in self.channels.items()
+            },
+        }
+
+
+class RoomRelay:
+    """1部屋分の中継（上流への購読と観戦者への配信）"""
+
+    def __init__(
+        self,
+        upstream_url: str,
+        room_id: str = DEFAULT_ROOM,
+        codec: Codec = JSON,
+        spectator_history: int = 1000,
+        spectator_tick: float = 0.0,
+        snapshot_messages: int = 50,
+        stats_interval: float = 2.0,
+        compression: Optional[CompressionPolicy] = None,
+    ):
+        self.upstream_url = upstream_url
+        self.room_id = room_id
+        self.codec = codec
+        self.compression = compression or DEFAULT_POLICIES[RELAY]
+        self.stats_interval = stats_interval
+        self.mirror = RoomMirror(room_id, snapshot_messages)
+        self.spectators = SpectatorHub(
+            self.mirror.state,
+            self.mirror.init_message,
+            history=spectator_history,
+            tick=spectator_tick,
+        )
+        # 上流のスナップショットを受け取ったか
+        self.ready = asyncio.Event()
+        # 差分の欠落を検出してから上流のスナップショットが届くまで True
+        self.needs_resync = False
+        self._resync_requested = False
+        self.websocket = None
+        self._task: Optional[asyncio.Task] = None
+
+        # 上流の最新の stats フレームと、最後に要求した時刻
+        self.upstream_stats: Optional[dict] = None
+        self._stats_requested = 0.0
+
+        # 統計
+        self.events = 0
+        self.reconnects = 0
+        # この部屋に接続している観戦者（スナップショット待ちを含む）
+        self.clients = 0
+
+    def start(self):
+        """上流への購読を開始"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _open(self):
+        """上流に神視点として接続（担当ワーカーへの誘導に従う）"""
+        url = self.upstream_url
+        while True:
+            # パス /relay で中継向けの圧縮の設定を選んでもらう
+            websocket = await websockets.connect(
+                class_url(url, RELAY),
+                max_size=None,
+                **self.compression.connect_options(),
+            )
+            handshake = {"type": "godview", "room": self.room_id, "protocol": 2}
+            if self.ready.is_set():
+                # 前回の位置から再開を要求
+                handshake["since"] = self.spectators.seq
+                handshake["epoch"] = self.spectators.epoch
+            if self.codec is not JSON:
+                handshake["codec"] = self.codec.name
+            await websocket.send(json.dumps(handshake))
+
+            first = self.codec.decode(await websocket.recv())
+            if first.get("type") == "redirect":
+                await websocket.close()
+                url = first["url"]
+                continue
+            self.handle_upstream(first)
+            return websocket
+
+    async def _run(self):
+        """上流から受信し続ける（切断されたら指数バックオフで再接続）"""
+        backoff = 0.5
+        while True:
+            try:
+                self.needs_resync = self._resync_requested = False
+                self.websocket = await self._open()
+                backoff = 0.5
+                async for message in self.websocket:
+                    self.handle_upstream(self.codec.decode(message))
+                    if self.needs_resync and not self._resync_requested:
+                        self._resync_requested = True
+                        await self.send_upstream({"type": "resync"})
+            except asyncio.CancelledError:
+                raise
+            except (OSError, ValueError, WebSocketException) as e:
+                print(f"⚠️ 上流との接続が切れました: {self.room_id}: {e!r}")
+            self.websocket = None
+            self.reconnects += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 10)
+
+    async def send_upstream(self, message: dict):
+        if self.websocket is not None:
+            await self.websocket.send(self.codec.encode(message), text=self.codec.text)
+
+    def handle_upstream(self, data: dict):
+        """上流からのメッセージを写しと観戦者に反映"""
+        kind = data.get("type")
+        if kind == "snapshot":
+            self.needs_resync = self._resync_requested = False
+            self.mirror.load(data)
+            self.spectators.reset(data.get("epoch"), data.get("seq", 0))
+            self.ready.set()
+        elif kind == "delta":
+            self._apply_delta(data)
+        elif kind == "deltas":
+            for delta in data.get("deltas", []):
+                self._apply_delta(delta)
+        elif kind == "stats":
+            self.upstream_stats = data
+
+    def _apply_delta(self, delta: dict):
+        seq = delta.get("seq", 0)
+        if self.needs_resync or seq <= self.spectators.seq:
+            return  # 受信済み（または再同期待ち）
+        if seq != self.spectators.seq + 1:
+            # 差分が欠けたので上流にスナップショットを要求
+            self.needs_resync = True
+            return
+        event = delta.get("event", {})
+        self.mirror.apply(event)
+        # 上流と同じ通し番号（seq）で配信される
+        self.spectators.publish(event)
+        self.events += 1
+
+    def handle_spectator_message(self, connection: Connection, message: dict):
+        """観戦者からのメッセージを処理"""
+        if message.get("type") == "resync":
+            self.spectators.resync(connection)
+        elif message.get("type") == "subscribe":
+            error = self.spectators.subscribe(connection, message)
+            if error is not None:
+                connection.enqueue(Frame(error))
+        elif message.get("type") == "stats":
+            # 上流への要求は stats_interval に1回まで（それまでは前回の結果を返す）
+            now = time.monotonic()
+            if now - self._stats_requested >= self.stats_interval:
+                self._stats_requested = now
+                spawn(self.send_upstream({"type": "stats"}), f"stats {self.room_id}")
+            if self.upstream_stats is not None:
+                connection.enqueue(
+                    Frame(dict(self.upstream_stats, relay=self.stats())), key="stats"
+                )
+
+    def stats(self) -> dict:
+        return {
+            "upstream": self.upstream_url,
+            "connected": self.websocket is not None,
+            "events": self.events,
+            "reconnects": self.reconnects,
+            "spectators": self.spectators.stats(),
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.websocket is not None:
+            await self.websocket.close()
+        await self.spectators.close()
+
+
+class SpectatorRelay:
+    """観戦者向けの中継サーバー"""
+
+    def __init__(
+        self,
+        upstream_url: str,
+        host: str = "localhost",
+        port: int = 8775,
+        rooms: tuple = (),
+        upstream_codec: str = "json",
+        queue_size: int = 256,
+        slow_consumer_policy: str = DROP_OLDEST,
+        spectator_history: int = 1000,
+        spectator_tick: float = 0.0,
+        ping_interval: Optional[float] = 20.0,
+        ping_timeout: Optional[float] = 20.0,
+        ready_timeout: float = 10.0,
+        room_grace: float = 30.0,
+        upstream_compression: Optional[CompressionPolicy] = None,
+        spectator_compression: Optional[CompressionPolicy] = None,
+    ):
+        self.upstream_url = upstream_url
+        self.host = host
+        self.port = port
+        self.upstream_codec = get_codec(upstream_codec)
+        if self.upstream_codec is None:
+            raise ValueError(f"unknown codec: {upstream_codec}")
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.spectator_history = spectator_history
+        self.spectator_tick = spectator_tick
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.upstream_compression = upstream_compression
+        # 中継に接続してくるのは観戦者か下流の中継（パスを指定しない接続も観戦者として扱う）
+        spectator_compression = spectator_compression or DEFAULT_POLICIES[GODVIEW]
+        self.compression = {
+            PLAYER: spectator_compression,
+            GODVIEW: spectator_compression,
+            RELAY: DEFAULT_POLICIES[RELAY],
+        }
+        # 上流のスナップショットを待つ上限（過ぎたら観戦者を切断する）
+        self.ready_timeout = ready_timeout
+        self.rooms: Dict[str, RoomRelay] = {}
+        # 起動時に購読しておく部屋（観戦者がいなくても片付けない）
+        self.preload = rooms
+        # 観戦者がいなくなった部屋の購読をやめるまでの猶予と、その予定
+        self.room_grace = room_grace
+        self._idle_rooms: Dict[str, asyncio.TimerHandle] = {}
+
+    def get_room(self, room_id: str = DEFAULT_ROOM) -> RoomRelay:
+        """部屋の中継を取得（なければ上流への購読を開始）"""
+        handle = self._idle_rooms.pop(room_id, None)
+        if handle is not None:
+            handle.cancel()
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = RoomRelay(
+                self.upstream_url,
+                room_id,
+                self.upstream_codec,
+                spectator_history=self.spectator_history,
+                spectator_tick=self.spectator_tick,
+                compression=self.upstream_compression,
+            )
+            room.start()
+            self.rooms[room_id] = room
+        return room
+
+    def room_idle(self, room: RoomRelay):
+        """観戦者がいなくなった部屋の購読を room_grace 秒後にやめる（起動時の部屋は残す）"""
+        if room.room_id in self.preload or self.rooms.get(room.room_id) is not room:
+            return
+        handle = self._idle_rooms.pop(room.room_id, None)
+        if handle is not None:
+            handle.cancel()
+        self._idle_rooms[room.room_id] = asyncio.get_running_loop().call_later(
+            max(self.room_grace, 0), self._collect_room, room.room_id
+        )
+
+    def _collect_room(self, room_id: str):
+        self._idle_rooms.pop(room_id, None)
+        room = self.rooms.get(room_id)
+        if room is None or room.clients:
+            return
+        del self.rooms[room_id]
+        spawn(room.close(), f"close relay {room_id}")
+        print(f"🧹 部屋の中継を片付けました [{room_id}]")
+
+    async def handle_client(self, websocket, path: str = ""):
+        """観戦者の接続を処理（プレイヤーは上流に誘導する）"""
+        room = None
+        connection = None
+        try:
+            data = json.loads(await websocket.recv())
+            client_type = data.get("type")
+            room_id = str(data.get("room") or DEFAULT_ROOM)
+
+            if client_type != "godview":
+                # プレイヤーは中継できないので上流に接続し直してもらう
+                await websocket.send(
+                    json.dumps(
+                        {"type": "redirect", "room": room_id, "url": self.upstream_url}
+                    )
+                )
+                await websocket.close()
+                return
+
+            codec = get_codec(data.get("codec"))
+            if codec is None:
+                await websocket.send(unknown_codec_error(data.get("codec")))
+                await websocket.close(code=1003, reason="unknown codec")
+                return
+
+            try:
+                subscription = handshake_subscription(data)
+            except ValueError as e:
+                await websocket.send(json.dumps(subscription_error(e)))
+                await websocket.close(code=1008, reason="invalid subscription")
+                return
+
+            room = self.get_room(room_id)
+            room.clients += 1
+            # 上流のスナップショットが届くまで待つ
+            try:
+                await asyncio.wait_for(room.ready.wait(), self.ready_timeout)
+            except asyncio.TimeoutError:
+                await websocket.close(code=1013, reason="upstream unavailable")
+                return
+            connection = Connection(
+                websocket,
+                maxsize=self.queue_size,
+                policy=self.slow_consumer_policy,
+                label="relay",
+                room=room_id,
+                kind="godview",
+                codec=codec,
+            )
+            connection.start()
+            room.spectators.add(
+                connection,
+                protocol=data.get("protocol", 1),
+                since=data.get("since"),
+                epoch=data.get("epoch"),
+                subscription=subscription,
+            )
+
+            async for msg in websocket:
+                try:
+                    request = codec.decode(msg)
+                except ValueError:
+                    continue
+                room.handle_spectator_message(connection, request)
+
+        except (ConnectionClosed, ValueError):
+            pass
+        finally:
+            if connection is not None:
+                room.spectators.remove(connection)
+                await connection.close()
+            if room is not None:
+                room.clients -= 1
+                if not room.clients:
+                    self.room_idle(room)
+
+    def stats(self) -> Dict[str, dict]:
+        return {room_id: room.stats() for room_id, room in self.rooms.items()}
+
+    async def start(self):
+        """中継サーバーを起動"""
+        print(
+            f"📡 Spectator relay on {self.host}:{self.port} "
+            f"(upstream {self.upstream_url})"
+        )
+        for room_id in self.preload:
+            self.get_room(room_id)
+        try:
+            async with websockets.serve(
+                self.handle_client,
+                self.host,
+                self.port,
+                ping_interval=self.ping_interval,
+                ping_timeout=self.ping_timeout,
+                compression=None,
+                process_request=negotiator(self.compression),
+            ):
+                print("✅ Relay started!")
+                await asyncio.Future()  # 永久に実行
+        finally:
+            for handle in self._idle_rooms.values():
+                handle.cancel()
+            self._idle_rooms.clear()
+            for room in self.rooms.values():
+                await room.close()
+
+
+def _relay_main(upstream_url: str, host: str, port: int, relay_kwargs: dict):
+    relay = SpectatorRelay(upstream_url, host=host, port=port, **relay_kwargs)
+    try:
+        asyncio.run(relay.start())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_relays(count: int, upstream_url: str, host: str, port: int, **relay_kwargs):
+    """port から連番のポートで count 個の中継プロセスを動かし、終了まで待つ"""
+    if count <= 1:
+        _relay_main(upstream_url, host, port, relay_kwargs)
+        return
+
+    ctx = multiprocessing.get_context("spawn")
+    processes: List[multiprocessing.Process] = []
+    for index in range(count):
+        process = ctx.Process(
+            target=_relay_main,
+            args=(upstream_url, host, port + index, relay_kwargs),
+            name=f"werewolf-relay-{index}",
+        )
+        process.start()
+        processes.append(process)
+
+    print(f"📡 {count} relays on {host}:{port}-{port + count - 1} (pid {os.getpid()})")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
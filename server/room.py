@@ -0,0 +1,985 @@
+"""
+werewolf-ai-battle Game Room
+
+1つのゲーム（部屋）の状態。
+部屋ごとにプレイヤー、チャンネル、神視点クライアントを持つ。
+"""
+
+import asyncio
+import hmac
+import secrets
+import time
+from collections import deque
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from .frames import Frame
+from .journal import GameJournal
+from .metrics import ServerMetrics
+from .outbound import CLOSE_REPLACED, Connection, fan_out
+from .ratelimit import Admission
+from .records import CHANNELS, ROLES, ChatMessage, now_ns
+from .search import ChatIndex, parse_query
+from .spectator import SpectatorHub, SubscriptionFilter
+from .tasks import spawn
+
+if TYPE_CHECKING:
+    from .game import WerewolfGame
+
+DEFAULT_ROOM = "default"
+
+# 部屋を作ると用意されるチャンネル
+DEFAULT_CHANNELS: Dict[str, str] = {
+    "public": "全員が見れるチャンネル",
+    "werewolf": "人狼だけのチャンネル",
+    "moderator": "ゲームマスター用チャンネル",
+}
+
+
+# 役職ごとに参加するチャンネル（public は全員）
+ROLE_CHANNELS: Dict[str, tuple] = {
+    "werewolf": ("werewolf",),
+    "moderator": ("moderator",),
+}
+
+
+# 計測値のラベルに使う受信メッセージの種類（それ以外は other）
+MESSAGE_TYPES = ("chat", "history", "action", "query")
+
+# 登録時に知らせるサーバーの機能（batch: 複数のメッセージを1フレームで送れる）
+FEATURES = ("batch", "query")
+
+
+def channels_for(role: str, is_alive: bool = True) -> Set[str]:
+    """役職と生死から参加すべきチャンネルを求める"""
+    channels = {"public"}
+    if is_alive:
+        channels.update(ROLE_CHANNELS.get(role, ()))
+    return channels
+
+
+def check_register(player_id, name, role) -> Optional[dict]:
+    """登録メッセージの player_id・name・role を確かめる（不正ならエラーを返す）"""
+    if not isinstance(player_id, str) or not isinstance(name, str):
+        problem = "player_id と name は文字列で指定してください"
+    elif not isinstance(role, str) or role not in ROLES.ids:
+        problem = f"役職は {', '.join(ROLES.ids)} のいずれかです"
+    else:
+        return None
+    return {
+        "type": "error",
+        "code": "invalid_register",
+        "request": "register",
+        "message": problem,
+    }
+
+
+class Player:
+    """プレイヤー情報（役職は整数 ID で持つ）"""
+
+    __slots__ = (
+        "id",
+        "name",
+        "role_id",
+        "connection",
+        "channels",
+        "is_alive",
+        "resume_token",
+    )
+
+    def __init__(
+        self,
+        player_id: str,
+        name: str,
+        role: str = "villager",
+        resume_token: Optional[str] = None,
+    ):
+        self.id = player_id
+        self.name = name
+        self.role_id = ROLES.id(role)
+        self.connection: Optional[Connection] = None
+        self.channels: Set[str] = set()
+        self.is_alive = True
+        # 同じ player_id で登録し直すときに必要な合言葉（最初の登録時に本人にだけ渡す）
+        self.resume_token = resume_token or secrets.token_urlsafe(16)
+
+    @property
+    def role(self) -> str:
+        return ROLES.name(self.role_id)
+
+    @role.setter
+    def role(self, role: str):
+        self.role_id = ROLES.id(role)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "role": self.role,
+            "is_alive": self.is_alive,
+            "connected": self.connection is not None,
+        }
+
+
+def parse_history(message: dict, capacity: int) -> Tuple[int, int]:
+    """history メッセージの since と limit（不正なら ValueError）
+
+    limit は省略するとチャンネルの保持件数、それより大きければ保持件数に切り詰める。
+    """
+    since = message.get("since", 0)
+    limit = message.get("limit")
+    if limit is None:
+        limit = capacity
+    for key, value in (("since", since), ("limit", limit)):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{key} must be a non-negative integer")
+    return since, min(limit, capacity)
+
+
+class ChatChannel:
+    """チャットチャンネル"""
+
+    def __init__(self, name: str, description: str = "", capacity: int = 100):
+        self.name = name
+        self.id = CHANNELS.acquire(name)
+        self.released = False
+        self.description = description
+        self.capacity = capacity
+        # 最新 capacity 件だけ保持するリングバッファ
+        self.messages: Deque[ChatMessage] = deque(maxlen=capacity)
+        # 最後に付けた通し番号（1から始まり、古いメッセージが消えても戻らない）
+        self.last_seq = 0
+        # 神視点への転送に使う封筒（全メッセージで共有する）
+        self.godview_envelope = {"type": "channel_message", "channel": name}
+        # 発言者（player_id）付きの封筒（購読条件の判定用。発言者ごとに共有する）
+        self._envelopes_from: Dict[str, dict] = {}
+
+    def stamp(self, message: Union[dict, ChatMessage]) -> ChatMessage:
+        """次の通し番号と時刻を付けたレコード（まだ保持しない。append で保持する）"""
+        record = (
+            message
+            if isinstance(message, ChatMessage)
+            else ChatMessage.from_dict(message, self.id)
+        )
+        record.seq = self.last_seq + 1
+        record.time_ns = now_ns()
+        return record
+
+    def append(self, record: ChatMessage):
+        """stamp したレコードを保持し、通し番号を進める"""
+        self.last_seq = record.seq
+        self.messages.append(record)
+
+    def release(self):
+        """チャンネルの ID を返す（部屋を閉じるときに呼ぶ）"""
+        if not self.released:
+            CHANNELS.release(self.name)
+            self.released = True
+
+    def envelope_from(self, player_id: str) -> dict:
+        """発言者付きの神視点向けの封筒"""
+        envelope = self._envelopes_from.get(player_id)
+        if envelope is None:
+            envelope = self._envelopes_from[player_id] = dict(
+                self.godview_envelope, player_id=player_id
+            )
+        return envelope
+
+    @property
+    def first_seq(self) -> int:
+        """保持している最も古いメッセージの通し番号"""
+        return self.last_seq - len(self.messages) + 1
+
+    def records_since(self, seq: int, limit: Optional[int] = None):
+        """seq より後のレコードと、欠落があったかどうかを返す"""
+        truncated = seq + 1 < self.first_seq
+        count = min(self.last_seq - max(seq, 0), len(self.messages))
+        if count <= 0:
+            return [], truncated
+        # 末尾から必要な件数だけ取り出す
+        tail = list(islice(reversed(self.messages), count))
+        tail.reverse()
+        if limit is not None:
+            del tail[limit:]
+        return tail, truncated
+
+    def messages_since(self, seq: int, limit: Optional[int] = None):
+        """seq より後のメッセージ（dict）と、欠落があったかどうかを返す"""
+        records, truncated = self.records_since(seq, limit)
+        return [record.to_dict() for record in records], truncated
+
+
+class GameRoom:
+    """ゲーム部屋"""
+
+    def __init__(
+        self,
+        room_id: str = DEFAULT_ROOM,
+        history_size: int = 100,
+        journal: Optional[GameJournal] = None,
+        spectator_history: int = 1000,
+        spectator_tick: float = 0.0,
+        snapshot_messages: int = 50,
+        metrics: Optional[ServerMetrics] = None,
+        reconnect_grace: float = 30.0,
+        verbose: bool = True,
+    ):
+        self.id = room_id
+        self.history_size = history_size
+        self.players: Dict[str, Player] = {}
+        self.channels: Dict[str, ChatChannel] = {
+            name: ChatChannel(name, description, history_size)
+            for name, description in DEFAULT_CHANNELS.items()
+        }
+        # チャンネル名 -> {player_id: Player}（メンバーのみを走査するための索引）
+        self.members: Dict[str, Dict[str, Player]] = {
+            name: {} for name in self.channels
+        }
+        # 削除したチャンネル（ID は部屋を閉じるときに返す）
+        self._removed_channels: List[ChatChannel] = []
+        self.spectators = SpectatorHub(
+            self.spectator_state,
+            self.init_message,
+            history=spectator_history,
+            tick=spectator_tick,
+        )
+        self.snapshot_messages = snapshot_messages
+        # 全チャンネルの発言の検索用索引（チャンネルの履歴と違って古い発言も消さない）
+        self.search = ChatIndex()
+        self.journal = journal
+        self.metrics = metrics
+        # 切断したプレイヤーを削除するまでの猶予（秒）
+        self.reconnect_grace = reconnect_grace
+        # player_id -> 切断中プレイヤーの削除タイマー
+        self._expiry: Dict[str, asyncio.TimerHandle] = {}
+        # 入退室のログを表示するか（シミュレーションでは無効にする）
+        self.verbose = verbose
+        # フェーズ進行（なければ action はそのまま神視点に転送するだけ）
+        self.game: Optional["WerewolfGame"] = None
+        # 受信の流量制御（なければ制限しない）
+        self.admission: Optional[Admission] = None
+        # プレイヤーも神視点もいなくなったときに呼ぶ（サーバーが部屋を片付ける）
+        self.on_empty: Optional[Callable[["GameRoom"], None]] = None
+
+    def log(self, message: str):
+        if self.verbose:
+            print(message)
+
+    def _record(self, kind: str, data: dict):
+        """ジャーナルに記録（ジャーナル無効時は何もしない）"""
+        if self.journal is not None:
+            data["room"] = self.id
+            self.journal.append(kind, data)
+
+    def apply_record(self, kind: str, data: dict):
+        """ジャーナルの1レコードをメモリ上の状態に反映"""
+        if kind == "register":
+            self._add_player(data["id"], data["name"], data["role"], data.get("token"))
+        elif kind == "unregister":
+            player = self.players.pop(data["id"], None)
+            if player is not None:
+                self._leave_all(player)
+        elif kind == "role":
+            player = self.players.get(data["id"])
+            if player is not None:
+                self._set_role(player, data["role"])
+        elif kind == "alive":
+            player = self.players.get(data["id"])
+            if player is not None:
+                self._set_alive(player, data["is_alive"])
+        elif kind == "channel":
+            self.create_channel(data["name"], data["description"], (), data["capacity"])
+        elif kind == "remove_channel":
+            self.remove_channel(data["name"])
+        elif kind == "join":
+            self.join_channel(data["id"], data["channel"])
+        elif kind == "leave":
+            self.leave_channel(data["id"], data["channel"])
+        elif kind == "chat":
+            channel = self.channels.get(data["channel"])
+            if channel is not None:
+                record = ChatMessage.from_dict(data["message"], channel.id)
+                channel.messages.append(record)
+                channel.last_seq = record.seq
+                self.search.add(record, data.get("phase", ""), data.get("day", 0))
+
+    def create_channel(
+        self,
+        name: str,
+        description: str = "",
+        player_ids=(),
+        capacity: Optional[int] = None,
+    ) -> ChatChannel:
+        """チャンネルを作成（夜ごとの個室などの動的チャンネル）"""
+        channel = self.channels.get(name)
+        if channel is None:
+            channel = ChatChannel(name, description, capacity or self.history_size)
+            self.channels[name] = channel
+            self.members[name] = {}
+            self._record(
+                "channel",
+                {
+                    "name": name,
+                    "description": description,
+                    "capacity": channel.capacity,
+                },
+            )
+        for player_id in player_ids:
+            self.join_channel(player_id, name)
+        return channel
+
+    def remove_channel(self, name: str):
+        """チャンネルを削除し、メンバーの参加情報も消す"""
+        channel = self.channels.pop(name, None)
+        if channel is not None:
+            # 検索インデックスにはまだレコードが残るので ID は部屋を閉じるまで返さない
+            self._removed_channels.append(channel)
+            self._record("remove_channel", {"name": name})
+        for player in self.members.pop(name, {}).values():
+            player.channels.discard(name)
+
+    def join_channel(self, player_id: str, channel_name: str) -> bool:
+        """プレイヤーをチャンネルに参加させる"""
+        if self._join(player_id, channel_name):
+            self._record("join", {"id": player_id, "channel": channel_name})
+            return True
+        return False
+
+    def leave_channel(self, player_id: str, channel_name: str):
+        """プレイヤーをチャンネルから外す"""
+        self._leave(player_id, channel_name)
+        self._record("leave", {"id": player_id, "channel": channel_name})
+
+    def _join(self, player_id: str, channel_name: str) -> bool:
+        player = self.players.get(player_id)
+        members = self.members.get(channel_name)
+        if player is None or members is None:
+            return False
+        members[player_id] = player
+        player.channels.add(channel_name)
+        return True
+
+    def _leave(self, player_id: str, channel_name: str):
+        members = self.members.get(channel_name)
+        if members is not None:
+            members.pop(player_id, None)
+        player = self.players.get(player_id)
+        if player is not None:
+            player.channels.discard(channel_name)
+
+    def _update_role_channels(self, player: Player, before: Set[str]):
+        """役職・生死の変化に合わせて差分だけ参加チャンネルを更新"""
+        after = channels_for(player.role, player.is_alive)
+        for name in before - after:
+            self._leave(player.id, name)
+        for name in after - before:
+            self._join(player.id, name)
+
+    def _set_role(self, player: Player, role: str):
+        before = channels_for(player.role, player.is_alive)
+        player.role = role
+        self._update_role_channels(player, before)
+
+    def _set_alive(self, player: Player, is_alive: bool):
+        before = channels_for(player.role, player.is_alive)
+        player.is_alive = is_alive
+        self._update_role_channels(player, before)
+
+    async def set_role(self, player_id: str, role: str):
+        """役職を変更"""
+        player = self.players.get(player_id)
+        if player is None or player.role == role:
+            return
+        self._set_role(player, role)
+        self._record("role", {"id": player_id, "role": role})
+        await self.broadcast_player_updated(player)
+
+    async def set_alive(self, player_id: str, is_alive: bool):
+        """生死を変更（死亡すると役職チャンネルから外れる）"""
+        player = self.players.get(player_id)
+        if player is None or player.is_alive == is_alive:
+            return
+        self._set_alive(player, is_alive)
+        self._record("alive", {"id": player_id, "is_alive": is_alive})
+        await self.broadcast_player_updated(player)
+
+    async def broadcast_player_updated(self, player: Player):
+        """プレイヤー情報の更新を神視点に配信
+
+        更新は前の更新を置き換えるので、coalesce の接続では未送信の更新を最新に差し替える。
+        """
+        await self.broadcast_godview(
+            {"type": "player_updated", "player": player.to_dict()},
+            key=f"player:{player.id}",
+        )
+
+    async def register_player(
+        self,
+        player_id: str,
+        name: str,
+        role: str = "villager",
+        connection: Optional[Connection] = None,
+    ) -> Player:
+        """プレイヤーを登録（同じIDのプレイヤーがいれば新しい接続を結び付ける）"""
+        player = self.players.get(player_id)
+        if player is not None:
+            return await self.rebind_player(player, connection)
+
+        player = self._add_player(player_id, name, role)
+        player.connection = connection
+        # 再起動後も同じ合言葉で戻れるようにジャーナルにも残す
+        self._record(
+            "register",
+            {"id": player_id, "name": name, "role": role, "token": player.resume_token},
+        )
+
+        # システムメッセージを送信
+        await self.send_to_player(
+            player_id,
+            {
+                "type": "system",
+                "player_id": player_id,
+                "resume_token": player.resume_token,
+                "features": FEATURES,
+                "players": self.roster(),
+                "message": f"ようこそ {name} さん！役職: {role}",
+            },
+        )
+
+        # 全体通知
+        await self.broadcast_godview(
+            {"type": "player_joined", "player": player.to_dict()}
+        )
+
+        self.log(f"✅ プレイヤー登録: {name} ({role}) [{self.id}]")
+
+        return player
+
+    def _add_player(
+        self, player_id: str, name: str, role: str, resume_token: Optional[str] = None
+    ) -> Player:
+        """プレイヤーを追加して役職に応じたチャンネルに参加させる"""
+        player = Player(player_id, name, role, resume_token)
+
+        # 同じIDで登録し直した場合は古い参加情報を消す
+        old = self.players.get(player_id)
+        if old is not None:
+            self._leave_all(old)
+
+        self.players[player_id] = player
+
+        # 役職に応じてチャンネルを設定
+        for channel_name in channels_for(role):
+            self._join(player_id, channel_name)
+
+        return player
+
+    def roster(self) -> List[dict]:
+        """登録時に知らせる参加者の一覧（ゲームがあればその参加者、役職は含めない）"""
+        if self.game is not None:
+            return self.game.roster()
+        return [
+            {"id": p.id, "name": p.name, "is_alive": p.is_alive}
+            for p in self.players.values()
+        ]
+
+    def check_resume(self, player_id: str, resume_token) -> Optional[dict]:
+        """登録済みの player_id での登録を認めるか（合言葉が違えばエラーを返す）"""
+        player = self.players.get(player_id)
+        if player is None:
+            return None
+        if isinstance(resume_token, str) and hmac.compare_digest(
+            resume_token.encode(), player.resume_token.encode()
+        ):
+            return None
+        return {
+            "type": "error",
+            "code": "player_id_in_use",
+            "request": "register",
+            "message": "この player_id は登録済みです（戻るには resume_token が必要です）",
+        }
+
+    async def rebind_player(
+        self, player: Player, connection: Optional[Connection]
+    ) -> Player:
+        """再接続したプレイヤーに新しい接続を結び付ける（役職・生死・チャンネルはそのまま）"""
+        self._cancel_expiry(player.id)
+        old = player.connection
+        player.connection = connection
+        if old is not None and old is not connection:
+            # 古い接続は置き換えられたので閉じる（クライアントは再接続しない）
+            await old.terminate("replaced", CLOSE_REPLACED)
+
+        await self.send_to_player(
+            player.id,
+            {
+                "type": "system",
+                "player_id": player.id,
+                "resumed": True,
+                "features": FEATURES,
+                "players": self.roster(),
+                "message": f"おかえりなさい {player.name} さん！役職: {player.role}",
+            },
+        )
+        await self.broadcast_player_updated(player)
+        self.log(f"🔁 プレイヤー再接続: {player.name} [{self.id}]")
+        return player
+
+    async def detach_player(self, player_id: str, connection: Connection):
+        """切断されたプレイヤーから接続を外し、猶予後に削除する
+
+        猶予中に同じ player_id で登録し直すと元のプレイヤーに戻る。
+        既に別の接続に置き換えられていれば何もしない。
+        """
+        player = self.players.get(player_id)
+        if player is None or player.connection is not connection:
+            return
+        player.connection = None
+        if self.reconnect_grace <= 0:
+            await self.unregister_player(player_id)
+            return
+        self.schedule_expiry(player_id)
+        await self.broadcast_player_updated(player)
+        self.log(f"🔌 プレイヤー切断: {player.name} [{self.id}]")
+
+    def schedule_expiry(self, player_id: str):
+        """猶予が過ぎたら接続のないプレイヤーを削除する"""
+        self._cancel_expiry(player_id)
+        self._expiry[player_id] = asyncio.get_running_loop().call_later(
+            self.reconnect_grace, self._expire, player_id
+        )
+
+    def schedule_detached(self):
+        """接続のない全プレイヤーに削除タイマーを設定（ジャーナルから復元した後など）"""
+        for player in self.players.values():
+            if player.connection is None and player.id not in self._expiry:
+                self.schedule_expiry(player.id)
+
+    def _cancel_expiry(self, player_id: str):
+        handle = self._expiry.pop(player_id, None)
+        if handle is not None:
+            handle.cancel()
+
+    def _expire(self, player_id: str):
+        self._expiry.pop(player_id, None)
+        player = self.players.get(player_id)
+        if player is not None and player.connection is None:
+            spawn(self.unregister_player(player_id), f"expire {self.id} {player_id}")
+
+    async def unregister_player(self, player_id: str):
+        """プレイヤーを削除"""
+        self._cancel_expiry(player_id)
+        if player_id in self.players:
+            player = self.players[player_id]
+            await self.broadcast_godview(
+                {"type": "player_left", "player": player.to_dict()}
+            )
+            self._leave_all(player)
+            del self.players[player_id]
+            self._record("unregister", {"id": player_id})
+            if self.admission is not None:
+                self.admission.forget(player_id)
+            if player.connection:
+                await player.connection.close()
+            self.log(f"❌ プレイヤー退出: {player.name} [{self.id}]")
+            self._check_empty()
+
+    def _leave_all(self, player: Player):
+        """プレイヤーを全ての参加チャンネルの索引から外す"""
+        for channel_name in player.channels:
+            members = self.members.get(channel_name)
+            if members is not None and members.get(player.id) is player:
+                del members[player.id]
+        player.channels.clear()
+
+    async def send_to_player(
+        self, player_id: str, message: dict, key: Optional[str] = None
+    ):
+        """特定のプレイヤーの送信キューにメッセージを追加（待たない）"""
+        player = self.players.get(player_id)
+        if player and player.connection:
+            fan_out((player.connection,), Frame(message), key)
+
+    def broadcast_to_players(self, message: dict):
+        """接続中の全プレイヤーに送信（フェーズの通知など）"""
+        fan_out(
+            (p.connection for p in self.players.values() if p.connection),
+            Frame(message),
+        )
+
+    async def broadcast_to_channel(
+        self,
+        channel_name: str,
+        message: Union[dict, ChatMessage],
+        player_id: Optional[str] = None,
+    ):
+        """チャンネル内の全プレイヤーにブロードキャスト
+
+        player_id は発言者の ID（神視点の購読条件で絞り込めるよう封筒に付ける）。
+        """
+        channel = self.channels.get(channel_name)
+        if not channel:
+            return
+
+        # 索引に追加できてから履歴に残す（途中で失敗しても通し番号を使わない）
+        record = channel.stamp(message)
+        phase, day = self.phase()
+        self.search.add(record, phase, day)
+        channel.append(record)
+        if self.journal is not None:
+            self._record(
+                "chat",
+                {
+                    "channel": channel_name,
+                    "message": record.to_dict(),
+                    "phase": phase,
+                    "day": day,
+                },
+            )
+
+        # 一度だけエンコードしたフレームを全員で共有（dict はエンコード時に作る）
+        frame = Frame.from_record(record)
+        recipients: List[Connection] = [
+            player.connection
+            for player in self.members[channel_name].values()
+            if player.connection
+        ]
+        start = time.perf_counter()
+        fan_out(recipients, frame)
+        if self.metrics is not None:
+            self.metrics.fan_out_seconds.observe(
+                time.perf_counter() - start, self.id, "channel"
+            )
+            self.metrics.messages_out.inc(
+                self.id, channel_name, record.type, amount=len(recipients)
+            )
+
+        # 神視点にも送信（プレイヤー向けのエンコード結果を埋め込む）
+        envelope = (
+            channel.godview_envelope
+            if player_id is None
+            else channel.envelope_from(player_id)
+        )
+        await self.broadcast_godview(Frame.wrap(envelope, "message", frame))
+
+    def phase(self):
+        """現在のフェーズと日（ゲームがなければ ("", 0)）"""
+        if self.game is None:
+            return "", 0
+        return self.game.phase, self.game.day
+
+    def query(self, message: dict, visible: Optional[Set[str]] = None) -> dict:
+        """発言を検索して query_result（または error）を返す
+
+        visible は検索してよいチャンネル名（None なら全て。神視点用）。
+        """
+        request_id = message.get("id")
+        try:
+            options = parse_query(message)
+        except ValueError as e:
+            return {
+                "type": "error",
+                "code": "invalid_query",
+                "request": "query",
+                "id": request_id,
+                "message": str(e),
+            }
+
+        names = options.pop("channels")
+        if names is None:
+            names = visible
+        elif visible is not None:
+            denied = [name for name in names if name not in visible]
+            if denied:
+                return {
+                    "type": "error",
+                    "code": "not_member",
+                    "request": "query",
+                    "id": request_id,
+                    "message": f"チャンネル {', '.join(denied)} は検索できません",
+                }
+
+        if names is None:
+            docs, truncated = self.search.search(**options)
+        else:
+            # 未知の名前で CHANNELS を増やさない
+            channel_ids = [
+                CHANNELS.ids[name] for name in names if name in CHANNELS.ids
+            ]
+            docs, truncated = (
+                self.search.search(channels=channel_ids, **options)
+                if channel_ids
+                else ([], False)
+            )
+        return {
+            "type": "query_result",
+            "id": request_id,
+            "count": len(docs),
+            "truncated": truncated,
+            "messages": [self.search.to_dict(doc) for doc in docs],
+        }
+
+    async def broadcast_godview(
+        self, message: Union[dict, Frame], key: Optional[str] = None
+    ):
+        """神視点クライアントに配信（通し番号付きの差分として履歴にも残す）"""
+        if self.metrics is None:
+            self.spectators.publish(message, key)
+            return
+        event_type = (
+            message.type if isinstance(message, Frame) else message.get("type")
+        )
+        start = time.perf_counter()
+        delivered = self.spectators.publish(message, key)
+        self.metrics.fan_out_seconds.observe(
+            time.perf_counter() - start, self.id, "godview"
+        )
+        self.metrics.messages_out.inc(
+            self.id, "godview", event_type or "", amount=delivered
+        )
+
+    def add_godview(
+        self,
+        connection: Connection,
+        protocol: int = 1,
+        since: Optional[int] = None,
+        epoch: Optional[str] = None,
+        subscription: Optional[SubscriptionFilter] = None,
+    ):
+        """神視点クライアントを追加し、初期データ（または抜けた差分）を送信"""
+        self.spectators.add(connection, protocol, since, epoch, subscription)
+
+    async def remove_godview(self, connection: Connection):
+        """神視点クライアントを外す"""
+        self.spectators.remove(connection)
+        await connection.close()
+        self._check_empty()
+
+    async def handle_spectator_message(self, connection: Connection, message: dict):
+        """神視点クライアントからのメッセージを処理"""
+        if message.get("type") == "resync":
+            # 差分の欠落を検出したクライアントにスナップショットを送り直す
+            self.spectators.resync(connection)
+        elif message.get("type") == "stats":
+            # 統計パネル用（状態ではないので差分の通し番号は付けない）
+            connection.enqueue(Frame(self.stats_message()), key="stats")
+        elif message.get("type") == "query":
+            # 神視点は全てのチャンネルを検索できる
+            connection.enqueue(Frame(self.query(message)))
+        elif message.get("type") == "subscribe":
+            # 購読条件を変更（新しい条件でのスナップショットが届く）
+            error = self.spectators.subscribe(connection, message)
+            if error is not None:
+                connection.enqueue(Frame(error))
+
+    def stats_message(self) -> dict:
+        """接続数・チャンネルごとの件数・処理時間などの統計フレーム"""
+        connections = [p.connection for p in self.players.values() if p.connection]
+        godviews = self.spectators.connections
+        queues = [conn.stats() for conn in connections] + [
+            conn.stats() for conn in godviews
+        ]
+        stats = {
+            "type": "stats",
+            "room": self.id,
+            "time": time.monotonic(),
+            "connections": {"players": len(connections), "godview": len(godviews)},
+            "queues": {
+                "depth": sum(q["depth"] for q in queues),
+                "max_depth": max((q["max_depth"] for q in queues), default=0),
+                "dropped": sum(q["dropped"] for q in queues),
+                "failed": sum(q["failed"] for q in queues),
+            },
+            "spectators": self.spectators.stats(),
+        }
+        if self.metrics is not None:
+            stats.update(self.metrics.room_stats(self.id))
+        return stats
+
+    def spectator_state(self) -> dict:
+        """スナップショットに含める部屋の状態"""
+        return {
+            "room": self.id,
+            "players": [p.to_dict() for p in self.players.values()],
+            "channels": {
+                name: {
+                    "name": ch.name,
+                    "description": ch.description,
+                    "last_seq": ch.last_seq,
+                    "messages": ch.messages_since(
+                        ch.last_seq - self.snapshot_messages
+                    )[0],
+                }
+                for name, ch in self.channels.items()
+            },
+            "game": self.game.to_dict() if self.game is not None else None,
+        }
+
+    def init_message(self) -> dict:
+        """神視点（プロトコル 1）向けの初期データ"""
+        return {
+            "type": "init",
+            "room": self.id,
+            "players": [p.to_dict() for p in self.players.values()],
+            "channels": {
+                name: {
+                    "name": ch.name,
+                    "description": ch.description,
+                    "message_count": len(ch.messages),
+                    "last_seq": ch.last_seq,
+                }
+                for name, ch in self.channels.items()
+            },
+        }
+
+    def queue_stats(self) -> dict:
+        """接続ごとのキュー深さなどの統計"""
+        return {
+            "players": {
+                player.id: player.connection.stats()
+                for player in self.players.values()
+                if player.connection
+            },
+            "godview": [conn.stats() for conn in self.spectators.connections],
+        }
+
+    def is_empty(self) -> bool:
+        """プレイヤー（再接続の猶予中を含む）も神視点もいないか"""
+        return not self.players and not self.spectators
+
+    def _check_empty(self):
+        if self.on_empty is not None and self.is_empty():
+            self.on_empty(self)
+
+    async def close(self):
+        """部屋を片付ける（フェーズの期限・削除の予定・神視点の tick を止める）"""
+        if self.game is not None:
+            self.game.stop()
+        for handle in self._expiry.values():
+            handle.cancel()
+        self._expiry.clear()
+        for channel in (*self.channels.values(), *self._removed_channels):
+            channel.release()
+        self._removed_channels.clear()
+        await self.spectators.close()
+
+    async def handle_message(self, player_id: str, message: dict):
+        """プレイヤーからのメッセージを処理"""
+        msg_type = message.get("type")
+
+        if msg_type == "chat":
+            # チャットメッセージ
+            channel_name = message.get("channel", "public")
+            channel = (
+                self.channels.get(channel_name) if isinstance(channel_name, str) else None
+            )
+            content = message.get("content", "")
+
+            player = self.players.get(player_id)
+            if not player or channel is None:
+                return
+            if not isinstance(content, str):
+                await self.send_to_player(
+                    player_id,
+                    {
+                        "type": "error",
+                        "code": "invalid_content",
+                        "request": "chat",
+                        "channel": channel.name,
+                        "message": "content must be a string",
+                    },
+                )
+                return
+
+            chat_message = ChatMessage(channel.id, player.name, player.role_id, content)
+            await self.broadcast_to_channel(channel.name, chat_message, player_id)
+
+        elif msg_type == "history":
+            # 指定した通し番号より後の履歴だけを返す
+            channel_name = message.get("channel", "public")
+
+            player = self.players.get(player_id)
+            channel = self.channels.get(channel_name)
+            if not player or channel_name not in player.channels or not channel:
+                await self.send_to_player(
+                    player_id,
+                    {
+                        "type": "error",
+                        "code": "not_member",
+                        "request": "history",
+                        "channel": channel_name,
+                        "message": f"チャンネル {channel_name} の履歴は取得できません",
+                    },
+                )
+                return
+            try:
+                since, limit = parse_history(message, channel.capacity)
+            except ValueError as e:
+                await self.send_to_player(
+                    player_id,
+                    {
+                        "type": "error",
+                        "code": "invalid_history",
+                        "request": "history",
+                        "channel": channel_name,
+                        "message": str(e),
+                    },
+                )
+                return
+
+            messages, truncated = channel.messages_since(since, limit)
+            await self.send_to_player(
+                player_id,
+                {
+                    "type": "history",
+                    "channel": channel_name,
+                    "since": since,
+                    "first_seq": channel.first_seq,
+                    "last_seq": channel.last_seq,
+                    "truncated": truncated,
+                    "messages": messages,
+                },
+            )
+
+        elif msg_type == "query":
+            # 参加しているチャンネルの発言だけを検索できる
+            player = self.players.get(player_id)
+            if player:
+                await self.send_to_player(
+                    player_id, self.query(message, player.channels)
+                )
+
+        elif msg_type == "action":
+            # ゲームアクション（投票、襲撃など）
+            if self.game is not None:
+                error = self.game.check_action(player_id, message)
+                if error is not None:
+                    await self.send_to_player(
+                        player_id,
+                        {
+                            "type": "error",
+                            "code": error,
+                            "request": "action",
+                            "action": message.get("action"),
+                            "message": f"アクション {message.get('action')} は受け付けられません",
+                        },
+                    )
+                    return
+
+            self._record("action", {"id": player_id, "action": message})
+            await self.broadcast_godview(
+                {"type": "action", "player_id": player_id, "action": message}
+            )
+            if self.game is not None:
+                await self.game.apply_action(player_id, message)
+
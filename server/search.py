@@ -0,0 +1,251 @@
+"""
+werewolf-ai-battle Chat Search
+
+部屋のチャットを検索するためのメモリ上の索引。
+
+- 本文: 文字 n-gram（既定は 2-gram）の転置索引。日本語の会話を単語に分けずに引ける
+  n 文字より短い検索語（「狼」など）は1文字ごとの索引で引く
+- 発言者・チャンネル・フェーズ・日ごとの索引
+- チャンネル内の通し番号の範囲
+
+メッセージごとに索引へ追記するだけなので、ゲームが長くなっても検索は
+候補の少ない索引から順に絞り込む分しかかからない。
+ポスティング（文書番号の列）は追記順＝昇順の array で持ち、二分探索で突き合わせる。
+"""
+
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .records import ChatMessage
+
+# 1回の検索で返す件数の上限
+MAX_RESULTS = 200
+DEFAULT_RESULTS = 50
+
+
+def normalize(text: str) -> str:
+    """全角・半角と大文字・小文字の違いをなくす"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def ngrams(text: str, n: int = 2) -> Set[str]:
+    """正規化済みの文字列の n-gram（n 文字未満なら空）"""
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def _int(message: dict, key: str) -> Optional[int]:
+    value = message.get(key)
+    if value is None:
+        return None
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ValueError(f"{key} must be an integer")
+    return value
+
+
+def _str(message: dict, key: str) -> Optional[str]:
+    value = message.get(key)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{key} must be a string")
+    return value
+
+
+def parse_query(message: dict) -> dict:
+    """query メッセージを ChatIndex.search の引数に（不正なら ValueError）
+
+    channel は名前1つか名前のリストで、channels（None なら指定なし）として返す。
+    """
+    channel = message.get("channel")
+    if channel is None:
+        channels = None
+    elif isinstance(channel, str):
+        channels = [channel]
+    elif isinstance(channel, list) and all(isinstance(c, str) for c in channel):
+        channels = channel
+    else:
+        raise ValueError("channel must be a string or a list of strings")
+
+    limit = _int(message, "limit")
+    if limit is None:
+        limit = DEFAULT_RESULTS
+    if not 1 <= limit <= MAX_RESULTS:
+        raise ValueError(f"limit must be between 1 and {MAX_RESULTS}")
+
+    return {
+        "text": _str(message, "text"),
+        "player": _str(message, "player"),
+        "channels": channels,
+        "phase": _str(message, "phase"),
+        "day": _int(message, "day"),
+        "since": _int(message, "since"),
+        "until": _int(message, "until"),
+        "limit": limit,
+    }
+
+
+def _postings() -> array:
+    return array("I")
+
+
+class ChatIndex:
+    """チャットの転置索引（発言ごとに追記）"""
+
+    def __init__(self, n: int = 2):
+        self.n = n
+        # 文書番号 -> レコードと、その発言があったフェーズ・日
+        self.records: List[ChatMessage] = []
+        self.phases: List[str] = []
+        self.days = array("I")
+        # 各索引: キー -> 文書番号の昇順の列
+        self.grams: Dict[str, array] = {}
+        self.chars: Dict[str, array] = {}
+        self.speakers: Dict[str, array] = {}
+        self.channels: Dict[int, array] = {}
+        self.by_phase: Dict[str, array] = {}
+        self.by_day: Dict[int, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def add(self, record: ChatMessage, phase: str = "", day: int = 0):
+        """1発言を索引に追加"""
+        doc = len(self.records)
+        self.records.append(record)
+        self.phases.append(phase)
+        self.days.append(day)
+
+        content = normalize(record.content)
+        for index, keys in (
+            (self.grams, ngrams(content, self.n)),
+            (self.chars, set(content)),
+        ):
+            for key in keys:
+                postings = index.get(key)
+                if postings is None:
+                    postings = index[key] = _postings()
+                postings.append(doc)
+        for index, key in (
+            (self.speakers, record.player),
+            (self.channels, record.channel_id),
+            (self.by_phase, phase),
+            (self.by_day, day),
+        ):
+            postings = index.get(key)
+            if postings is None:
+                postings = index[key] = _postings()
+            postings.append(doc)
+
+    def search(
+        self,
+        text: Optional[str] = None,
+        player: Optional[str] = None,
+        channels: Optional[Iterable[int]] = None,
+        phase: Optional[str] = None,
+        day: Optional[int] = None,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = DEFAULT_RESULTS,
+    ) -> Tuple[List[int], bool]:
+        """条件に合う発言の文書番号（古い順、新しい方から limit 件）と、まだあるかどうか
+
+        channels は検索してよいチャンネル ID（None なら全て）。
+        since / until はチャンネル内の通し番号で、since より後・until 以下。
+        """
+        allowed = None if channels is None else set(channels)
+        if allowed is not None and not allowed:
+            return [], False
+        needle = normalize(text) if text else ""
+        # 絞り込みに使う索引の (列, 開始, 終了)
+        views: List[Tuple[Sequence[int], int, int]] = []
+
+        if len(needle) < self.n:
+            # n-gram がない短い検索語は1文字ごとの索引で絞る
+            keys = [(self.chars, char) for char in set(needle)]
+        else:
+            keys = [(self.grams, gram) for gram in ngrams(needle, self.n)]
+        keys += [
+            (index, key)
+            for index, key in (
+                (self.speakers, player),
+                (self.by_phase, phase),
+                (self.by_day, day),
+            )
+            if key is not None
+        ]
+        for index, key in keys:
+            postings = index.get(key)
+            if postings is None:
+                return [], False
+            views.append((postings, 0, len(postings)))
+
+        if allowed is not None and len(allowed) == 1:
+            # 1チャンネルならその索引を通し番号の範囲で切り出す
+            (channel_id,) = allowed
+            postings = self.channels.get(channel_id)
+            if postings is None:
+                return [], False
+            lo, hi = 0, len(postings)
+            if since is not None:
+                lo = bisect_left(postings, since + 1, key=self._seq)
+            if until is not None:
+                hi = bisect_right(postings, until, lo=lo, key=self._seq)
+            views.append((postings, lo, hi))
+            allowed = since = until = None
+
+        if not views:
+            views.append((range(len(self.records)), 0, len(self.records)))
+        # 一番短い列を新しい方からたどり、残りの列は二分探索で確かめる
+        views.sort(key=lambda view: view[2] - view[1])
+        (base, lo, hi), others = views[0], views[1:]
+
+        results: List[int] = []
+        records = self.records
+        for i in range(hi - 1, lo - 1, -1):
+            doc = base[i]
+            if not all(_contains(view, doc) for view in others):
+                continue
+            record = records[doc]
+            if allowed is not None and record.channel_id not in allowed:
+                continue
+            if since is not None and record.seq <= since:
+                continue
+            if until is not None and record.seq > until:
+                continue
+            if needle and needle not in normalize(record.content):
+                continue
+            if len(results) == limit:
+                results.reverse()
+                return results, True
+            results.append(doc)
+        results.reverse()
+        return results, False
+
+    def _seq(self, doc: int) -> int:
+        return self.records[doc].seq
+
+    def to_dict(self, doc: int) -> dict:
+        """検索結果の1件（メッセージにフェーズと日を付ける）"""
+        message = self.records[doc].to_dict()
+        message["phase"] = self.phases[doc]
+        message["day"] = self.days[doc]
+        return message
+
+    def stats(self) -> dict:
+        return {
+            "messages": len(self.records),
+            "grams": len(self.grams),
+            "chars": len(self.chars),
+            "postings": sum(
+                len(postings)
+                for index in (self.grams, self.chars)
+                for postings in index.values()
+            ),
+        }
+
+
+def _contains(view: Tuple[Sequence[int], int, int], doc: int) -> bool:
+    """昇順の列の範囲に doc が含まれるか"""
+    postings, lo, hi = view
+    i = bisect_left(postings, doc, lo, hi)
+    return i < hi and postings[i] == doc
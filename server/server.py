@@ -4,262 +4,810 @@ werewolf-ai-battle Chat Server
 
 リアルタイムチャットサーバー。
 複数のチャンネル（public, werewolf, moderator）をサポート。
+1つのサーバーで複数のゲーム部屋を同時に扱える。
 """
 
+import argparse
 import asyncio
 import websockets
 import json
-from datetime import datetime
-from typing import Dict, Set, Optional
+import time
+from typing import Dict, Optional
+from urllib.parse import urlsplit
 import uuid
 
-
-class Player:
-    """プレイヤー情報"""
-
-    def __init__(self, player_id: str, name: str, role: str = "villager"):
-        self.id = player_id
-        self.name = name
-        self.role = role
-        self.websocket = None
-        self.channels: Set[str] = set()
-        self.is_alive = True
-
-    def to_dict(self) -> dict:
-        return {
-            "id": self.id,
-            "name": self.name,
-            "role": self.role,
-            "is_alive": self.is_alive,
-        }
-
-
-class ChatChannel:
-    """チャットチャンネル"""
-
-    def __init__(self, name: str, description: str = ""):
-        self.name = name
-        self.description = description
-        self.messages: list = []
-
-    def add_message(self, message: dict):
-        message["timestamp"] = datetime.now().isoformat()
-        self.messages.append(message)
-        # 最新100件だけ保持
-        if len(self.messages) > 100:
-            self.messages = self.messages[-100:]
+from .codec import JSON, Codec, get_codec, unknown_codec_error
+from .compression import (
+    DEFAULT_POLICIES,
+    GODVIEW,
+    PLAYER,
+    RELAY,
+    CompressionPolicy,
+    negotiator,
+    parse_policy,
+)
+from .game import WerewolfGame
+from .journal import GameJournal, replay
+from .metrics import ServerMetrics
+from .outbound import DROP_OLDEST, SLOW_CONSUMER_POLICIES, Connection
+from .ratelimit import Admission, IngestLimits
+from .recording import Recorder
+from .room import (
+    DEFAULT_CHANNELS,
+    DEFAULT_ROOM,
+    MESSAGE_TYPES,
+    GameRoom,
+    check_register,
+)
+from .room import ChatChannel, Player, channels_for  # noqa: F401（互換のため）
+from .shard import room_worker, run_workers, worker_port
+from .spectator import handshake_subscription, subscription_error
+from .tasks import spawn
+from .timerwheel import TimerWheel
+
+# 全てのアドレスで待ち受けるときのホスト（誘導先の URL には使えない）
+WILDCARD_HOSTS = ("", "0.0.0.0", "::")
+
+# 接続を切るフレームの大きさ（max_frame_size の倍数）
+MAX_SIZE_FACTOR = 4
 
 
 class WerewolfServer:
     """人狼ゲームチャットサーバー"""
 
-    def __init__(self, host: str = "localhost", port: int = 8765):
+    def __init__(
+        self,
+        host: str = "localhost",
+        advertise_host: Optional[str] = None,
+        port: int = 8765,
+        queue_size: int = 256,
+        slow_consumer_policy: str = DROP_OLDEST,
+        history_size: int = 100,
+        journal_dir: Optional[str] = None,
+        worker_index: int = 0,
+        workers: int = 1,
+        spectator_history: int = 1000,
+        spectator_tick: float = 0.0,
+        metrics_host: str = "127.0.0.1",
+        metrics_port: Optional[int] = None,
+        ping_interval: Optional[float] = 20.0,
+        ping_timeout: Optional[float] = 20.0,
+        idle_timeout: Optional[float] = None,
+        reconnect_grace: float = 30.0,
+        phase_durations: Optional[Dict[str, float]] = None,
+        limits: Optional[IngestLimits] = None,
+        recorder: Optional[Recorder] = None,
+        compression: Optional[Dict[str, CompressionPolicy]] = None,
+    ):
         self.host = host
+        # 誘導先の URL に使うホスト名（待ち受けが 0.0.0.0 などのとき、外から届く名前）
+        self.advertise_host = advertise_host
         self.port = port
-        self.players: Dict[str, Player] = {}
-        self.channels: Dict[str, ChatChannel] = {
-            "public": ChatChannel("public", "全員が見れるチャンネル"),
-            "werewolf": ChatChannel("werewolf", "人狼だけのチャンネル"),
-            "moderator": ChatChannel("moderator", "ゲームマスター用チャンネル"),
-        }
-        self.godview_clients: Set = set()
-
-    async def register_player(
-        self, websocket, player_id: str, name: str, role: str = "villager"
-    ):
-        """プレイヤーを登録"""
-        player = Player(player_id, name, role)
-        player.websocket = websocket
-
-        # 役職に応じてチャンネルを設定
-        player.channels.add("public")
-        if role == "werewolf":
-            player.channels.add("werewolf")
-        if role == "moderator":
-            player.channels.add("moderator")
-
-        self.players[player_id] = player
-
-        # システムメッセージを送信
-        await self.send_to_player(
-            player_id,
-            {
-                "type": "system",
-                "message": f"ようこそ {name} さん！役職: {role}",
-            },
+        self.queue_size = queue_size
+        self.slow_consumer_policy = slow_consumer_policy
+        self.history_size = history_size
+        self.rooms: Dict[str, GameRoom] = {}
+        # 空になった部屋を片付ける予定（猶予中に誰か来れば取り消す）
+        self._idle_rooms: Dict[str, asyncio.TimerHandle] = {}
+        self.journal_dir = journal_dir
+        self.journal: Optional[GameJournal] = None
+        self.worker_index = worker_index
+        self.workers = workers
+        self.spectator_history = spectator_history
+        self.spectator_tick = spectator_tick
+        self.metrics_host = metrics_host
+        self.metrics_port = metrics_port
+        # 生存確認（WebSocket の ping）と無通信での切断
+        self.ping_interval = ping_interval
+        self.ping_timeout = ping_timeout
+        self.idle_timeout = idle_timeout
+        self.reconnect_grace = reconnect_grace
+        # 全部屋のフェーズ期限を1つのタイマーホイールで扱う
+        self.phase_durations = phase_durations
+        self.timers = TimerWheel()
+        # プレイヤーからの受信の上限（頻度・フレームの大きさ・本文の長さ）
+        self.limits = limits if limits is not None else IngestLimits()
+        # 接続の種類（player / godview / relay）ごとの圧縮の設定
+        self.compression = {**DEFAULT_POLICIES, **(compression or {})}
+        # 受信したフレームの記録（python -m server.recording で再生できる）
+        self.recorder = recorder
+        self.metrics = ServerMetrics()
+        self.metrics.gauge(
+            "werewolf_connections",
+            "接続中のプレイヤー・神視点の数",
+            ("room", "kind"),
+            collect=self.connection_counts,
         )
-
-        # 全体通知
-        await self.broadcast_godview(
-            {"type": "player_joined", "player": player.to_dict()}
+        self.metrics.gauge(
+            "werewolf_queue_depth",
+            "送信キューに溜まっているフレーム数",
+            ("room", "kind"),
+            collect=self.queue_depths,
         )
 
-        print(f"✅ プレイヤー登録: {name} ({role})")
-
-        return player
-
-    async def unregister_player(self, player_id: str):
-        """プレイヤーを削除"""
-        if player_id in self.players:
-            player = self.players[player_id]
-            await self.broadcast_godview(
-                {"type": "player_left", "player": player.to_dict()}
+    def get_room(self, room_id: str = DEFAULT_ROOM) -> GameRoom:
+        """部屋を取得（なければ作成）"""
+        handle = self._idle_rooms.pop(room_id, None)
+        if handle is not None:
+            handle.cancel()
+        room = self.rooms.get(room_id)
+        if room is None:
+            room = GameRoom(
+                room_id,
+                self.history_size,
+                self.journal,
+                spectator_history=self.spectator_history,
+                spectator_tick=self.spectator_tick,
+                metrics=self.metrics,
+                reconnect_grace=self.reconnect_grace,
             )
-            del self.players[player_id]
-            print(f"❌ プレイヤー退出: {player.name}")
-
-    async def send_to_player(self, player_id: str, message: dict):
-        """特定のプレイヤーにメッセージを送信"""
-        if player_id in self.players:
-            player = self.players[player_id]
-            if player.websocket:
-                try:
-                    await player.websocket.send(json.dumps(message))
-                except:
-                    pass
-
-    async def broadcast_to_channel(self, channel_name: str, message: dict):
-        """チャンネル内の全プレイヤーにブロードキャスト"""
-        channel = self.channels.get(channel_name)
-        if not channel:
+            room.game = WerewolfGame(room, self.timers, self.phase_durations)
+            room.admission = Admission(self.limits)
+            if self.recorder is not None:
+                self.recorder.watch(room)
+            room.on_empty = self.room_emptied
+            self.rooms[room_id] = room
+        return room
+
+    def room_emptied(self, room: GameRoom):
+        """誰もいなくなった部屋を reconnect_grace 秒後に片付ける（既定の部屋は残す）"""
+        if room.id == DEFAULT_ROOM or self.rooms.get(room.id) is not room:
             return
+        handle = self._idle_rooms.pop(room.id, None)
+        if handle is not None:
+            handle.cancel()
+        self._idle_rooms[room.id] = asyncio.get_running_loop().call_later(
+            max(self.reconnect_grace, 0), self._collect_room, room.id
+        )
 
-        channel.add_message(message)
-
-        for player in self.players.values():
-            if channel_name in player.channels:
-                await self.send_to_player(player.id, message)
-
-        # 神視点にも送信
-        await self.broadcast_godview(
-            {
-                "type": "channel_message",
-                "channel": channel_name,
-                "message": message,
-            }
+    def _collect_room(self, room_id: str):
+        self._idle_rooms.pop(room_id, None)
+        room = self.rooms.get(room_id)
+        if room is None or not room.is_empty():
+            return
+        del self.rooms[room_id]
+        self.metrics.forget("room", room_id)
+        spawn(room.close(), f"close room {room_id}")
+        room.log(f"🧹 部屋を片付けました [{room_id}]")
+
+    def owns_room(self, room_id: str) -> bool:
+        """この部屋をこのワーカーが担当しているか"""
+        return room_worker(room_id, self.workers) == self.worker_index
+
+    def create_connection(
+        self,
+        websocket,
+        label: str = "",
+        room_id: str = "",
+        kind: str = "player",
+        codec: Codec = JSON,
+    ) -> Connection:
+        """送信キュー付きの接続を作成して送信タスクを開始"""
+        connection = Connection(
+            websocket,
+            maxsize=self.queue_size,
+            policy=self.slow_consumer_policy,
+            label=label,
+            metrics=self.metrics,
+            room=room_id,
+            kind=kind,
+            codec=codec,
         )
+        connection.start()
+        return connection
+
+    def queue_stats(self) -> dict:
+        """部屋・接続ごとのキュー深さなどの統計"""
+        return {room_id: room.queue_stats() for room_id, room in self.rooms.items()}
+
+    def connection_counts(self) -> Dict[tuple, float]:
+        """部屋ごとの接続数（計測値用）"""
+        counts = {}
+        for room_id, room in self.rooms.items():
+            counts[(room_id, "player")] = sum(
+                1 for player in room.players.values() if player.connection
+            )
+            counts[(room_id, "godview")] = len(room.spectators.connections)
+        return counts
+
+    def queue_depths(self) -> Dict[tuple, float]:
+        """部屋ごとの送信キューの深さの合計（計測値用）"""
+        depths = {}
+        for room_id, room in self.rooms.items():
+            depths[(room_id, "player")] = sum(
+                len(player.connection.queue)
+                for player in room.players.values()
+                if player.connection
+            )
+            depths[(room_id, "godview")] = sum(
+                len(conn.queue) for conn in room.spectators.connections
+            )
+        return depths
 
-    async def broadcast_godview(self, message: dict):
-        """神視点クライアントにブロードキャスト"""
-        if self.godview_clients:
-            removed = set()
-            for ws in self.godview_clients:
-                try:
-                    await ws.send(json.dumps(message))
-                except:
-                    removed.add(ws)
-            self.godview_clients -= removed
-
-    async def handle_message(self, player_id: str, message: dict):
-        """プレイヤーからのメッセージを処理"""
-        msg_type = message.get("type")
-
-        if msg_type == "chat":
-            # チャットメッセージ
-            channel = message.get("channel", "public")
-            content = message.get("content", "")
-
-            player = self.players.get(player_id)
-            if not player:
+    async def handle_player_message(
+        self, room: GameRoom, player_id: str, msg, codec: Codec = JSON
+    ):
+        """プレイヤーからの1メッセージを処理し、件数と処理時間を記録"""
+        admission = room.admission
+        if admission is not None:
+            # 大きさと頻度はデコードする前に判定する
+            error = admission.check_frame(player_id, len(msg))
+            if error is not None:
+                await self.reject(room, player_id, error)
                 return
 
-            chat_message = {
-                "type": "chat",
-                "channel": channel,
-                "player": player.name,
-                "role": player.role,
-                "content": content,
-            }
+        try:
+            data = codec.decode(msg)
+        except ValueError:
+            self.metrics.errors.inc(room.id, f"invalid_{codec.name}")
+            return
+        if not isinstance(data, dict):
+            self.metrics.errors.inc(room.id, "invalid_message")
+            return
 
-            await self.broadcast_to_channel(channel, chat_message)
+        if data.get("type") == "batch":
+            await self.handle_batch(room, player_id, data)
+        else:
+            await self.dispatch_player_message(room, player_id, data)
 
-        elif msg_type == "action":
-            # ゲームアクション（投票、襲撃など）
-            await self.broadcast_godview(
-                {"type": "action", "player_id": player_id, "action": message}
-            )
+    async def handle_batch(self, room: GameRoom, player_id: str, data: dict):
+        """1フレームにまとめて送られたメッセージを順に処理"""
+        messages = data.get("messages")
+        if not isinstance(messages, list):
+            self.metrics.errors.inc(room.id, "invalid_batch")
+            return
+        admission = room.admission
+        for i, message in enumerate(messages):
+            if not isinstance(message, dict) or message.get("type") == "batch":
+                self.metrics.errors.inc(room.id, "invalid_message")
+                continue
+            # 1件目はフレームとして数えた分
+            if i and admission is not None:
+                error = admission.check_rate(player_id)
+                if error is not None:
+                    error["dropped"] = len(messages) - i
+                    await self.reject(room, player_id, error)
+                    return
+            await self.dispatch_player_message(room, player_id, message)
+
+    async def dispatch_player_message(
+        self, room: GameRoom, player_id: str, data: dict
+    ):
+        """デコード済みの1メッセージを部屋に渡す"""
+        admission = room.admission
+        msg_type = data.get("type")
+        if msg_type not in MESSAGE_TYPES:
+            msg_type = "other"
+        channel = data.get("channel", "")
+        if not isinstance(channel, str) or channel not in room.channels:
+            channel = ""
+
+        if admission is not None:
+            if msg_type == "chat" and channel:
+                error = admission.check_chat(channel, data.get("content"))
+                if error is not None:
+                    await self.reject(room, player_id, error)
+                    return
+            admission.accepted(player_id)
+
+        start = time.perf_counter()
+        try:
+            await room.handle_message(player_id, data)
+        except Exception as e:
+            self.metrics.errors.inc(room.id, "handler")
+            print(f"⚠️ メッセージ処理エラー: {msg_type}: {e!r} [{room.id}]")
+            return
+        self.metrics.handle_seconds.observe(
+            time.perf_counter() - start, room.id, msg_type
+        )
+        self.metrics.messages_in.inc(room.id, channel, msg_type)
+
+    async def reject(self, room: GameRoom, player_id: str, error: dict):
+        """流量制御で捨てたメッセージを数え、同じ理由の拒否が続く間は最初の1回だけ知らせる"""
+        reason = error["code"]
+        if "scope" in error:
+            reason = f"{reason}_{error['scope']}"
+        self.metrics.rejected.inc(room.id, reason, amount=error.get("dropped", 1))
+        if room.admission.should_notify(player_id, reason):
+            await room.send_to_player(player_id, error)
+
+    def restore_from_journal(self, directory: str) -> int:
+        """ジャーナルを再生して各部屋のプレイヤーとチャンネル履歴を復元"""
+        count = 0
+        for kind, data in replay(directory):
+            room_id = data.pop("room", DEFAULT_ROOM)
+            self.get_room(room_id).apply_record(kind, data)
+            count += 1
+        return count
+
+    def redirect_host(self, websocket) -> str:
+        """誘導先のホスト名（--advertise-host、なければ接続に使われた Host ヘッダー）"""
+        if self.advertise_host:
+            return self.advertise_host
+        request = getattr(websocket, "request", None)
+        header = request.headers.get("Host") if request is not None else None
+        if header:
+            hostname = urlsplit(f"//{header}").hostname
+            if hostname:
+                return hostname
+        if self.host in WILDCARD_HOSTS:
+            return "localhost"
+        return self.host
+
+    async def redirect(self, websocket, room_id: str):
+        """担当外の部屋への接続を担当ワーカーに誘導"""
+        owner = room_worker(room_id, self.workers)
+        host = self.redirect_host(websocket)
+        if ":" in host:
+            host = f"[{host}]"
+        url = f"ws://{host}:{worker_port(self.port, owner)}"
+        await websocket.send(
+            json.dumps({"type": "redirect", "room": room_id, "url": url})
+        )
+        await websocket.close()
+
+    async def reject_codec(self, websocket, room_id: str, name):
+        """未知のコーデックを指定した登録を断る"""
+        self.metrics.errors.inc(room_id, "unknown_codec")
+        await websocket.send(unknown_codec_error(name))
+        await websocket.close(code=1003, reason="unknown codec")
 
-    async def handle_client(self, websocket, path: str):
+    async def handle_client(self, websocket, path: str = ""):
         """クライアント接続を処理"""
+        client_type = None
+        room = None
+        player = None
+        connection = None
+        # 記録中は受信したフレームを記録してから処理する
+        recorder = self.recorder
+        conn = recorder.open() if recorder is not None else 0
+        frames = recorder.stream(conn, websocket) if recorder is not None else websocket
         try:
-            async for message in websocket:
+            async for message in frames:
                 data = json.loads(message)
 
                 # 接続タイプの判定
                 client_type = data.get("type")
+                room_id = str(data.get("room") or DEFAULT_ROOM)
+
+                if client_type in ("register", "godview") and not self.owns_room(
+                    room_id
+                ):
+                    await self.redirect(websocket, room_id)
+                    return
+
+                codec = get_codec(data.get("codec"))
+                if client_type in ("register", "godview") and codec is None:
+                    await self.reject_codec(websocket, room_id, data.get("codec"))
+                    return
 
                 if client_type == "register":
                     # プレイヤー登録
                     player_id = data.get("player_id", str(uuid.uuid4()))
+                    if recorder is not None and "player_id" not in data:
+                        # 再生時に同じ ID で登録し直せるように
+                        recorder.assign(conn, player_id)
                     name = data.get("name", "Anonymous")
                     role = data.get("role", "villager")
-
-                    player = await self.register_player(
-                        websocket, player_id, name, role
+                    # 未知の役職や文字列でない ID は受け付けない
+                    error = check_register(player_id, name, role)
+                    if error is not None:
+                        self.metrics.errors.inc(room_id, "invalid_register")
+                        await websocket.send(codec.encode(error), text=codec.text)
+                        await websocket.close(code=1008, reason="invalid register")
+                        return
+
+                    room = self.get_room(room_id)
+                    # 登録済みの ID に戻るには最初の登録で渡した合言葉が要る
+                    error = room.check_resume(player_id, data.get("resume_token"))
+                    if error is not None:
+                        self.metrics.errors.inc(room_id, "player_id_in_use")
+                        await websocket.send(codec.encode(error), text=codec.text)
+                        await websocket.close(code=1008, reason="player_id in use")
+                        return
+                    connection = self.create_connection(
+                        websocket, label=player_id, room_id=room_id, codec=codec
+                    )
+                    player = await room.register_player(
+                        player_id, name, role, connection
                     )
 
-                    # メインループ
-                    async for msg in websocket:
-                        try:
-                            msg_data = json.loads(msg)
-                            await self.handle_message(player.id, msg_data)
-                        except:
-                            pass
+                    # メインループ（idle_timeout 秒何も届かなければ切断）
+                    loop = asyncio.get_running_loop()
+                    try:
+                        async with asyncio.timeout(self.idle_timeout) as idle:
+                            async for msg in frames:
+                                if self.idle_timeout is not None:
+                                    idle.reschedule(loop.time() + self.idle_timeout)
+                                await self.handle_player_message(
+                                    room, player.id, msg, codec
+                                )
+                    except TimeoutError:
+                        self.metrics.errors.inc(room.id, "idle_timeout")
+                        await websocket.close(code=1001, reason="idle timeout")
 
                 elif client_type == "godview":
-                    # 神視点クライアント
-                    self.godview_clients.add(websocket)
-
-                    # 初期データを送信
-                    await websocket.send(
-                        json.dumps(
-                            {
-                                "type": "init",
-                                "players": [
-                                    p.to_dict() for p in self.players.values()
-                                ],
-                                "channels": {
-                                    name: {
-                                        "name": ch.name,
-                                        "description": ch.description,
-                                        "message_count": len(ch.messages),
-                                    }
-                                    for name, ch in self.channels.items()
-                                },
-                            }
-                        )
+                    # 神視点クライアント（subscribe で購読条件を指定できる）
+                    try:
+                        subscription = handshake_subscription(data)
+                    except ValueError as e:
+                        await websocket.send(json.dumps(subscription_error(e)))
+                        await websocket.close(code=1008, reason="invalid subscription")
+                        return
+                    room = self.get_room(room_id)
+                    connection = self.create_connection(
+                        websocket,
+                        label="godview",
+                        room_id=room_id,
+                        kind="godview",
+                        codec=codec,
+                    )
+                    room.add_godview(
+                        connection,
+                        protocol=data.get("protocol", 1),
+                        since=data.get("since"),
+                        epoch=data.get("epoch"),
+                        subscription=subscription,
                     )
 
-                    # 神視点ループ
-                    async for msg in websocket:
-                        # 神視点からのメッセージは受信のみ（コマンドなど）
-                        pass
+                    # 神視点ループ（再同期要求などのコマンド）
+                    async for msg in frames:
+                        try:
+                            request = codec.decode(msg)
+                        except ValueError:
+                            self.metrics.errors.inc(room.id, f"invalid_{codec.name}")
+                            continue
+                        await room.handle_spectator_message(connection, request)
 
         except websockets.exceptions.ConnectionClosed:
             pass
         finally:
+            if recorder is not None:
+                recorder.close(conn)
             # クリーンアップ
-            if client_type == "godview":
-                self.godview_clients.discard(websocket)
-            else:
-                # プレイヤーの削除はregister時に判定が必要
-                pass
+            if client_type == "godview" and room is not None:
+                await room.remove_godview(connection)
+            elif connection is not None:
+                await connection.close()
+                if player is not None:
+                    # 猶予中に再接続しなければ削除される
+                    await room.detach_player(player.id, connection)
+
+    def open_journal(self):
+        """ジャーナルから状態を復元し、以降のイベントの記録を開始"""
+        if self.journal_dir is None or self.journal is not None:
+            return
+        count = self.restore_from_journal(self.journal_dir)
+        if count:
+            print(
+                f"📼 ジャーナルから復元: {count} レコード "
+                f"(部屋 {len(self.rooms)} 個)"
+            )
+        self.journal = GameJournal(self.journal_dir)
+        self.journal.start()
+        for room in self.rooms.values():
+            room.journal = self.journal
+            # 復元したプレイヤーも猶予中に再接続しなければ削除する
+            room.schedule_detached()
+            if room.is_empty():
+                self.room_emptied(room)
+
+    def close_journal(self):
+        """ジャーナルの残りを書き出して閉じる"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+            for room in self.rooms.values():
+                room.journal = None
+
+    def serve_options(self) -> dict:
+        """websockets.serve に渡す生存確認・受信サイズ・圧縮の設定"""
+        options = {
+            "ping_interval": self.ping_interval,
+            "ping_timeout": self.ping_timeout,
+            # 圧縮は接続のパスから決めた種類ごとに process_request で設定する
+            "compression": None,
+            "process_request": negotiator(self.compression),
+        }
+        if self.limits.max_frame_size is not None:
+            # 上限を少し超えるだけなら error フレームで知らせ、桁違いに大きければ
+            # 受信の時点で websockets が切断する（1009）
+            options["max_size"] = max(
+                self.limits.max_frame_size * MAX_SIZE_FACTOR, 2**16
+            )
+        return options
 
     async def start(self):
         """サーバーを起動"""
         print(f"🐺 Werewolf Chat Server starting on {self.host}:{self.port}")
-        print(f"   Channels: {', '.join(self.channels.keys())}")
-
-        async with websockets.serve(self.handle_client, self.host, self.port):
-            print(f"✅ Server started!")
-            await asyncio.Future()  # 永久に実行
+        print(f"   Channels: {', '.join(DEFAULT_CHANNELS)}")
+
+        self.open_journal()
+        self.timers.start()
+        metrics_server = None
+        if self.metrics_port is not None:
+            # ワーカーごとに別のポートで公開
+            port = self.metrics_port + (self.worker_index if self.workers > 1 else 0)
+            metrics_server = await self.metrics.serve(self.metrics_host, port)
+            print(f"📈 Metrics: http://{self.metrics_host}:{port}/metrics")
+        try:
+            if self.workers > 1:
+                # 共有ポートとワーカー専用ポートの両方で待ち受ける
+                own_port = worker_port(self.port, self.worker_index)
+                options = self.serve_options()
+                async with websockets.serve(
+                    self.handle_client,
+                    self.host,
+                    self.port,
+                    reuse_port=True,
+                    **options,
+                ), websockets.serve(
+                    self.handle_client, self.host, own_port, **options
+                ):
+                    print(
+                        f"✅ Worker {self.worker_index}/{self.workers} started! "
+                        f"(direct port {own_port})"
+                    )
+                    await asyncio.Future()  # 永久に実行
+            else:
+                async with websockets.serve(
+                    self.handle_client, self.host, self.port, **self.serve_options()
+                ):
+                    print(f"✅ Server started!")
+                    await asyncio.Future()  # 永久に実行
+        finally:
+            if metrics_server is not None:
+                metrics_server.close()
+            await self.timers.close()
+            self.close_journal()
 
 
-async def main():
-    """メイン関数"""
-    server = WerewolfServer()
-    await server.start()
+def parse_durations(value: str) -> Dict[str, float]:
+    """'day=120,vote=30' をフェーズごとの秒数に"""
+    durations = {}
+    for part in value.split(","):
+        phase, _, seconds = part.partition("=")
+        try:
+            durations[phase.strip()] = float(seconds)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid duration: {part}")
+    return durations
+
+
+def compression_policy(value: str) -> CompressionPolicy:
+    """--*-compression の値を圧縮の設定に"""
+    try:
+        return parse_policy(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Werewolf Chat Server")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument(
+        "--advertise-host",
+        metavar="HOST",
+        help="他のワーカーへ誘導するときの URL のホスト名（既定: クライアントが接続に使った名前）",
+    )
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--journal",
+        metavar="DIR",
+        help="ゲームジャーナルの保存先（指定すると起動時に復元する）",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="ワーカープロセス数（2以上で部屋をコアごとに分担）",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=256,
+        metavar="N",
+        help="接続ごとの送信キューの上限（既定: 256）",
+    )
+    parser.add_argument(
+        "--slow-consumer-policy",
+        choices=SLOW_CONSUMER_POLICIES,
+        default=DROP_OLDEST,
+        help="送信キューが溢れたときの対処（既定: drop_oldest）。coalesce は統計や"
+        "プレイヤー情報の更新の未送信分を最新のもので置き換える",
+    )
+    parser.add_argument(
+        "--spectator-tick",
+        type=float,
+        default=0.0,
+        metavar="SECONDS",
+        help="神視点への差分をこの間隔でまとめて送る（0 で即時）",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Prometheus 形式の計測値を http://HOST:PORT/metrics で公開",
+    )
+    parser.add_argument(
+        "--metrics-host",
+        default="127.0.0.1",
+        help="計測値の待ち受けアドレス（既定: 127.0.0.1）",
+    )
+    parser.add_argument(
+        "--ping-interval",
+        type=float,
+        default=20.0,
+        metavar="SECONDS",
+        help="WebSocket の ping 間隔（0 で送らない）",
+    )
+    parser.add_argument(
+        "--ping-timeout",
+        type=float,
+        default=20.0,
+        metavar="SECONDS",
+        help="ping の応答がなければ切断するまでの秒数",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SECONDS",
+        help="プレイヤーから何も届かなければ切断するまでの秒数（既定: 無効）",
+    )
+    parser.add_argument(
+        "--reconnect-grace",
+        type=float,
+        default=30.0,
+        metavar="SECONDS",
+        help="切断したプレイヤーを削除するまでの猶予（この間に再接続すると元に戻る）",
+    )
+    parser.add_argument(
+        "--phase-durations",
+        type=parse_durations,
+        metavar="day=120,vote=30,night=60",
+        help="フェーズごとの長さ（秒）",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="FILE",
+        help="受信したフレームを記録（python -m server.recording FILE で再生）",
+    )
+    compression = parser.add_argument_group(
+        "圧縮",
+        "接続の種類ごとの permessage-deflate（off / on / "
+        "window=15,mem=8,level=6,threshold=128,takeover=yes）",
+    )
+    for kind, help_text in (
+        (PLAYER, "プレイヤーの接続（既定: off）"),
+        (GODVIEW, "神視点の接続（パス /godview、既定: on）"),
+        (RELAY, "中継の接続（パス /relay、既定: on）"),
+    ):
+        compression.add_argument(
+            f"--{kind}-compression",
+            type=compression_policy,
+            metavar="SPEC",
+            help=help_text,
+        )
+    limits = parser.add_argument_group("流量制御")
+    limits.add_argument(
+        "--player-rate",
+        type=float,
+        default=20.0,
+        metavar="PER_SECOND",
+        help="1人が送れるメッセージ数/秒（0 で無制限）",
+    )
+    limits.add_argument(
+        "--player-burst",
+        type=float,
+        default=40.0,
+        metavar="COUNT",
+        help="1人が続けて送れるメッセージ数",
+    )
+    limits.add_argument(
+        "--channel-rate",
+        type=float,
+        default=100.0,
+        metavar="PER_SECOND",
+        help="1つのチャンネルに流せるチャット数/秒（全員の合計、0 で無制限）",
+    )
+    limits.add_argument(
+        "--channel-burst",
+        type=float,
+        default=200.0,
+        metavar="COUNT",
+        help="1つのチャンネルに続けて流せるチャット数",
+    )
+    limits.add_argument(
+        "--max-frame-size",
+        type=int,
+        default=64 * 1024,
+        metavar="BYTES",
+        help="受け付けるフレームの大きさ（テキストフレームは文字数、0 で無制限）",
+    )
+    limits.add_argument(
+        "--max-content-length",
+        type=int,
+        default=4000,
+        metavar="CHARS",
+        help="チャット本文の最大文字数（0 で無制限）",
+    )
+    return parser.parse_args(argv)
+
+
+def server_options(args: argparse.Namespace) -> dict:
+    """コマンドライン引数から WerewolfServer の設定を作る"""
+    return {
+        "advertise_host": args.advertise_host,
+        "queue_size": args.queue_size,
+        "slow_consumer_policy": args.slow_consumer_policy,
+        "journal_dir": args.journal,
+        "spectator_tick": args.spectator_tick,
+        "metrics_host": args.metrics_host,
+        "metrics_port": args.metrics_port,
+        "ping_interval": args.ping_interval or None,
+        "ping_timeout": args.ping_timeout or None,
+        "idle_timeout": args.idle_timeout,
+        "reconnect_grace": args.reconnect_grace,
+        "phase_durations": args.phase_durations,
+        "limits": IngestLimits(
+            player_rate=args.player_rate,
+            player_burst=args.player_burst,
+            channel_rate=args.channel_rate,
+            channel_burst=args.channel_burst,
+            max_frame_size=args.max_frame_size,
+            max_content_length=args.max_content_length,
+        ),
+        "compression": {
+            kind: policy
+            for kind, policy in (
+                (PLAYER, args.player_compression),
+                (GODVIEW, args.godview_compression),
+                (RELAY, args.relay_compression),
+            )
+            if policy is not None
+        },
+    }
+
+
+async def run(args: argparse.Namespace):
+    """サーバーを起動"""
+    options = server_options(args)
+    recorder = None
+    if args.record:
+        recorder = Recorder(
+            args.record,
+            {
+                "reconnect_grace": options["reconnect_grace"],
+                "phase_durations": options["phase_durations"],
+                "limits": options["limits"].to_dict(),
+            },
+        )
+        print(f"⏺️ 受信したフレームを記録: {args.record}")
+    server = WerewolfServer(
+        host=args.host, port=args.port, recorder=recorder, **options
+    )
+    try:
+        await server.start()
+    finally:
+        if recorder is not None:
+            recorder.close_file()
+
+
+def main(argv=None):
+    """メイン関数（werewolf-server コマンド）"""
+    args = parse_args(argv)
+    if args.record and args.workers > 1:
+        print("❌ --record は --workers 1 のときだけ使えます")
+        raise SystemExit(2)
+    try:
+        if args.workers > 1:
+            run_workers(args.workers, args.host, args.port, **server_options(args))
+        else:
+            asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n👋 サーバーを停止します")
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    main()
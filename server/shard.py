@@ -0,0 +1,69 @@
+"""
+werewolf-ai-battle Sharding
+
+1つのポートで複数のワーカープロセスを動かし、CPUコアごとに部屋を分担する。
+全ワーカーが SO_REUSEPORT で共有ポートを待ち受け、担当外の部屋への
+接続には担当ワーカー専用ポートへの redirect を返す。
+"""
+
+import asyncio
+import multiprocessing
+import os
+import socket
+import zlib
+
+
+def room_worker(room_id: str, workers: int) -> int:
+    """部屋を担当するワーカー番号（プロセスをまたいで安定）"""
+    if workers <= 1:
+        return 0
+    return zlib.crc32(room_id.encode("utf-8")) % workers
+
+
+def worker_port(port: int, index: int) -> int:
+    """ワーカー専用の待ち受けポート"""
+    return port + 1 + index
+
+
+def _worker_main(index: int, workers: int, host: str, port: int, server_kwargs: dict):
+    from .server import WerewolfServer
+
+    server = WerewolfServer(
+        host=host, port=port, worker_index=index, workers=workers, **server_kwargs
+    )
+    try:
+        asyncio.run(server.start())
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(workers: int, host: str, port: int, **server_kwargs):
+    """ワーカープロセスを起動して終了まで待つ"""
+    if not hasattr(socket, "SO_REUSEPORT"):
+        raise RuntimeError("SO_REUSEPORT is not supported on this platform")
+
+    journal_dir = server_kwargs.pop("journal_dir", None)
+    ctx = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(workers):
+        kwargs = dict(server_kwargs)
+        if journal_dir is not None:
+            # ワーカーごとに別のジャーナル
+            kwargs["journal_dir"] = os.path.join(journal_dir, f"worker-{index}")
+        process = ctx.Process(
+            target=_worker_main,
+            args=(index, workers, host, port, kwargs),
+            name=f"werewolf-worker-{index}",
+        )
+        process.start()
+        processes.append(process)
+
+    print(f"🐺 {workers} workers on {host}:{port} (pid {os.getpid()})")
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
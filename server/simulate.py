@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+werewolf-ai-battle Simulation
+
+ソケットを使わずにゲームを大量に実行するバッチランナー。
+各ゲームはメモリ上の GameRoom と MemoryClient で進行し、
+ゲームの束をプロセスプールに分けて並列に実行する。
+
+    uv run python -m server.simulate --games 10000 --workers 8
+
+スクリプトは `async def script(rng: random.Random, **options) -> dict` で、
+`--script module:function` で差し替えられる。
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import multiprocessing
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from .game import DAY, ENDED, NIGHT, VOTE, WerewolfGame
+from .memory import MemoryClient
+from .room import GameRoom
+
+DEFAULT_SCRIPT = "server.simulate:random_game"
+
+DRAW = "draw"
+
+
+def load_script(path: str) -> Callable:
+    """'module:function' からスクリプトを読み込む"""
+    module_name, _, function = path.partition(":")
+    return getattr(importlib.import_module(module_name), function)
+
+
+async def random_game(
+    rng: random.Random,
+    players: int = 9,
+    werewolves: int = 2,
+    seers: int = 1,
+    max_days: int = 10,
+    chats: int = 2,
+) -> dict:
+    """ランダムに行動するプレイヤーによる1ゲーム（サーバーと同じ WerewolfGame で進行）"""
+    roles = ["werewolf"] * werewolves + ["seer"] * seers
+    roles += ["villager"] * (players - len(roles))
+    rng.shuffle(roles)
+
+    room = GameRoom("simulation", spectator_history=0, reconnect_grace=0, verbose=False)
+    # 期限はなく、全員が行動したら次のフェーズに進む
+    game = room.game = WerewolfGame(room)
+    clients = [MemoryClient(room, f"P{i}", role) for i, role in enumerate(roles)]
+    for client in clients:
+        await client.connect()
+
+    await game.start()
+    while game.phase != ENDED and game.day <= max_days:
+        alive = [c for c in clients if c.player.is_alive]
+        phase = game.phase
+
+        if phase == DAY:
+            # 議論
+            for _ in range(chats):
+                for client in alive:
+                    await client.send_chat(
+                        f"{game.day}日目: {rng.choice(alive).name} が怪しい"
+                    )
+            await game.advance()
+
+        elif phase == VOTE:
+            for client in alive:
+                target = rng.choice([c for c in alive if c is not client])
+                await client.send_action("vote", target=target.player_id)
+
+        elif phase == NIGHT:
+            # 人狼は相談して同じ相手を襲う
+            wolves = [c for c in alive if c.role == "werewolf"]
+            victim = rng.choice([c for c in alive if c.role != "werewolf"])
+            for wolf in wolves:
+                await wolf.send_chat(f"{game.day}日目の夜、{victim.name} を襲おう", "werewolf")
+                await wolf.send_action("attack", target=victim.player_id)
+            for seer in (c for c in alive if c.role == "seer"):
+                target = rng.choice([c for c in alive if c is not seer])
+                await seer.send_action("divine", target=target.player_id)
+
+        if game.phase == phase:
+            # 行動しきれなかった場合は締め切る
+            await game.advance()
+
+    return {
+        "winner": game.result or DRAW,
+        "days": game.day,
+        "survivors": sum(1 for c in clients if c.player.is_alive),
+        "delivered": sum(c.received for c in clients),
+    }
+
+
+async def _play_all(script: Callable, seeds: Sequence[int], options: dict) -> List[dict]:
+    results = []
+    for seed in seeds:
+        result = await script(random.Random(seed), **options)
+        result["seed"] = seed
+        results.append(result)
+    return results
+
+
+def run_chunk(script_path: str, seeds: Sequence[int], options: dict) -> List[dict]:
+    """ワーカープロセスでゲームの束を順に実行"""
+    return asyncio.run(_play_all(load_script(script_path), seeds, options))
+
+
+def run_batch(
+    games: int,
+    workers: Optional[int] = None,
+    script: str = DEFAULT_SCRIPT,
+    seed: int = 0,
+    chunk_size: Optional[int] = None,
+    **options,
+) -> List[dict]:
+    """games 回のゲームをプロセスプールで実行し、シード順の結果を返す"""
+    workers = workers or os.cpu_count() or 1
+    seeds = list(range(seed, seed + games))
+    if workers == 1:
+        return run_chunk(script, seeds, options)
+
+    # プロセス間の受け渡しを減らすため、ある程度まとめて渡す
+    chunk_size = chunk_size or max(1, min(500, games // (workers * 4) or 1))
+    chunks = [seeds[i : i + chunk_size] for i in range(0, games, chunk_size)]
+    results: List[dict] = []
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx) as pool:
+        futures = [pool.submit(run_chunk, script, chunk, options) for chunk in chunks]
+        for future in futures:
+            results.extend(future.result())
+    return results
+
+
+def summarize(results: List[dict], elapsed: float) -> dict:
+    """勝率などの集計"""
+    games = len(results)
+    winners = Counter(result.get("winner") for result in results)
+    return {
+        "games": games,
+        "elapsed": round(elapsed, 3),
+        "games_per_sec": round(games / elapsed, 1) if elapsed > 0 else None,
+        "winners": {name: count / games for name, count in winners.items()},
+        "mean_days": sum(r.get("days", 0) for r in results) / games if games else 0,
+    }
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """コマンドライン引数を解析"""
+    parser = argparse.ArgumentParser(description="Werewolf batch simulation")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--workers", type=int, help="プロセス数（既定: CPU数）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--script", default=DEFAULT_SCRIPT, help="module:function")
+    parser.add_argument("--players", type=int, default=9)
+    parser.add_argument("--werewolves", type=int, default=2)
+    parser.add_argument("--seers", type=int, default=1)
+    parser.add_argument("--max-days", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="集計を JSON で出力")
+    parser.add_argument("--results", metavar="FILE", help="ゲームごとの結果を JSON Lines で保存")
+    return parser.parse_args(argv)
+
+
+def main():
+    """メイン関数"""
+    args = parse_args()
+    options = {}
+    if args.script == DEFAULT_SCRIPT:
+        options = {
+            "players": args.players,
+            "werewolves": args.werewolves,
+            "seers": args.seers,
+            "max_days": args.max_days,
+        }
+
+    start = time.perf_counter()
+    results = run_batch(args.games, args.workers, args.script, args.seed, **options)
+    summary = summarize(results, time.perf_counter() - start)
+
+    if args.results:
+        with open(args.results, "w") as f:
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    if args.json:
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+        return
+    print(
+        f"🎲 {summary['games']} games in {summary['elapsed']}s "
+        f"({summary['games_per_sec']} games/s, 平均 {summary['mean_days']:.2f} 日)"
+    )
+    for name, rate in sorted(summary["winners"].items()):
+        print(f"   {name}: {rate:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,447 @@
+"""
+werewolf-ai-battle Spectator Protocol
+
+神視点（観戦者）向けの配信。
+
+- プロトコル 1: 接続時に init、以降はイベントをそのまま送る（従来の形式）
+- プロトコル 2: 通し番号付きのスナップショットと、その後の差分（delta）を送る。
+  再接続時に最後に受け取った番号（since）と epoch を送ると、
+  保持している範囲内なら抜けた差分だけを、範囲外ならスナップショットを返す。
+  tick を指定すると、その間の差分を1フレーム（deltas）にまとめて送る。
+
+プロトコル 2 の観戦者は購読条件（チャンネル・イベントの種類・プレイヤー ID）を
+指定できる。条件に合わないイベントはその観戦者向けにはエンコードも送信もしない。
+絞り込んだ差分には直前に条件に合ったイベントの番号（prev）を付けるので、
+観戦者は prev が受け取り済みの番号以下なら欠落なしと判断できる。
+"""
+
+import asyncio
+import uuid
+from collections import deque
+from itertools import islice
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .frames import Frame
+from .outbound import Connection, fan_out
+
+PROTOCOL_VERSION = 2
+
+# 購読条件のキー
+SUBSCRIPTION_KEYS = ("channels", "types", "players")
+
+
+class SubscriptionFilter:
+    """観戦者の購読条件（None の条件は全てに一致）
+
+    チャンネル（プレイヤー）を持たないイベントはチャンネル（プレイヤー）の条件では除外しない。
+    """
+
+    __slots__ = ("channels", "types", "players", "key")
+
+    def __init__(
+        self,
+        channels: Optional[Iterable[str]] = None,
+        types: Optional[Iterable[str]] = None,
+        players: Optional[Iterable[str]] = None,
+    ):
+        self.channels = None if channels is None else frozenset(channels)
+        self.types = None if types is None else frozenset(types)
+        self.players = None if players is None else frozenset(players)
+        # 同じ条件の観戦者をまとめるためのキー
+        self.key = (self.channels, self.types, self.players)
+
+    def matches(
+        self, kind: Optional[str], channel: Optional[str], player: Optional[str]
+    ) -> bool:
+        if self.types is not None and kind not in self.types:
+            return False
+        if self.channels is not None and channel is not None:
+            if channel not in self.channels:
+                return False
+        if self.players is not None and player is not None:
+            if player not in self.players:
+                return False
+        return True
+
+    def to_dict(self) -> dict:
+        return {
+            key: None if value is None else sorted(value)
+            for key, value in zip(SUBSCRIPTION_KEYS, self.key)
+        }
+
+
+def parse_subscription(spec) -> Optional[SubscriptionFilter]:
+    """購読条件の dict を SubscriptionFilter に（条件がなければ None、不正なら ValueError）
+
+    各条件は文字列1つか文字列のリスト。
+    """
+    if spec is None:
+        return None
+    if not isinstance(spec, dict):
+        raise ValueError("subscription must be an object")
+    values: Dict[str, Optional[List[str]]] = {}
+    for key in SUBSCRIPTION_KEYS:
+        value = spec.get(key)
+        if isinstance(value, str):
+            value = [value]
+        elif value is not None and not (
+            isinstance(value, list) and all(isinstance(v, str) for v in value)
+        ):
+            raise ValueError(f"{key} must be a string or a list of strings")
+        values[key] = value
+    if all(value is None for value in values.values()):
+        return None
+    return SubscriptionFilter(**values)
+
+
+def handshake_subscription(data: dict) -> Optional[SubscriptionFilter]:
+    """神視点の登録メッセージの subscribe（不正・プロトコル 1 での指定なら ValueError）"""
+    spec = data.get("subscribe")
+    protocol = data.get("protocol", 1)
+    if spec is not None and (
+        not isinstance(protocol, int) or protocol < PROTOCOL_VERSION
+    ):
+        raise ValueError(f"subscriptions require protocol {PROTOCOL_VERSION}")
+    return parse_subscription(spec)
+
+
+def subscription_error(error: Exception) -> dict:
+    return {
+        "type": "error",
+        "code": "invalid_subscription",
+        "request": "subscribe",
+        "message": str(error),
+    }
+
+
+def event_attrs(frame: Frame) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """購読条件の判定に使う (種類, チャンネル, プレイヤー ID)"""
+    player = frame.get("player_id")
+    if player is None:
+        info = frame.get("player")
+        if isinstance(info, dict):
+            player = info.get("id")
+    return frame.type, frame.get("channel"), player
+
+
+class _Group:
+    """同じ購読条件の観戦者"""
+
+    __slots__ = ("filter", "connections", "last_seq", "pending")
+
+    def __init__(self, subscription: SubscriptionFilter, last_seq: int):
+        self.filter = subscription
+        self.connections: Set[Connection] = set()
+        # 最後に条件に合ったイベントの通し番号（次の差分の prev）
+        self.last_seq = last_seq
+        # tick の間に溜まった条件に合う (seq, イベント)
+        self.pending: List[Tuple[int, Frame]] = []
+
+
+class SpectatorHub:
+    """スナップショット＋差分で観戦者に配信するハブ"""
+
+    def __init__(
+        self,
+        state: Callable[[], dict],
+        legacy_init: Optional[Callable[[], dict]] = None,
+        history: int = 1000,
+        tick: float = 0.0,
+    ):
+        # 現在の状態（players, channels など）を返す関数
+        self.state = state
+        self.legacy_init = legacy_init
+        self.tick = tick
+        # サーバーを再起動すると変わる（古い通し番号での再開を防ぐ）
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        # 直近のイベントのフレーム（末尾の通し番号が seq。差分の封筒は送るときに作る）
+        self.history: Deque[Frame] = deque(maxlen=history)
+        self.legacy: Set[Connection] = set()
+        # プロトコル 2 の全ての観戦者（= firehose + 各グループ）
+        self.subscribers: Set[Connection] = set()
+        # 購読条件のない観戦者と、条件ごとのグループ
+        self.firehose: Set[Connection] = set()
+        self.groups: Dict[tuple, _Group] = {}
+        self._groups_by_connection: Dict[Connection, _Group] = {}
+        # tick の間に溜まった (seq, イベント)
+        self._pending: List[Tuple[int, Frame]] = []
+        self._tick_task: Optional[asyncio.Task] = None
+        # 配信するイベントごとに呼ぶ関数（記録用）
+        self.on_publish: Optional[Callable[[Frame], None]] = None
+
+        # 統計
+        self.snapshots_sent = 0
+        self.resumes = 0
+        self.frames_sent = 0
+
+    @property
+    def connections(self) -> Set[Connection]:
+        """全ての観戦者の接続"""
+        return self.legacy | self.subscribers
+
+    def __bool__(self) -> bool:
+        return bool(self.legacy or self.subscribers)
+
+    def publish(self, event: Union[dict, Frame], key: Optional[str] = None) -> int:
+        """イベントに通し番号を付けて配信し、配信先の数を返す
+
+        key はプロトコル 1 の観戦者の送信キューで未送信の同じイベントを置き換えるのに使う。
+        """
+        frame = event if isinstance(event, Frame) else Frame(event)
+        if self.on_publish is not None:
+            self.on_publish(frame)
+
+        delivered = len(self.legacy)
+        if self.legacy:
+            self.legacy.difference_update(fan_out(self.legacy, frame, key))
+
+        self.seq += 1
+        self.history.append(frame)
+
+        if not self.subscribers:
+            return delivered
+        matched = self._match(frame)
+        delivered += len(self.firehose)
+        delivered += sum(len(group.connections) for group in matched)
+        if self.tick > 0:
+            if self.firehose:
+                self._pending.append((self.seq, frame))
+            for group in matched:
+                group.pending.append((self.seq, frame))
+            return delivered
+
+        # 差分は通し番号付きなので置き換えない（欠落として再同期されてしまう）
+        if self.firehose:
+            self._send(self.firehose, self._delta(self.seq, frame))
+        for group in matched:
+            self._send(group.connections, self._delta(self.seq, frame, group.last_seq))
+            group.last_seq = self.seq
+        return delivered
+
+    def _match(self, frame: Frame) -> List[_Group]:
+        """イベントが購読条件に合うグループ（条件ごとに1回だけ判定）"""
+        if not self.groups:
+            return []
+        attrs = event_attrs(frame)
+        return [group for group in self.groups.values() if group.filter.matches(*attrs)]
+
+    @property
+    def first_seq(self) -> int:
+        """保持している最も古いイベントの通し番号"""
+        return self.seq - len(self.history) + 1
+
+    @staticmethod
+    def _delta(seq: int, frame: Frame, prev: Optional[int] = None) -> Frame:
+        envelope = {"type": "delta", "seq": seq}
+        if prev is not None:
+            envelope["prev"] = prev
+        return Frame.wrap(envelope, "event", frame)
+
+    def flush(self):
+        """tick の間に溜まった差分を1フレームにまとめて送る"""
+        if self._pending:
+            pending, self._pending = self._pending, []
+            if self.firehose:
+                self._send(self.firehose, self._batch(pending))
+        for group in list(self.groups.values()):
+            if group.pending:
+                pending, group.pending = group.pending, []
+                self._send(group.connections, self._batch(pending, group.last_seq))
+                group.last_seq = pending[-1][0]
+
+    def _batch(
+        self, events: List[Tuple[int, Frame]], prev: Optional[int] = None
+    ) -> Frame:
+        """差分をまとめたフレーム（prev を渡すと各差分に直前の番号を付ける）"""
+        first = events[0][0] if events else self.seq + 1
+        deltas = []
+        for seq, frame in events:
+            deltas.append(self._delta(seq, frame, prev))
+            if prev is not None:
+                prev = seq
+        return Frame.wrap(
+            {"type": "deltas", "from": first, "to": self.seq}, "deltas", deltas
+        )
+
+    def _send(self, connections: Set[Connection], frame: Frame):
+        for connection in fan_out(connections, frame):
+            self.remove(connection)
+        self.frames_sent += 1
+
+    def snapshot(self, subscription: Optional[SubscriptionFilter] = None) -> dict:
+        """通し番号付きのスナップショット（購読条件があればチャンネルを絞る）"""
+        snapshot = {
+            "type": "snapshot",
+            "version": PROTOCOL_VERSION,
+            "epoch": self.epoch,
+            "seq": self.seq,
+        }
+        snapshot.update(self.state())
+        if subscription is not None:
+            snapshot["subscription"] = subscription.to_dict()
+            if subscription.channels is not None and "channels" in snapshot:
+                snapshot["channels"] = {
+                    name: channel
+                    for name, channel in snapshot["channels"].items()
+                    if name in subscription.channels
+                }
+        return snapshot
+
+    def add(
+        self,
+        connection: Connection,
+        protocol: int = 1,
+        since: Optional[int] = None,
+        epoch: Optional[str] = None,
+        subscription: Optional[SubscriptionFilter] = None,
+    ):
+        """観戦者を追加し、初期データ（または抜けた差分）を送る
+
+        購読条件はプロトコル 2 の観戦者のみ（プロトコル 1 で渡すと ValueError）。
+        """
+        if protocol < PROTOCOL_VERSION:
+            if subscription is not None:
+                raise ValueError(f"subscriptions require protocol {PROTOCOL_VERSION}")
+            self.legacy.add(connection)
+            if self.legacy_init is not None:
+                connection.enqueue(Frame(self.legacy_init()))
+            return
+
+        # 溜まっている差分を先に送り、新しい観戦者に重複して届かないようにする
+        self.flush()
+        self.subscribers.add(connection)
+        self._join(connection, subscription)
+        if self.tick > 0 and self._tick_task is None:
+            self._tick_task = asyncio.create_task(self._tick_loop())
+
+        if since is not None and epoch == self.epoch and self.can_resume(since):
+            self.resumes += 1
+            first = self.first_seq
+            skip = max(0, since + 1 - first)
+            events = [
+                (first + skip + i, frame)
+                for i, frame in enumerate(islice(self.history, skip, None))
+            ]
+            if subscription is None:
+                connection.enqueue(self._batch(events))
+            else:
+                events = [
+                    (seq, frame)
+                    for seq, frame in events
+                    if subscription.matches(*event_attrs(frame))
+                ]
+                connection.enqueue(self._batch(events, since))
+        else:
+            self.resync(connection)
+
+    def subscribe(self, connection: Connection, spec: dict) -> Optional[dict]:
+        """購読条件を変えてスナップショットを送り直す（不正なら error の dict を返す）"""
+        try:
+            subscription = parse_subscription(spec)
+        except ValueError as e:
+            return subscription_error(e)
+        if connection not in self.subscribers:
+            return subscription_error(
+                ValueError(f"subscriptions require protocol {PROTOCOL_VERSION}")
+            )
+        self.flush()
+        self._leave(connection)
+        self._join(connection, subscription)
+        self.resync(connection)
+        return None
+
+    def _join(self, connection: Connection, subscription: Optional[SubscriptionFilter]):
+        if subscription is None:
+            self.firehose.add(connection)
+            return
+        group = self.groups.get(subscription.key)
+        if group is None:
+            group = _Group(subscription, self._last_match(subscription))
+            self.groups[subscription.key] = group
+        group.connections.add(connection)
+        self._groups_by_connection[connection] = group
+
+    def _leave(self, connection: Connection):
+        self.firehose.discard(connection)
+        group = self._groups_by_connection.pop(connection, None)
+        if group is not None:
+            group.connections.discard(connection)
+            if not group.connections:
+                del self.groups[group.filter.key]
+
+    def _last_match(self, subscription: SubscriptionFilter) -> int:
+        """保持している差分のうち最後に条件に合った通し番号（なければ保持範囲の直前）"""
+        for i, frame in enumerate(reversed(self.history)):
+            if subscription.matches(*event_attrs(frame)):
+                return self.seq - i
+        return self.first_seq - 1
+
+    def can_resume(self, since: int) -> bool:
+        """since の次から全ての差分を保持しているか"""
+        if since > self.seq:
+            return False
+        if since == self.seq:
+            return True
+        return bool(self.history) and self.first_seq <= since + 1
+
+    def resync(self, connection: Connection):
+        """スナップショットを送り直す"""
+        self.snapshots_sent += 1
+        group = self._groups_by_connection.get(connection)
+        connection.enqueue(
+            Frame(self.snapshot(group.filter if group is not None else None))
+        )
+
+    def reset(self, epoch: str, seq: int):
+        """epoch と通し番号を付け替え、全ての観戦者に初期データを送り直す
+
+        中継（relay）が上流のスナップショットを受け取ったときに使う。
+        以降の publish は上流と同じ通し番号になる。
+        """
+        self._pending.clear()
+        self.history.clear()
+        self.epoch = epoch
+        self.seq = seq
+        for group in self.groups.values():
+            group.pending.clear()
+            group.last_seq = seq
+        for connection in self.subscribers:
+            self.resync(connection)
+        if self.legacy_init is not None and self.legacy:
+            fan_out(self.legacy, Frame(self.legacy_init()))
+
+    def remove(self, connection: Connection):
+        """観戦者を外す"""
+        self.legacy.discard(connection)
+        self.subscribers.discard(connection)
+        self._leave(connection)
+
+    async def _tick_loop(self):
+        try:
+            while True:
+                await asyncio.sleep(self.tick)
+                self.flush()
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self):
+        """tick タスクを停止"""
+        if self._tick_task is not None:
+            self._tick_task.cancel()
+            await asyncio.gather(self._tick_task, return_exceptions=True)
+            self._tick_task = None
+
+    def stats(self) -> dict:
+        return {
+            "epoch": self.epoch,
+            "seq": self.seq,
+            "retained": len(self.history),
+            "legacy": len(self.legacy),
+            "subscribers": len(self.subscribers),
+            "filtered": len(self._groups_by_connection),
+            "filters": len(self.groups),
+            "snapshots": self.snapshots_sent,
+            "resumes": self.resumes,
+            "frames": self.frames_sent,
+        }
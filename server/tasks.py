@@ -0,0 +1,37 @@
+"""
+werewolf-ai-battle Background Tasks
+
+結果を待たずに走らせるタスク（期限でのフェーズ進行・猶予切れの削除・接続を閉じるなど）。
+イベントループはタスクを弱参照でしか持たないので、終わるまでここで参照を持ち、
+例外は握りつぶさずにログに出す。
+"""
+
+import asyncio
+import traceback
+from typing import Coroutine, Set
+
+# 実行中のタスク（終わったら外す）
+_running: Set[asyncio.Task] = set()
+
+
+def spawn(coro: Coroutine, name: str = "") -> asyncio.Task:
+    """coro をタスクとして走らせる（終わるまで参照を持ち、例外はログに出す）"""
+    task = asyncio.get_running_loop().create_task(coro, name=name or None)
+    _running.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+
+def _finished(task: asyncio.Task):
+    _running.discard(task)
+    if task.cancelled():
+        return
+    error = task.exception()
+    if error is not None:
+        print(f"⚠️ タスクのエラー: {task.get_name()}: {error!r}")
+        traceback.print_exception(error)
+
+
+def running() -> Set[asyncio.Task]:
+    """実行中のタスク（終了時に待つ・数えるため）"""
+    return set(_running)
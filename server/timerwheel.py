@@ -0,0 +1,152 @@
+"""
+werewolf-ai-battle Timer Wheel
+
+全ての部屋のフェーズ期限などを1つのタスクで処理する階層型タイマーホイール。
+タイマーの追加と取り消しは O(1) で、タイマーごとにスリープするタスクを作らない。
+
+レベル l のスロットは tick * slots**l 秒を表し、上位レベルのタイマーは
+期限が近づくと下位レベルに移される（カスケード）。
+"""
+
+import asyncio
+import time
+import traceback
+from typing import Callable, List, Optional
+
+
+class Timer:
+    """登録済みのタイマー（cancel で取り消す）"""
+
+    __slots__ = ("expires", "callback", "args", "cancelled", "wheel")
+
+    def __init__(self, expires: int, callback: Callable, args: tuple, wheel):
+        self.expires = expires
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.wheel = wheel
+
+    def cancel(self):
+        """取り消す（スロットからは期限が来たときに取り除く）"""
+        if not self.cancelled:
+            self.cancelled = True
+            self.wheel.active -= 1
+
+
+class TimerWheel:
+    """階層型タイマーホイール"""
+
+    def __init__(
+        self,
+        tick: float = 0.1,
+        slots: int = 64,
+        levels: int = 4,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if slots < 2 or slots & (slots - 1):
+            raise ValueError("slots must be a power of two")
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self._bits = slots.bit_length() - 1
+        self._mask = slots - 1
+        self._wheels: List[List[List[Timer]]] = [
+            [[] for _ in range(slots)] for _ in range(levels)
+        ]
+        # 基準時刻から何 tick 進めたか
+        self._start = clock()
+        self.current = 0
+        self.active = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self.active
+
+    def schedule(self, delay: float, callback: Callable, *args) -> Timer:
+        """delay 秒後に callback(*args) を呼ぶ"""
+        now = int((self.clock() - self._start) / self.tick)
+        ticks = max(1, -int(-delay // self.tick))
+        timer = Timer(max(now, self.current) + ticks, callback, args, self)
+        self._insert(timer)
+        self.active += 1
+        return timer
+
+    def _insert(self, timer: Timer):
+        diff = timer.expires - self.current
+        if diff <= 0:
+            # 期限切れ（次に処理するスロットに入れる）
+            self._wheels[0][self.current & self._mask].append(timer)
+            return
+        for level in range(self.levels):
+            if diff < 1 << (self._bits * (level + 1)):
+                index = (timer.expires >> (self._bits * level)) & self._mask
+                self._wheels[level][index].append(timer)
+                return
+        # 最上位レベルの範囲を超える場合は、届く範囲の最後に入れて後で入れ直す
+        level = self.levels - 1
+        horizon = self.current + (1 << (self._bits * self.levels)) - 1
+        index = (horizon >> (self._bits * level)) & self._mask
+        self._wheels[level][index].append(timer)
+
+    def advance(self, now: Optional[float] = None) -> int:
+        """現在時刻までの tick を処理し、呼び出したタイマーの数を返す"""
+        if now is None:
+            now = self.clock()
+        target = int((now - self._start) / self.tick)
+        fired = 0
+        while self.current < target:
+            self.current += 1
+            # 上位レベルから順に、期限が近づいたスロットを下位に移す
+            for level in range(self.levels - 1, 0, -1):
+                shift = self._bits * level
+                if self.current & ((1 << shift) - 1) == 0:
+                    index = (self.current >> shift) & self._mask
+                    slot = self._wheels[level][index]
+                    self._wheels[level][index] = []
+                    for timer in slot:
+                        if not timer.cancelled:
+                            self._insert(timer)
+
+            index = self.current & self._mask
+            slot = self._wheels[0][index]
+            if not slot:
+                continue
+            self._wheels[0][index] = []
+            for timer in slot:
+                if timer.cancelled:
+                    continue
+                if timer.expires > self.current:
+                    self._insert(timer)
+                    continue
+                timer.cancelled = True
+                self.active -= 1
+                fired += 1
+                try:
+                    timer.callback(*timer.args)
+                except Exception as error:
+                    # 1つのタイマーの失敗で他のタイマーやホイールを止めない
+                    name = getattr(timer.callback, "__qualname__", repr(timer.callback))
+                    print(f"⚠️ タイマーのエラー: {name}: {error!r}")
+                    traceback.print_exception(error)
+        return fired
+
+    def start(self):
+        """tick ごとに advance するタスクを開始"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(self.tick)
+                self.advance()
+        except asyncio.CancelledError:
+            pass
+
+    async def close(self):
+        """タスクを停止"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,227 @@
+"""
+werewolf-ai-battle Godview View Model
+
+神視点の表示用状態。描画ライブラリには依存しない。
+チャンネルごとの履歴とイベントは件数上限付きの deque、
+プレイヤーは ID で引ける辞書（挿入順がそのまま表示順）で持つため、
+長時間つないだままでもメモリと1件あたりの更新コストが一定になる。
+"""
+
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Set
+
+# 変更があった表示部分
+PLAYERS = "players"
+EVENTS = "events"
+STATS = "stats"
+CHANNEL_PREFIX = "channel:"
+
+PHASE_LABELS = {"day": "昼", "vote": "投票", "night": "夜", "ended": "終了"}
+
+
+class GodviewState:
+    """神視点の表示用状態"""
+
+    def __init__(self, history_size: int = 200, event_size: int = 20):
+        self.history_size = history_size
+        # player_id -> プレイヤー情報（挿入順が表示順）
+        self.players: Dict[str, dict] = {}
+        # チャンネル名 -> 直近 history_size 件のメッセージ
+        self.messages: Dict[str, Deque[dict]] = {}
+        self.events: Deque[dict] = deque(maxlen=event_size)
+
+        # 観戦プロトコル 2 の再開位置
+        self.epoch: Optional[str] = None
+        self.last_seq = 0
+        # 差分の欠落を検出したらスナップショットを取り直す
+        self.needs_resync = False
+        # サーバーに送る購読条件（channels / types / players、None なら全て）
+        self.subscription: Optional[dict] = None
+
+        # ゲームの進行状況（phase, day など）
+        self.game: Optional[dict] = None
+
+        # 最新の stats フレームと、前回との差から求めたチャンネルごとの件数/秒
+        self.stats: Optional[dict] = None
+        self.channel_rates: Dict[str, Dict[str, float]] = {}
+
+    def handshake(self, room: str) -> dict:
+        """神視点登録メッセージ（前回の位置があれば再開を要求）"""
+        message = {"type": "godview", "room": room, "protocol": 2}
+        if self.subscription is not None:
+            message["subscribe"] = self.subscription
+        if self.epoch is not None:
+            message["since"] = self.last_seq
+            message["epoch"] = self.epoch
+        return message
+
+    def load_snapshot(self, data: dict):
+        """スナップショットで状態を置き換える"""
+        self.epoch = data.get("epoch")
+        self.last_seq = data.get("seq", 0)
+        self.needs_resync = False
+        self.reset_players(data.get("players", []))
+        self.game = data.get("game")
+        self.messages = {}
+        for name, channel in data.get("channels", {}).items():
+            self.channel_messages(name).extend(channel.get("messages", []))
+
+    def apply_delta(self, delta: dict) -> Set[str]:
+        """通し番号付きの差分を反映"""
+        seq = delta.get("seq", 0)
+        if seq <= self.last_seq:
+            return set()  # 受信済み
+        # 購読条件で絞り込んだ差分には直前に条件に合った番号（prev）が付く
+        if delta.get("prev", seq - 1) > self.last_seq:
+            self.needs_resync = True
+            return set()
+        self.last_seq = seq
+        return self.apply(delta.get("event", {}))
+
+    def channel_messages(self, channel: str) -> Deque[dict]:
+        """チャンネルの履歴（なければ作成）"""
+        messages = self.messages.get(channel)
+        if messages is None:
+            messages = deque(maxlen=self.history_size)
+            self.messages[channel] = messages
+        return messages
+
+    def recent_messages(self, channel: str, count: int) -> List[dict]:
+        """チャンネルの最新 count 件（古い順）"""
+        messages = self.messages.get(channel)
+        if not messages:
+            return []
+        recent = list(islice(reversed(messages), count))
+        recent.reverse()
+        return recent
+
+    def reset_players(self, players: List[dict]):
+        """プレイヤー一覧を置き換える"""
+        self.players = {player.get("id"): player for player in players}
+
+    def upsert_player(self, player: dict):
+        """プレイヤーを追加・更新（既存なら表示位置はそのまま）"""
+        self.players[player.get("id")] = player
+
+    def remove_player(self, player_id: str):
+        self.players.pop(player_id, None)
+
+    def add_event(self, event: dict):
+        """イベントを追加"""
+        event.setdefault("time", datetime.now().strftime("%H:%M:%S"))
+        self.events.append(event)
+
+    def update_stats(self, stats: dict):
+        """stats フレームを保存し、チャンネルごとの流量を求める"""
+        previous = self.stats
+        self.stats = stats
+        if previous is None or previous.get("room") != stats.get("room"):
+            self.channel_rates = {}
+            return
+        elapsed = stats.get("time", 0) - previous.get("time", 0)
+        if elapsed <= 0:
+            return
+        before = previous.get("channels", {})
+        self.channel_rates = {
+            name: {
+                key: max(0.0, (value - before.get(name, {}).get(key, 0)) / elapsed)
+                for key, value in counts.items()
+            }
+            for name, counts in stats.get("channels", {}).items()
+        }
+
+    def apply(self, data: dict) -> Set[str]:
+        """サーバーからのメッセージを反映し、変更された表示部分を返す"""
+        msg_type = data.get("type")
+
+        if msg_type == "snapshot":
+            self.load_snapshot(data)
+            return {PLAYERS} | {CHANNEL_PREFIX + name for name in self.messages}
+
+        if msg_type == "delta":
+            return self.apply_delta(data)
+
+        if msg_type == "deltas":
+            changed: Set[str] = set()
+            for delta in data.get("deltas", []):
+                changed |= self.apply_delta(delta)
+            return changed
+
+        if msg_type == "init":
+            # 初期データ
+            self.reset_players(data.get("players", []))
+            for name in data.get("channels", {}):
+                self.channel_messages(name)
+            return {PLAYERS}
+
+        if msg_type == "player_joined":
+            # プレイヤー参加
+            player = data.get("player", {})
+            self.upsert_player(player)
+            self.add_event({"type": f"🎮 {player.get('name')} が参加", "data": player})
+            return {PLAYERS, EVENTS}
+
+        if msg_type == "player_left":
+            # プレイヤー退出
+            player = data.get("player", {})
+            self.remove_player(player.get("id"))
+            self.add_event({"type": f"👋 {player.get('name')} が退出", "data": player})
+            return {PLAYERS, EVENTS}
+
+        if msg_type == "player_updated":
+            # 役職・生死・接続状態の変更
+            player = data.get("player", {})
+            previous = self.players.get(player.get("id"), {})
+            self.upsert_player(player)
+            if previous.get("connected", True) != player.get("connected", True):
+                if player.get("connected", True):
+                    event = f"🔁 {player.get('name')} が再接続"
+                else:
+                    event = f"🔌 {player.get('name')} が切断"
+                self.add_event({"type": event, "data": player})
+                return {PLAYERS, EVENTS}
+            if not player.get("is_alive", True):
+                self.add_event(
+                    {"type": f"💀 {player.get('name')} が死亡", "data": player}
+                )
+                return {PLAYERS, EVENTS}
+            return {PLAYERS}
+
+        if msg_type == "phase":
+            # フェーズの切り替え
+            self.game = {key: data.get(key) for key in ("phase", "day", "deadline")}
+            label = PHASE_LABELS.get(data.get("phase"), data.get("phase"))
+            self.add_event({"type": f"🕰 {data.get('day')}日目 {label}", "data": data})
+            return {EVENTS}
+
+        if msg_type == "phase_result":
+            if data.get("phase") == "vote":
+                target = data.get("executed")
+            else:
+                target = data.get("killed")
+            name = self.players.get(target, {}).get("name", target)
+            if data.get("phase") == "vote":
+                event = f"⚖️ {name} が処刑された" if target else "⚖️ 処刑なし（同数）"
+            else:
+                event = f"🐺 {name} が襲撃された" if target else "🌙 犠牲者なし"
+            self.add_event({"type": event, "data": data})
+            return {EVENTS}
+
+        if msg_type == "game_over":
+            self.game = {"phase": "ended", "day": data.get("day")}
+            self.add_event({"type": f"🏁 {data.get('winner')} の勝利", "data": data})
+            return {EVENTS}
+
+        if msg_type == "stats":
+            self.update_stats(data)
+            return {STATS}
+
+        if msg_type == "channel_message":
+            # チャンネルメッセージ
+            channel = data.get("channel", "public")
+            self.channel_messages(channel).append(data.get("message", {}))
+            return {CHANNEL_PREFIX + channel}
+
+        return set()
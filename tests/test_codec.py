@@ -0,0 +1,165 @@
+"""コーデックの往復（dict と Frame.encode の両方）と壊れたフレーム"""
+
+import asyncio
+
+import pytest
+
+from server.codec import (
+    BINARY,
+    JSON,
+    TAG_CHANNEL_MESSAGE_FROM,
+    TAG_DELTA,
+    TAG_DELTA_PREV,
+    CodecError,
+    get_codec,
+)
+from server.frames import Frame
+from server.memory import MemoryClient
+from server.records import CHANNELS, ROLES, ChatMessage, now_ns
+from server.room import GameRoom
+from server.spectator import parse_subscription
+
+PLAYER = {
+    "id": "p1",
+    "name": "占い師",
+    "role": "seer",
+    "is_alive": True,
+    "connected": False,
+}
+
+
+def chat_record(seq: int = 7, channel: str = "werewolf") -> ChatMessage:
+    # バイナリはマイクロ秒で送るので、ナノ秒の端数を落としておく
+    time_ns = now_ns() // 1000 * 1000
+    return ChatMessage(
+        CHANNELS.id(channel),
+        "人狼A",
+        ROLES.id("werewolf"),
+        "今夜は P3 を襲おう🐺",
+        seq,
+        time_ns,
+    )
+
+
+MESSAGES = [
+    chat_record().to_dict(),
+    chat_record(channel="custom-channel").to_dict(),
+    {
+        "type": "channel_message",
+        "channel": "public",
+        "message": chat_record().to_dict(),
+    },
+    {
+        "type": "channel_message",
+        "channel": "werewolf",
+        "player_id": "p1",
+        "message": chat_record().to_dict(),
+    },
+    {"type": "delta", "seq": 5, "prev": 2, "event": {"type": "action"}},
+    {"type": "player_joined", "player": PLAYER},
+    {"type": "player_updated", "player": dict(PLAYER, role="knight", is_alive=False)},
+    {"type": "delta", "seq": 2**40, "event": {"type": "player_left", "player": PLAYER}},
+    {
+        "type": "deltas",
+        "from": 3,
+        "to": 4,
+        "deltas": [
+            {"type": "delta", "seq": 3, "event": {"type": "phase", "phase": "day"}},
+            {"type": "delta", "seq": 4, "event": chat_record().to_dict()},
+        ],
+    },
+    # スキーマのないメッセージは JSON のまま埋め込む
+    {"type": "phase", "phase": "night", "day": 2, "players": [PLAYER]},
+    {"type": "chat", "channel": "public", "content": "キーが足りない"},
+]
+
+
+@pytest.mark.parametrize("codec", [JSON, BINARY], ids=lambda codec: codec.name)
+@pytest.mark.parametrize("message", MESSAGES, ids=lambda message: message["type"])
+def test_round_trip(codec, message):
+    assert codec.decode(codec.encode(message)) == message
+
+
+def test_binary_chat_is_smaller_than_json():
+    message = chat_record().to_dict()
+    assert len(BINARY.encode(message)) < len(JSON.encode(message))
+
+
+def test_frame_encode_matches_message_encode():
+    record = chat_record()
+    inner = Frame.from_record(record)
+    envelope = {"type": "channel_message", "channel": "werewolf"}
+    message = Frame.wrap(envelope, "message", inner)
+    frame = Frame.wrap({"type": "delta", "seq": 9}, "event", message)
+    batch = Frame.wrap({"type": "deltas", "from": 9, "to": 9}, "deltas", [frame])
+    for codec in (JSON, BINARY):
+        for item in (inner, frame, batch):
+            assert codec.decode(item.encode(codec)) == item.message
+        # 同じコーデックのエンコード結果は使い回す
+        assert batch.encode(codec) is batch.encode(codec)
+
+
+def test_binary_accepts_json_text_frames():
+    message = {"type": "history", "since": 3}
+    assert BINARY.decode(JSON.encode(message).decode("utf-8")) == message
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"\x09",
+        BINARY.encode(chat_record().to_dict())[:-2],
+        BINARY.encode({"type": "player_joined", "player": PLAYER}) + b"\x00",
+    ],
+    ids=["unknown tag", "truncated", "trailing bytes"],
+)
+def test_binary_rejects_broken_frames(data):
+    with pytest.raises(CodecError):
+        BINARY.decode(data)
+
+
+def test_get_codec():
+    assert get_codec(None) is JSON
+    assert get_codec("binary") is BINARY
+    assert get_codec("msgpack") is None
+
+
+class FrameRecorder:
+    """受け取ったフレームをそのまま溜める接続"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    def can_write_directly(self) -> bool:
+        return False
+
+    def enqueue(self, frame: Frame, key=None) -> bool:
+        self.frames.append(frame)
+        return True
+
+
+def test_godview_chat_stays_on_the_binary_schema():
+    async def run():
+        room = GameRoom("codec", spectator_history=0, reconnect_grace=0, verbose=False)
+        speaker = MemoryClient(room, "人狼A", "werewolf")
+        await speaker.connect()
+        firehose, filtered = FrameRecorder(), FrameRecorder()
+        room.spectators.add(firehose, protocol=2)
+        subscription = parse_subscription({"players": speaker.player_id})
+        room.spectators.add(filtered, protocol=2, subscription=subscription)
+
+        await speaker.send_chat("今夜は P3 を襲おう", "werewolf")
+        return speaker.player_id, firehose.frames[-1], filtered.frames[-1]
+
+    player_id, plain, with_prev = asyncio.run(run())
+    assert with_prev.message["prev"] is not None
+    for frame, tag in ((plain, TAG_DELTA), (with_prev, TAG_DELTA_PREV)):
+        data = frame.encode(BINARY)
+        # 発言者付きの channel_message も JSON に戻らない
+        assert data[0] == tag
+        assert data[1 + (8 if tag == TAG_DELTA else 16)] == TAG_CHANNEL_MESSAGE_FROM
+        assert len(data) < len(frame.encode(JSON)) // 2
+        decoded = BINARY.decode(data)
+        assert decoded == frame.message
+        assert decoded["event"]["player_id"] == player_id
@@ -0,0 +1,177 @@
+"""投票の集計とフェーズの進行"""
+
+import asyncio
+
+from server.game import (
+    DAY,
+    ENDED,
+    NIGHT,
+    VOTE,
+    WAITING,
+    Tally,
+    WerewolfGame,
+    winner,
+)
+from server.memory import MemoryClient
+from server.room import GameRoom
+from server.timerwheel import TimerWheel
+
+
+def test_tally_recast_moves_the_vote():
+    tally = Tally()
+    tally.cast("a", "x")
+    tally.cast("b", "x")
+    tally.cast("c", "y")
+    assert tally.leader() == "x"
+    tally.cast("a", "y")
+    tally.cast("a", "y")
+    assert tally.counts == {"x": 1, "y": 2}
+    assert tally.leader() == "y"
+    assert len(tally) == 3
+
+
+def test_tally_tie_has_no_leader():
+    tally = Tally()
+    assert tally.leader() is None
+    tally.cast("a", "x")
+    tally.cast("b", "y")
+    assert tally.leader() is None
+
+
+def test_tally_withdraw_removes_empty_counts():
+    tally = Tally()
+    tally.cast("a", "x")
+    tally.withdraw("a")
+    tally.withdraw("a")
+    assert tally.counts == {}
+    assert len(tally) == 0
+
+
+async def setup(roles, timers=None, durations=None):
+    room = GameRoom("test", spectator_history=0, reconnect_grace=0, verbose=False)
+    game = room.game = WerewolfGame(room, timers, durations)
+    clients = {}
+    for i, role in enumerate(roles):
+        client = MemoryClient(room, f"P{i}", role)
+        await client.connect()
+        clients[client.player_id] = client
+    return room, game, clients
+
+
+def test_winner():
+    async def run():
+        room, _, _ = await setup(["werewolf", "villager", "villager"])
+        assert winner(room.players.values()) is None
+        room.players["P1"].is_alive = False
+        assert winner(room.players.values()) == "werewolves"
+        room.players["P0"].is_alive = False
+        assert winner(room.players.values()) == "villagers"
+
+    asyncio.run(run())
+
+
+def test_start_needs_an_undecided_game():
+    async def run():
+        _, game, _ = await setup(["villager", "villager"])
+        assert await game.start() == "not_enough_players"
+        assert game.phase == WAITING
+
+    asyncio.run(run())
+
+
+def test_phase_cycle_executes_and_attacks():
+    async def run():
+        roles = ["werewolf", "seer", "villager", "villager", "villager"]
+        room, game, clients = await setup(roles)
+        assert await game.start() is None
+        assert (game.phase, game.day) == (DAY, 1)
+
+        await game.advance()
+        assert game.phase == VOTE
+        # 全員が投票したら期限を待たずに締める
+        for player_id in ("P0", "P1", "P2", "P3"):
+            await clients[player_id].send_action("vote", target="P4")
+        assert game.phase == VOTE
+        await clients["P4"].send_action("vote", target="P2")
+        assert game.phase == NIGHT
+        assert not room.players["P4"].is_alive
+
+        await clients["P1"].send_action("divine", target="P0")
+        assert game.phase == NIGHT
+        await clients["P0"].send_action("attack", target="P2")
+        assert (game.phase, game.day) == (DAY, 2)
+        assert not room.players["P2"].is_alive
+        divination = clients["P1"].messages("divination")[-1]
+        assert divination["target"] == "P0" and divination["werewolf"]
+
+        phases = [m["phase"] for m in clients["P3"].messages("phase")]
+        assert phases == [DAY, VOTE, NIGHT, DAY]
+
+    asyncio.run(run())
+
+
+def test_game_ends_when_werewolves_are_outnumbered():
+    async def run():
+        room, game, clients = await setup(["werewolf", "villager", "villager"])
+        await game.start()
+        await game.advance()
+        for player_id in ("P1", "P2"):
+            await clients[player_id].send_action("vote", target="P0")
+        await clients["P0"].send_action("vote", target="P1")
+        assert game.phase == ENDED
+        assert game.result == "villagers"
+        assert clients["P1"].messages("game_over")[-1]["winner"] == "villagers"
+
+    asyncio.run(run())
+
+
+def test_check_action_rejects_wrong_phase_and_targets():
+    async def run():
+        roles = ["werewolf", "werewolf", "villager", "villager", "villager"]
+        _, game, _ = await setup(roles)
+
+        def check(player_id, action, target=None):
+            return game.check_action(player_id, {"action": action, "target": target})
+
+        await game.start()
+        assert check("P2", "vote", "P0") == "wrong_phase"
+        await game.advance()
+        assert check("P2", "vote", "P2") == "invalid_target"
+        assert check("P2", "vote", "nobody") == "invalid_target"
+        assert check("P2", "vote", "P0") is None
+        assert check("P2", "next") == "not_allowed"
+        game.phase = NIGHT
+        assert check("P0", "attack", "P1") == "invalid_target"
+        assert check("P2", "attack", "P3") == "not_allowed"
+
+    asyncio.run(run())
+
+
+def test_deadline_advances_the_phase():
+    async def run():
+        now = [0.0]
+        wheel = TimerWheel(tick=0.1, slots=8, levels=2, clock=lambda: now[0])
+        _, game, _ = await setup(
+            ["werewolf", "villager", "villager"], wheel, {DAY: 1.0, VOTE: 0.5}
+        )
+        await game.start()
+        now[0] = 0.95
+        wheel.advance()
+        await asyncio.sleep(0)
+        assert game.phase == DAY
+        now[0] = 1.05
+        wheel.advance()
+        # 期限でのフェーズ進行は別タスクで走る
+        await asyncio.sleep(0)
+        assert game.phase == VOTE
+        assert game.deadline is not None
+
+        # 期限の前に進めたフェーズのタイマーは何もしない
+        await game.advance()
+        phase = game.phase
+        now[0] = 5.0
+        wheel.advance()
+        await asyncio.sleep(0)
+        assert game.phase == phase
+
+    asyncio.run(run())
@@ -0,0 +1,79 @@
+"""ジャーナルの書き込み・再生と、壊れた末尾の扱い"""
+
+import os
+
+from server.journal import (
+    GameJournal,
+    encode_record,
+    read_segment,
+    replay,
+    segment_paths,
+)
+
+RECORDS = [
+    ("register", {"id": "p1", "name": "占い師", "role": "seer"}),
+    ("chat", {"channel": "public", "player": "占い師", "content": "占いCO"}),
+    ("phase", {"phase": "vote", "day": 1}),
+]
+
+
+def write(directory, records, **options) -> GameJournal:
+    journal = GameJournal(str(directory), fsync=False, flush_interval=0, **options)
+    journal.start()
+    for kind, data in records:
+        journal.append(kind, data)
+    journal.close()
+    return journal
+
+
+def test_replay_returns_records_in_order(tmp_path):
+    journal = write(tmp_path, RECORDS)
+    assert list(replay(str(tmp_path))) == RECORDS
+    assert journal.records_written == len(RECORDS)
+
+
+def test_replay_spans_segments(tmp_path):
+    records = [("chat", {"n": i, "content": "x" * 50}) for i in range(20)]
+    write(tmp_path, records, segment_size=200)
+    assert len(segment_paths(str(tmp_path))) > 1
+    assert list(replay(str(tmp_path))) == records
+
+
+def test_replay_of_missing_directory_is_empty(tmp_path):
+    assert list(replay(str(tmp_path / "missing"))) == []
+
+
+def test_partial_record_is_ignored(tmp_path):
+    write(tmp_path, RECORDS)
+    (path,) = segment_paths(str(tmp_path))
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(encode_record("chat", {"content": "書きかけ"})[:-3])
+
+    records, valid = read_segment(path)
+    assert records == RECORDS
+    assert valid == size
+
+
+def test_crc_mismatch_stops_reading(tmp_path):
+    write(tmp_path, RECORDS)
+    (path,) = segment_paths(str(tmp_path))
+    with open(path, "r+b") as f:
+        # 最後のレコードの本文の末尾を書き換える
+        f.seek(-2, os.SEEK_END)
+        f.write(b"??")
+
+    records, _ = read_segment(path)
+    assert records == RECORDS[:-1]
+
+
+def test_start_truncates_broken_tail_and_appends_after_it(tmp_path):
+    write(tmp_path, RECORDS[:2])
+    (path,) = segment_paths(str(tmp_path))
+    with open(path, "ab") as f:
+        f.write(b"\x10\x00\x00\x00garbage")
+
+    write(tmp_path, RECORDS[2:])
+    assert list(replay(str(tmp_path))) == RECORDS
+    _, valid = read_segment(path)
+    assert valid == os.path.getsize(path)
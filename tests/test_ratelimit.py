@@ -0,0 +1,107 @@
+"""トークンバケットと受信の流量制御"""
+
+import pytest
+
+from server.ratelimit import (
+    CONTENT_TOO_LONG,
+    FRAME_TOO_LARGE,
+    RATE_LIMITED,
+    Admission,
+    IngestLimits,
+    TokenBucket,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills_at_rate():
+    bucket = TokenBucket(rate=2.0, burst=3.0, now=0.0)
+    assert [bucket.take(0.0) for _ in range(4)] == [True, True, True, False]
+    assert bucket.retry_after() == pytest.approx(0.5)
+    assert not bucket.take(0.25)
+    assert bucket.take(0.5)
+    assert not bucket.take(0.5)
+
+
+def test_bucket_never_exceeds_burst():
+    bucket = TokenBucket(rate=10.0, burst=2.0, now=0.0)
+    bucket.take(0.0)
+    # 長く空いても burst までしか溜まらない
+    assert [bucket.take(60.0) for _ in range(3)] == [True, True, False]
+
+
+def test_bucket_retry_after_is_zero_when_available():
+    bucket = TokenBucket(rate=1.0, burst=1.0, now=0.0)
+    assert bucket.retry_after() == 0.0
+    assert bucket.take(0.0, amount=1.0)
+    assert bucket.retry_after(amount=1.0) == pytest.approx(1.0)
+
+
+def test_player_rate_is_per_player():
+    clock = FakeClock()
+    admission = Admission(IngestLimits(player_rate=1.0, player_burst=2.0), clock)
+    assert admission.check_rate("a") is None
+    assert admission.check_rate("a") is None
+    error = admission.check_rate("a")
+    assert error["code"] == RATE_LIMITED
+    assert error["scope"] == "player"
+    assert error["retry_after"] == pytest.approx(1.0)
+    assert admission.check_rate("b") is None
+    clock.now += 1.0
+    assert admission.check_rate("a") is None
+
+
+def test_frame_and_content_limits():
+    admission = Admission(
+        IngestLimits(max_frame_size=100, max_content_length=5), FakeClock()
+    )
+    assert admission.check_frame("a", 100) is None
+    assert admission.check_frame("a", 101)["code"] == FRAME_TOO_LARGE
+    assert admission.check_chat("public", "12345") is None
+    error = admission.check_chat("public", "123456")
+    assert error["code"] == CONTENT_TOO_LONG
+    assert error["channel"] == "public"
+
+
+def test_channel_rate_is_shared_by_players():
+    clock = FakeClock()
+    admission = Admission(IngestLimits(channel_rate=1.0, channel_burst=1.0), clock)
+    assert admission.check_chat("public", "a") is None
+    error = admission.check_chat("public", "b")
+    assert (error["code"], error["scope"], error["request"]) == (
+        RATE_LIMITED,
+        "channel",
+        "chat",
+    )
+    assert admission.check_chat("werewolf", "c") is None
+
+
+def test_zero_disables_limits():
+    admission = Admission(
+        IngestLimits(
+            player_rate=0, channel_rate=0, max_frame_size=0, max_content_length=0
+        ),
+        FakeClock(),
+    )
+    for _ in range(1000):
+        assert admission.check_frame("a", 10**9) is None
+        assert admission.check_chat("public", "x" * 10**5) is None
+    assert admission.players == {} and admission.channels == {}
+
+
+def test_notifies_once_per_run_of_rejections():
+    admission = Admission(IngestLimits(), FakeClock())
+    assert admission.should_notify("a", RATE_LIMITED)
+    assert not admission.should_notify("a", RATE_LIMITED)
+    assert admission.should_notify("a", FRAME_TOO_LARGE)
+    admission.accepted("a")
+    assert admission.should_notify("a", FRAME_TOO_LARGE)
+    admission.check_rate("a")
+    admission.forget("a")
+    assert "a" not in admission.players
@@ -0,0 +1,30 @@
+"""中継の部屋の片付け（観戦者がいなくなった部屋の購読をやめる）"""
+
+import asyncio
+
+from server.relay import SpectatorRelay
+
+# 接続できない上流（購読タスクは再接続を待ち続ける）
+UPSTREAM = "ws://127.0.0.1:9"
+
+
+def test_idle_rooms_are_collected_after_grace():
+    async def run():
+        relay = SpectatorRelay(UPSTREAM, rooms=("main",), room_grace=0.05)
+        main = relay.get_room("main")
+        busy = relay.get_room("busy")
+        busy.clients = 1
+        for room_id in ("a", "b", "c"):
+            relay.room_idle(relay.get_room(room_id))
+        relay.room_idle(main)
+        relay.room_idle(busy)
+
+        # 猶予中に戻ってきた部屋は残る
+        relay.get_room("c").clients = 1
+        await asyncio.sleep(0.2)
+        assert sorted(relay.rooms) == ["busy", "c", "main"]
+
+        for room in relay.rooms.values():
+            await room.close()
+
+    asyncio.run(run())
@@ -0,0 +1,123 @@
+"""部屋のチャットと履歴（不正な入力で状態を壊さない）"""
+
+import asyncio
+
+import pytest
+
+from server.memory import MemoryClient
+from server.records import CHANNELS, ROLES
+from server.room import GameRoom, Player, check_register
+
+
+async def setup():
+    room = GameRoom("test", history_size=5, reconnect_grace=0, verbose=False)
+    client = MemoryClient(room, "A")
+    await client.connect()
+    client.inbox.clear()
+    return room, client
+
+
+def last_error(client: MemoryClient) -> dict:
+    return client.messages("error")[-1]
+
+
+@pytest.mark.parametrize("content", [None, 3, ["占い"], {"text": "x"}])
+def test_non_string_content_is_rejected(content):
+    async def run():
+        room, client = await setup()
+        await room.handle_message(
+            client.player_id, {"type": "chat", "channel": "public", "content": content}
+        )
+        assert last_error(client)["code"] == "invalid_content"
+        assert room.channels["public"].last_seq == 0
+        assert len(room.search) == 0
+
+        await client.send_chat("つづき")
+        assert client.messages("chat")[-1]["seq"] == 1
+
+    asyncio.run(run())
+
+
+def test_unhashable_channel_is_ignored():
+    async def run():
+        room, client = await setup()
+        await room.handle_message(
+            client.player_id, {"type": "chat", "channel": ["public"], "content": "x"}
+        )
+        assert room.channels["public"].last_seq == 0
+
+    asyncio.run(run())
+
+
+def test_index_failure_leaves_history_untouched():
+    async def run():
+        room, client = await setup()
+
+        def fail(*args):
+            raise RuntimeError("index")
+
+        room.search.add = fail
+        with pytest.raises(RuntimeError):
+            await client.send_chat("消える")
+        channel = room.channels["public"]
+        assert (channel.last_seq, len(channel.messages)) == (0, 0)
+        assert client.messages("chat") == []
+
+    asyncio.run(run())
+
+
+
+def test_history_limit_is_clamped_and_validated():
+    async def run():
+        room, client = await setup()
+        for i in range(8):
+            await client.send_chat(f"m{i}")
+        await client.request_history(since=0, limit=1000)
+        history = client.messages("history")[-1]
+        assert [m["seq"] for m in history["messages"]] == [4, 5, 6, 7, 8]
+        assert history["truncated"]
+
+        for bad in ({"since": -1}, {"since": "3"}, {"limit": True}, {"limit": 1.5}):
+            await room.handle_message(
+                client.player_id, {"type": "history", "channel": "public", **bad}
+            )
+            assert last_error(client)["code"] == "invalid_history"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "player_id, role",
+    [("A", "wizard"), ("A", ["werewolf"]), ("A", None), (["A"], "villager")],
+)
+def test_invalid_register_is_rejected(player_id, role):
+    size = len(ROLES)
+    error = check_register(player_id, "A", role)
+    assert error["code"] == "invalid_register"
+    assert check_register("A", "A", "seer") is None
+    with pytest.raises(ValueError):
+        Player("A", "A", "wizard")
+    assert len(ROLES) == size
+
+
+def test_dynamic_channel_ids_are_released_on_close():
+    async def run():
+        size = len(CHANNELS)
+        room, client = await setup()
+        room.create_channel("night-1", player_ids=[client.player_id])
+        room.create_channel("night-2")
+        room.remove_channel("night-2")
+        assert len(CHANNELS) == size + 2
+
+        await room.close()
+        assert len(CHANNELS) == size
+        assert "public" in CHANNELS.ids
+
+        # 解放した ID は次の動的チャンネルで使い回す
+        other = GameRoom("other", verbose=False)
+        channel = other.create_channel("night-3")
+        assert channel.id < size + 2
+        await other.close()
+        assert len(CHANNELS) == size
+
+    asyncio.run(run())
@@ -0,0 +1,126 @@
+"""発言の検索（n-gram 索引・1文字の索引・条件の組み合わせ）"""
+
+import pytest
+
+from server.records import CHANNELS, ROLES, ChatMessage
+from server.search import MAX_RESULTS, ChatIndex, ngrams, normalize, parse_query
+
+PUBLIC = CHANNELS.id("public")
+WEREWOLF = CHANNELS.id("werewolf")
+
+LINES = [
+    # (チャンネル, 発言者, 本文, フェーズ, 日)
+    (PUBLIC, "Alice", "占い師COします", "day", 1),
+    (PUBLIC, "Bob", "ＡＢＣ は怪しい", "day", 1),
+    (WEREWOLF, "Carol", "今夜は占い師を襲おう", "night", 1),
+    (PUBLIC, "Alice", "結果は人狼でした", "day", 2),
+    (PUBLIC, "Bob", "狼", "vote", 2),
+]
+
+
+def build(n: int = 2) -> ChatIndex:
+    index = ChatIndex(n)
+    seqs = {}
+    for channel_id, player, content, phase, day in LINES:
+        seqs[channel_id] = seqs.get(channel_id, 0) + 1
+        record = ChatMessage(
+            channel_id, player, ROLES.id("villager"), content, seqs[channel_id]
+        )
+        index.add(record, phase, day)
+    return index
+
+
+def contents(index: ChatIndex, docs):
+    return [index.records[doc].content for doc in docs]
+
+
+def test_ngrams():
+    assert ngrams("人狼です") == {"人狼", "狼で", "です"}
+    assert ngrams("狼") == set()
+    assert normalize("ＡＢＣ") == "abc"
+
+
+def test_substring_search_is_normalized():
+    index = build()
+    docs, truncated = index.search(text="占い師")
+    assert contents(index, docs) == ["占い師COします", "今夜は占い師を襲おう"]
+    assert not truncated
+    assert contents(index, index.search(text="abc")[0]) == ["ＡＢＣ は怪しい"]
+    assert contents(index, index.search(text="co")[0]) == ["占い師COします"]
+
+
+def test_ngram_hits_must_be_contiguous():
+    index = build()
+    # 「占い」「師を」はどちらもあるが「占い師を」は1件だけ
+    docs, _ = index.search(text="占い師を")
+    assert contents(index, docs) == ["今夜は占い師を襲おう"]
+    assert index.search(text="師C占")[0] == []
+
+
+@pytest.mark.parametrize("n", [2, 3])
+def test_short_queries_use_the_character_index(n):
+    index = build(n)
+    assert contents(index, index.search(text="狼")[0]) == ["結果は人狼でした", "狼"]
+    assert index.search(text="霧")[0] == []
+    assert contents(index, index.search(text="人狼")[0]) == ["結果は人狼でした"]
+    assert index.stats()["chars"] > 0
+
+
+def test_filters_combine():
+    index = build()
+    docs, _ = index.search(player="Alice", day=2)
+    assert contents(index, docs) == ["結果は人狼でした"]
+    assert contents(index, index.search(text="占い", phase="night")[0]) == [
+        "今夜は占い師を襲おう"
+    ]
+    assert index.search(player="Nobody")[0] == []
+
+
+def test_channels_and_seq_range():
+    index = build()
+    docs, _ = index.search(channels=[PUBLIC], since=1, until=3)
+    assert contents(index, docs) == ["ＡＢＣ は怪しい", "結果は人狼でした"]
+    docs, _ = index.search(channels=[PUBLIC, WEREWOLF], since=1)
+    assert len(docs) == 3
+    assert index.search(channels=[])[0] == []
+
+
+def test_limit_returns_newest_and_truncated():
+    index = build()
+    docs, truncated = index.search(limit=2)
+    assert contents(index, docs) == ["結果は人狼でした", "狼"]
+    assert truncated
+
+
+def test_to_dict_adds_phase_and_day():
+    index = build()
+    (doc,) = index.search(text="襲おう")[0]
+    message = index.to_dict(doc)
+    assert (message["phase"], message["day"], message["channel"]) == (
+        "night",
+        1,
+        "werewolf",
+    )
+
+
+def test_parse_query_defaults_and_channels():
+    options = parse_query({"type": "query", "text": "占い", "channel": "public"})
+    assert options["channels"] == ["public"]
+    assert options["limit"] == 50
+    assert parse_query({})["channels"] is None
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        {"limit": 0},
+        {"limit": MAX_RESULTS + 1},
+        {"limit": True},
+        {"day": "2"},
+        {"text": 3},
+        {"channel": ["public", 1]},
+    ],
+)
+def test_parse_query_rejects_invalid(message):
+    with pytest.raises(ValueError):
+        parse_query(message)
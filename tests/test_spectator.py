@@ -0,0 +1,161 @@
+"""観戦者の購読条件（判定・パース・ハブでの配信）"""
+
+import pytest
+
+from server.frames import Frame
+from server.memory import MemoryConnection
+from server.outbound import COALESCE, Connection
+from server.spectator import (
+    SpectatorHub,
+    SubscriptionFilter,
+    event_attrs,
+    handshake_subscription,
+    parse_subscription,
+)
+
+WOLF_CHAT = {
+    "type": "channel_message",
+    "channel": "werewolf",
+    "message": {"type": "chat", "content": "襲おう"},
+    "player_id": "p1",
+}
+VOTE = {"type": "action", "player_id": "p2", "action": {"action": "vote"}}
+JOINED = {"type": "player_joined", "player": {"id": "p3", "name": "C"}}
+PHASE = {"type": "phase", "phase": "night", "day": 1}
+
+
+def attrs(event: dict):
+    return event_attrs(Frame(event))
+
+
+def test_event_attrs():
+    assert attrs(WOLF_CHAT) == ("channel_message", "werewolf", "p1")
+    assert attrs(JOINED) == ("player_joined", None, "p3")
+    assert attrs(PHASE) == ("phase", None, None)
+
+
+def test_empty_filter_matches_everything():
+    subscription = SubscriptionFilter()
+    for event in (WOLF_CHAT, VOTE, JOINED, PHASE):
+        assert subscription.matches(*attrs(event))
+
+
+def test_types_filter():
+    subscription = SubscriptionFilter(types=["action"])
+    assert subscription.matches(*attrs(VOTE))
+    assert not subscription.matches(*attrs(WOLF_CHAT))
+    assert not subscription.matches(*attrs(PHASE))
+
+
+def test_channel_and_player_filters_keep_events_without_them():
+    by_channel = SubscriptionFilter(channels=["public"])
+    assert not by_channel.matches(*attrs(WOLF_CHAT))
+    assert by_channel.matches(*attrs(PHASE))
+
+    by_player = SubscriptionFilter(players=["p1"])
+    assert by_player.matches(*attrs(WOLF_CHAT))
+    assert not by_player.matches(*attrs(VOTE))
+    assert by_player.matches(*attrs(PHASE))
+
+
+def test_parse_subscription():
+    assert parse_subscription(None) is None
+    assert parse_subscription({}) is None
+    subscription = parse_subscription({"channels": "werewolf", "types": ["a", "b"]})
+    assert subscription.to_dict() == {
+        "channels": ["werewolf"],
+        "types": ["a", "b"],
+        "players": None,
+    }
+    # 同じ条件は同じキーになる（観戦者をまとめる）
+    assert subscription.key == parse_subscription(
+        {"types": ["b", "a"], "channels": ["werewolf"]}
+    ).key
+
+
+@pytest.mark.parametrize(
+    "spec", ["werewolf", ["werewolf"], {"channels": 1}, {"types": ["a", None]}]
+)
+def test_parse_subscription_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_subscription(spec)
+
+
+def test_handshake_requires_protocol_2():
+    spec = {"types": "action"}
+    assert handshake_subscription({"protocol": 2, "subscribe": spec}).types == {
+        "action"
+    }
+    assert handshake_subscription({"protocol": 1}) is None
+    for handshake in ({"subscribe": spec}, {"protocol": "2", "subscribe": spec}):
+        with pytest.raises(ValueError, match="protocol 2"):
+            handshake_subscription(handshake)
+
+
+def make_hub():
+    return SpectatorHub(lambda: {"players": {}, "channels": {}}, history=100)
+
+
+def test_hub_delivers_only_matching_events_with_prev():
+    hub = make_hub()
+    everything = MemoryConnection("all")
+    actions = MemoryConnection("actions")
+    hub.add(everything, protocol=2)
+    hub.add(actions, protocol=2, subscription=SubscriptionFilter(types=["action"]))
+
+    for event in (WOLF_CHAT, VOTE, PHASE, VOTE):
+        hub.publish(event)
+
+    assert [m["type"] for m in everything.inbox] == ["snapshot"] + ["delta"] * 4
+    deltas = [m for m in actions.inbox if m["type"] == "delta"]
+    assert actions.inbox[0]["subscription"]["types"] == ["action"]
+    assert [(m["seq"], m["prev"]) for m in deltas] == [(2, 0), (4, 2)]
+
+
+def test_hub_groups_identical_subscriptions_and_resubscribes():
+    hub = make_hub()
+    a, b = MemoryConnection("a"), MemoryConnection("b")
+    for connection in (a, b):
+        subscription = parse_subscription({"players": "p2"})
+        hub.add(connection, protocol=2, subscription=subscription)
+    assert len(hub.groups) == 1
+
+    assert hub.subscribe(a, {"types": "phase"}) is None
+    assert len(hub.groups) == 2
+    a.inbox.clear()
+    hub.publish(PHASE)
+    assert [m["event"]["type"] for m in a.inbox] == ["phase"]
+    assert hub.subscribe(a, {"types": 1})["code"] == "invalid_subscription"
+
+
+def test_hub_rejects_subscription_on_legacy_protocol():
+    hub = make_hub()
+    legacy = MemoryConnection("legacy")
+    with pytest.raises(ValueError):
+        hub.add(legacy, protocol=1, subscription=SubscriptionFilter(types=["action"]))
+    hub.add(legacy, protocol=1)
+    assert hub.subscribe(legacy, {"types": "action"})["code"] == "invalid_subscription"
+
+
+def test_coalesce_replaces_only_unsequenced_events():
+    hub = SpectatorHub(lambda: {}, lambda: {"type": "init"}, history=100)
+    # 書き込みできないソケット（全てキューに積まれる）
+    legacy = Connection(object(), policy=COALESCE)
+    current = Connection(object(), policy=COALESCE)
+    hub.add(legacy)
+    hub.add(current, protocol=2)
+    legacy.queue.clear()
+    current.queue.clear()
+
+    for is_alive in (True, False):
+        hub.publish(
+            {"type": "player_updated", "player": {"id": "p1", "is_alive": is_alive}},
+            key="player:p1",
+        )
+
+    assert legacy.coalesced == 1
+    assert len(legacy.queue) == 1
+    assert legacy._pop().message["player"]["is_alive"] is False
+    # 通し番号付きの差分は置き換えない
+    assert current.coalesced == 0
+    assert len(current.queue) == 2
@@ -0,0 +1,113 @@
+"""タイマーホイールの期限・取り消し・上位レベルからのカスケード"""
+
+import asyncio
+
+import pytest
+
+from server.timerwheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_wheel(**options):
+    clock = FakeClock()
+    return TimerWheel(tick=0.1, slots=4, levels=3, clock=clock, **options), clock
+
+
+def run_until(wheel, clock, seconds: float):
+    """seconds まで 0.1 秒ずつ時計を進める"""
+    while clock.now < seconds - 1e-9:
+        clock.now = round(clock.now + 0.1, 1)
+        wheel.advance()
+
+
+def test_slots_must_be_power_of_two():
+    with pytest.raises(ValueError):
+        TimerWheel(slots=6)
+
+
+def test_fires_at_deadline_not_before():
+    wheel, clock = make_wheel()
+    fired = []
+    wheel.schedule(0.35, lambda: fired.append(clock.now))
+    run_until(wheel, clock, 0.3)
+    assert fired == []
+    run_until(wheel, clock, 0.4)
+    assert fired == [0.4]
+    assert len(wheel) == 0
+
+
+@pytest.mark.parametrize("delay", [0.5, 1.7, 3.3, 6.3, 9.0])
+def test_cascades_from_upper_levels(delay):
+    # slots=4, levels=3: レベル 0 は 0.4 秒、レベル 1 は 1.6 秒、レベル 2 は 6.4 秒先まで
+    wheel, clock = make_wheel()
+    fired = []
+    wheel.schedule(delay, lambda: fired.append(clock.now))
+    run_until(wheel, clock, delay + 0.5)
+    assert fired == [pytest.approx(delay, abs=0.1 + 1e-9)]
+    assert fired[0] >= delay - 1e-9
+
+
+def test_many_timers_fire_in_deadline_order():
+    wheel, clock = make_wheel()
+    fired = []
+    delays = [2.3, 0.1, 5.0, 0.9, 1.6, 7.7, 0.4]
+    for delay in delays:
+        wheel.schedule(delay, fired.append, delay)
+    run_until(wheel, clock, 8.0)
+    assert fired == sorted(delays)
+
+
+def test_cancelled_timer_does_not_fire():
+    wheel, clock = make_wheel()
+    fired = []
+    timer = wheel.schedule(2.0, fired.append, "cancelled")
+    wheel.schedule(2.0, fired.append, "kept")
+    assert len(wheel) == 2
+    timer.cancel()
+    timer.cancel()
+    assert len(wheel) == 1
+    run_until(wheel, clock, 3.0)
+    assert fired == ["kept"]
+    assert len(wheel) == 0
+
+
+def test_advance_catches_up_after_a_stall():
+    wheel, clock = make_wheel()
+    fired = []
+    for delay in (0.2, 1.0, 4.0):
+        wheel.schedule(delay, fired.append, delay)
+    clock.now = 5.0
+    assert wheel.advance() == 3
+    assert fired == [0.2, 1.0, 4.0]
+
+
+def test_failing_callback_does_not_stop_others(capsys):
+    wheel, clock = make_wheel()
+    fired = []
+    wheel.schedule(0.1, lambda: 1 / 0)
+    wheel.schedule(0.1, fired.append, "same")
+    wheel.schedule(0.3, fired.append, "later")
+    run_until(wheel, clock, 0.5)
+    assert fired == ["same", "later"]
+    assert len(wheel) == 0
+    assert "ZeroDivisionError" in capsys.readouterr().out
+
+
+def test_run_keeps_ticking_after_a_failure():
+    async def run():
+        wheel = TimerWheel(tick=0.01)
+        fired = asyncio.Event()
+        wheel.schedule(0.01, lambda: 1 / 0)
+        wheel.schedule(0.03, fired.set)
+        wheel.start()
+        await asyncio.wait_for(fired.wait(), 1)
+        await wheel.close()
+
+    asyncio.run(run())